@@ -0,0 +1,48 @@
+"""
+Benchmark do protocolo de sessão no ESP32: handshake, bytes por pacote DATA,
+tempo de cifragem/decifragem e heap por pacote.
+Uso: mpremote run bench_security.py
+"""
+import gc
+import utime as time
+from config import NetworkConfig
+from security import SecurityManager
+
+MESSAGES = ["PING", "MOVIMENTO_DETECTADO", "WASTE_TYPE:4:PLASTICO"]
+ITERATIONS = 100
+
+def handshake(initiator, responder):
+    _, ack, _ = responder.open(initiator.hello("responder"), "initiator")
+    _, confirm, _ = initiator.open(ack, "responder")
+    responder.open(confirm, "initiator")  # O respondedor só envia depois do 1º DATA
+
+def measure(sender, receiver, message):
+    # Heap alocado por um par cifragem + decifragem (coleta desligada durante a medição)
+    gc.collect()
+    gc.disable()
+    free = gc.mem_free()
+    receiver.open(sender.seal(message, "responder"), "initiator")
+    allocated = free - gc.mem_free()
+    gc.enable()
+
+    start = time.ticks_us()
+    packets = [sender.seal(message, "responder") for _ in range(ITERATIONS)]
+    encode = time.ticks_diff(time.ticks_us(), start) / ITERATIONS
+
+    start = time.ticks_us()
+    for packet in packets:
+        receiver.open(packet, "initiator")
+    decode = time.ticks_diff(time.ticks_us(), start) / ITERATIONS
+    return len(packets[0]), encode, decode, allocated
+
+initiator = SecurityManager(NetworkConfig.AUTH_KEY, NetworkConfig.REPLAY_WINDOW)
+responder = SecurityManager(NetworkConfig.AUTH_KEY, NetworkConfig.REPLAY_WINDOW)
+start = time.ticks_us()
+for _ in range(10):
+    handshake(initiator, responder)
+print("handshake: {:.0f} us".format(time.ticks_diff(time.ticks_us(), start) / 10))
+
+for message in MESSAGES:
+    size, encode, decode, allocated = measure(initiator, responder, message)
+    print("{:<22} {:>4} B  cifra {:>7.0f} us  decifra {:>7.0f} us  heap {:>5} B".format(
+        message, size, encode, decode, allocated))
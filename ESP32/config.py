@@ -13,8 +13,26 @@ class NetworkConfig:
 
     # --- Segurança ---
     AUTH_KEY = "TR4SH_4I_S3CUR3_K3Y_2024_M4K3DC_D3C0747387"
-    TOKEN_TIMEOUT = 30  # segundos
     AUTH_TIMEOUT = 5  # Adicionado
+    REPLAY_WINDOW = 64        # Contadores fora de ordem aceitos por sessão (anti-replay)
+    HANDSHAKE_RETRY = 1.0     # Reenvia o HELLO se a sessão não abrir nesse tempo (s)
+    PENDING_MESSAGES = 16     # Mensagens por destino aguardando o handshake
+
+    # --- Entrega confiável (MOVIMENTO_DETECTADO) ---
+    RELIABLE_WINDOW = 4           # Mensagens sem ack por par; as demais aguardam vaga
+    RELIABLE_MAX_RETRIES = 6      # Retransmissões antes de desistir (e redescobrir o PC)
+    RELIABLE_INITIAL_RTO_MS = 250 # RTO antes da primeira medida de RTT
+    RELIABLE_MIN_RTO_MS = 30
+    RELIABLE_MAX_RTO_MS = 1000
+    RELIABLE_DEDUP_SIZE = 32      # IDs recentes lembrados por par (>= RELIABLE_WINDOW do PC)
+    TRIGGER_DEADLINE_MS = 8000    # MOVIMENTO_DETECTADO não é mais retransmitido depois disso (= PipelineConfig.TRIGGER_DEADLINE do PC)
+
+    # --- Descoberta (anúncio/resposta, ver PC/discovery.py) ---
+    PEER_CACHE_PATH = "peers.json"        # Último IP do PC, na flash (gravado só quando muda)
+    DISCOVERY_CACHE_TIMEOUT_MS = 500      # Espera pelo PC do cache antes do broadcast
+    DISCOVERY_FAST_MS = 500               # Primeiro intervalo entre PINGs em broadcast; dobra a cada um
+    ANNOUNCE_INTERVAL_MS = 30000          # PING ao PC pareado (e teto do intervalo em broadcast)
+    PC_LOST_AFTER = 3                     # Anúncios sem resposta até redescobrir o PC
 
 class IRSensorConfig:
     PIN: int = 34               # Pino do sensor IR
@@ -0,0 +1,45 @@
+import os
+import ujson
+import ubinascii
+import machine
+
+# -------- Descoberta (mesmo protocolo do PC, ver PC/discovery.py) --------
+# ESP32 -> "PING:<id>"        anúncio/sonda; o PC responde "PC_ONLINE"
+# PC    -> "PC_ONLINE"        anúncio do PC; respondemos "ESP_ONLINE:<id>"
+# O <id> vem do hardware, então o PC nos reconhece mesmo depois de o DHCP trocar o IP.
+
+def device_id():
+    return ubinascii.hexlify(machine.unique_id()).decode()
+
+class PeerCache:
+    """Último endereço de cada par (nome -> IP) na flash; só grava quando algo muda"""
+
+    def __init__(self, path):
+        self.path = path
+        self.peers = {}
+        try:
+            with open(path) as f:
+                self.peers = ujson.load(f)
+        except (OSError, ValueError):
+            pass  # Primeiro boot ou arquivo corrompido: começa vazio
+
+    def get(self, name):
+        return self.peers.get(name)
+
+    def set(self, name, ip):
+        if self.peers.get(name) == ip:
+            return False
+        self.peers[name] = ip
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                ujson.dump(self.peers, f)
+            try:
+                os.rename(tmp_path, self.path)
+            except OSError:
+                # FAT não substitui no rename; o LittleFS sim
+                os.remove(self.path)
+                os.rename(tmp_path, self.path)
+        except OSError as e:
+            print("Erro ao gravar o cache de pares:", e)
+        return True
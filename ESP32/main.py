@@ -6,6 +6,8 @@ from ir_sensor import IRSensor
 from udp_communicator import UDPCommunicator
 from servo_control import ServoController
 from wlan_manager import WlanManager
+from discovery import PeerCache, device_id
+from config import NetworkConfig
 
 logger = get_logger("ESP32_SYSTEM")
 
@@ -14,9 +16,19 @@ class ESP32System:
         self.send_cooldown = 2
         self.last_sent = 0
         self.pc_ip: Optional[str] = None
+        self.pc_status = None  # WARMING_UP / READY / FAILED, informado pelo PC
         self.discovery_success = False
         self.running = False
 
+        # --- Descoberta: ID estável, IP do PC em cache na flash ---
+        self.device_id = device_id()
+        self.peers = PeerCache(NetworkConfig.PEER_CACHE_PATH)
+        self.paired = asyncio.Event()
+        self.rediscover = asyncio.Event()
+        self.rediscover_reason = "boot"
+        self.pc_seen = 0        # ticks_ms da última mensagem do PC
+        self.time_to_pair_ms = None
+
         # --- Inicializa Wi-Fi ---
         self.wifi = WlanManager()
         if not self.wifi.connect():
@@ -26,6 +38,7 @@ class ESP32System:
         # --- Inicializa hardware ---
         self.sensor = IRSensor(callback=self.on_movement_async)
         self.udp = UDPCommunicator()
+        self.udp.on_delivery_failure = self.on_delivery_failure
         self.servo = ServoController()
 
         self.running = True
@@ -39,26 +52,70 @@ class ESP32System:
         self.last_sent = now
 
         if self.pc_ip:
-            try:
-                await self.udp.send_message_async("MOVIMENTO_DETECTADO", ip=self.pc_ip)
-            except Exception:
-                await self.discover_pc_async()
+            # O item só fica na frente da lixeira por um tempo: um gatilho atrasado não serve
+            deadline = time.ticks_add(time.ticks_ms(), NetworkConfig.TRIGGER_DEADLINE_MS)
+            await self.udp.send_message_async("MOVIMENTO_DETECTADO", ip=self.pc_ip, reliable=True,
+                                              deadline=deadline)
         else:
-            await self.discover_pc_async()
+            logger.warning("Movimento detectado sem PC pareado")
 
-    async def discover_pc_async(self):
-        """Descoberta assíncrona de PCs na rede"""
-        network_prefix = self.wifi.get_network_prefix()
-        if not network_prefix:
-            return
+    def on_delivery_failure(self, message, ip):
+        """O PC não confirmou após todas as retransmissões: procura-o de novo"""
+        if ip == self.pc_ip:
+            self.request_rediscovery(f"PC {ip} não confirmou {message}")
 
-        logger.info("Descobrindo PC na rede...")
-        for suffix in [255, 100, 1, 2, 50]:
-            try:
-                await self.udp.send_message_async("PING", ip=f"{network_prefix}.{suffix}")
-            except Exception:
+    def request_rediscovery(self, reason):
+        self.pc_ip = None
+        self.discovery_success = False
+        self.rediscover_reason = reason
+        self.rediscover.set()
+
+    async def send_ping(self, ip="255.255.255.255"):
+        await self.udp.send_message_async("PING:" + self.device_id, ip=ip)
+
+    async def _wait_event(self, event, timeout_ms):
+        try:
+            await asyncio.wait_for_ms(event.wait(), timeout_ms)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def discover_pc_async(self, reason):
+        """Procura o PC: unicast ao IP do cache, depois PING em broadcast com intervalo dobrando"""
+        started = time.ticks_ms()
+        self.paired.clear()
+        logger.info(f"Descobrindo PC ({reason})...")
+        cached = self.peers.get("pc")
+        if cached:
+            await self.send_ping(cached)
+            await self._wait_event(self.paired, NetworkConfig.DISCOVERY_CACHE_TIMEOUT_MS)
+
+        delay = NetworkConfig.DISCOVERY_FAST_MS
+        while self.running and not self.paired.is_set():
+            await self.send_ping()
+            await self._wait_event(self.paired, delay)
+            delay = min(delay * 2, NetworkConfig.ANNOUNCE_INTERVAL_MS)
+
+        if self.paired.is_set():
+            self.time_to_pair_ms = time.ticks_diff(time.ticks_ms(), started)
+            logger.info(f"PC {self.pc_ip} pareado em {self.time_to_pair_ms} ms ({reason})")
+
+    async def discovery_loop(self):
+        """Pareia no boot e quando pedido; pareado, anuncia-se ao PC em baixa taxa"""
+        while self.running:
+            if self.pc_ip is None:
+                self.rediscover.clear()
+                await self.discover_pc_async(self.rediscover_reason)
                 continue
-            await asyncio.sleep(0.05)  # pequena pausa entre envios
+
+            if await self._wait_event(self.rediscover, NetworkConfig.ANNOUNCE_INTERVAL_MS):
+                self.rediscover.clear()
+                continue  # request_rediscovery já limpou o pc_ip
+            silent = time.ticks_diff(time.ticks_ms(), self.pc_seen)
+            if silent > NetworkConfig.PC_LOST_AFTER * NetworkConfig.ANNOUNCE_INTERVAL_MS:
+                self.request_rediscovery(f"PC {self.pc_ip} sem resposta há {silent // 1000} s")
+            else:
+                await self.send_ping(self.pc_ip)
 
     async def handle_udp_messages(self):
         """Task principal para processar mensagens recebidas"""
@@ -75,15 +132,28 @@ class ESP32System:
     async def process_message(self, msg, addr):
         """Processa mensagens recebidas do UDP"""
         ip_addr = addr[0] if isinstance(addr, tuple) else addr
+        if ip_addr == self.pc_ip:
+            self.pc_seen = time.ticks_ms()
 
         if msg == "PC_ONLINE":
-            self.pc_ip = ip_addr
-            self.discovery_success = True
-            logger.info(f"PC {self.pc_ip} conectado")
+            # Já pareados, é um anúncio (o PC reiniciou ou mudou de IP): ele precisa do nosso ID
+            announced = self.paired.is_set()
+            if self.pc_ip != ip_addr:
+                self.pc_ip = ip_addr
+                self.discovery_success = True
+                logger.info(f"PC {self.pc_ip} conectado")
+                if self.peers.set("pc", ip_addr):
+                    logger.info(f"IP do PC gravado no cache: {ip_addr}")
+            self.pc_seen = time.ticks_ms()
+            self.paired.set()
+            if announced:
+                await self.udp.send_message_async("ESP_ONLINE:" + self.device_id, ip=ip_addr)
         elif msg == "PC_OFFLINE":
-            self.pc_ip = None
-            self.discovery_success = False
             logger.info("PC desconectado")
+            self.request_rediscovery("PC desligou")
+        elif msg.startswith("PC_STATUS:"):
+            self.pc_status = msg[10:]
+            logger.info(f"Status do PC: {self.pc_status}")
         elif msg.startswith("WASTE_TYPE:"):
             try:
                 parts = msg.split(":")
@@ -102,10 +172,15 @@ class ESP32System:
         await self.udp.start()
         # Cria task do listener UDP
         udp_task = asyncio.create_task(self.handle_udp_messages())
+        discovery_task = asyncio.create_task(self.discovery_loop())
 
         while self.running:
             await asyncio.sleep(1)  # loop principal leve, sem bloquear
+            if self.wifi.refresh_ip():
+                # Nova concessão do DHCP: o PC precisa do novo endereço
+                self.request_rediscovery(f"IP mudou para {self.wifi.get_ip()}")
 
+        discovery_task.cancel()
         udp_task.cancel()
 
     def stop(self):
@@ -0,0 +1,151 @@
+import os
+import utime as time
+
+# -------- Entrega confirmada (mesmo formato do PC, ver PC/reliability.py) --------
+# "@R:<id>:<mensagem>" é confirmada com "@A:<id>", ambos dentro do pacote cifrado.
+# RTO por par segundo a RFC 6298 (SRTT + 4*RTTVAR), com backoff exponencial. A janela
+# limita a distância entre o ID mais antigo sem ack e o próximo: o receptor só precisa
+# lembrar os últimos `window` IDs de cada par para descartar duplicatas.
+# Uma mensagem com prazo (`expires_at`, ticks_ms) é abandonada quando ele vence, sem contar
+# como falha: o PC mede a idade de um MOVIMENTO_DETECTADO pela chegada, então só daqui
+# dá para não entregar um gatilho que já passou do prazo.
+RELIABLE_PREFIX = "@R:"
+ACK_PREFIX = "@A:"
+
+class RttEstimator:
+    def __init__(self, initial_rto_ms, min_rto_ms, max_rto_ms):
+        self.srtt = None
+        self.rttvar = 0
+        self.rto = initial_rto_ms
+        self.min_rto = min_rto_ms
+        self.max_rto = max_rto_ms
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = int(min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar)))
+
+class ReliableSender:
+    """Sem E/S própria: `send_wire(texto, par)` envia pela sessão"""
+
+    def __init__(self, send_wire, window, max_retries, initial_rto_ms, min_rto_ms, max_rto_ms, on_failure=None):
+        self.send_wire = send_wire
+        self.window = window
+        self.max_retries = max_retries
+        self.rto_limits = (initial_rto_ms, min_rto_ms, max_rto_ms)
+        self.on_failure = on_failure
+        self.next_id = {}
+        self.in_flight = {}  # par -> {id: [mensagem, 1º envio, prazo, rto, tentativas, amostrar, expira]}
+        self.backlog = {}    # par -> [(mensagem, expira) aguardando vaga na janela]
+        self.rtt = {}
+        self.retransmissions = 0
+        self.failed = 0
+        self.expired = 0
+
+    def _estimator(self, peer):
+        if peer not in self.rtt:
+            self.rtt[peer] = RttEstimator(*self.rto_limits)
+        return self.rtt[peer]
+
+    def send(self, message, peer, has_session=True, expires_at=None):
+        self.in_flight.setdefault(peer, {})
+        if not self._has_room(peer):
+            self.backlog.setdefault(peer, []).append((message, expires_at))
+            return
+        self.send_wire(self._start(message, peer, has_session, expires_at), peer)
+
+    def _has_room(self, peer):
+        flight = self.in_flight[peer]
+        if not flight:
+            return True
+        next_id = self.next_id[peer]
+        # Distância (com a volta em 2^31) até o ID em voo mais antigo
+        return max((next_id - message_id) & 0x7FFFFFFF for message_id in flight) < self.window
+
+    def _start(self, message, peer, has_session, expires_at=None):
+        if peer not in self.next_id:
+            # Início aleatório: após um reinício os IDs não colidem com os já vistos pelo PC
+            self.next_id[peer] = int.from_bytes(os.urandom(4), "big") & 0x7FFFFFFF
+        message_id = self.next_id[peer]
+        self.next_id[peer] = (message_id + 1) & 0x7FFFFFFF
+        now = time.ticks_ms()
+        rto = self._estimator(peer).rto
+        self.in_flight[peer][message_id] = [message, now, time.ticks_add(now, rto), rto, 0, has_session, expires_at]
+        return RELIABLE_PREFIX + str(message_id) + ":" + message
+
+    def on_ack(self, message_id, peer):
+        entry = self.in_flight.get(peer, {}).pop(message_id, None)
+        if entry is None:
+            return
+        if entry[4] == 0 and entry[5]:  # Karn: sem amostra de mensagens retransmitidas
+            self._estimator(peer).sample(time.ticks_diff(time.ticks_ms(), entry[1]))
+        self._refill(peer)
+
+    def _refill(self, peer):
+        backlog = self.backlog.get(peer)
+        now = time.ticks_ms()
+        while backlog and self._has_room(peer):
+            message, expires_at = backlog.pop(0)
+            if expires_at is not None and time.ticks_diff(expires_at, now) <= 0:
+                self.expired += 1
+                continue
+            self.send_wire(self._start(message, peer, True, expires_at), peer)
+
+    def next_delay_ms(self):
+        """ms até o próximo prazo (retransmissão ou expiração), ou None sem mensagens em voo"""
+        now = time.ticks_ms()
+        delay = None
+        for flight in self.in_flight.values():
+            for entry in flight.values():
+                remaining = time.ticks_diff(entry[2], now)
+                if entry[6] is not None:
+                    remaining = min(remaining, time.ticks_diff(entry[6], now))
+                if delay is None or remaining < delay:
+                    delay = remaining
+        return None if delay is None else max(0, delay)
+
+    def retransmit_due(self):
+        now = time.ticks_ms()
+        for peer, flight in self.in_flight.items():
+            freed = False
+            for message_id in list(flight):
+                entry = flight[message_id]
+                if entry[6] is not None and time.ticks_diff(entry[6], now) <= 0:
+                    del flight[message_id]
+                    self.expired += 1
+                    freed = True
+                    continue
+                if time.ticks_diff(entry[2], now) > 0:
+                    continue
+                if entry[4] >= self.max_retries:
+                    del flight[message_id]
+                    self.failed += 1
+                    freed = True
+                    if self.on_failure is not None:
+                        self.on_failure(entry[0], peer)
+                    continue
+                entry[4] += 1
+                entry[3] = min(self.rto_limits[2], entry[3] * 2)
+                entry[2] = time.ticks_add(now, entry[3])
+                self.retransmissions += 1
+                self.send_wire(RELIABLE_PREFIX + str(message_id) + ":" + entry[0], peer)
+            if freed:
+                self._refill(peer)
+
+class DuplicateFilter:
+    """IDs confiáveis já entregues, os `size` mais recentes por par"""
+
+    def __init__(self, size=32):
+        self.size = size
+        self.seen = {}  # par -> [ids], mais antigo primeiro
+
+    def is_new(self, message_id, peer):
+        seen = self.seen.setdefault(peer, [])
+        if message_id in seen:
+            return False
+        seen.append(message_id)
+        del seen[:-self.size]
+        return True
@@ -1,63 +1,251 @@
-import ujson as json
+import os
+import ustruct as struct
 import utime as time
-import ubinascii
 import ucryptolib
 import hmac
 import hashlib
 
+# -------- Sessões (mesmo protocolo do PC, ver PC/security.py) --------
+# HELLO     | magic | versão | 1 | nonce_i 16 | época 8 | contador 4 | tag 16 |
+# HELLO_ACK | magic | versão | 2 | nonce_i 16 | nonce_r 16 | tag 16 |
+# DATA      | magic | versão | 3 | sessão 4 | contador 4 | AES-CBC 16*n | tag 16 |
+# O IV de cada DATA é AES-ECB(chave, sessão || contador): único por pacote e sem relógio.
+# Um HELLO da mesma época com contador não maior que o último é replay. A sessão aberta ao
+# responder um HELLO só vale para envio depois do primeiro DATA autenticado nela.
+WIRE_MAGIC = 0xB7
+WIRE_VERSION = 3
+HELLO = 1
+HELLO_ACK = 2
+DATA = 3
+FRAME_HEADER = ">BBB"
+DATA_HEADER = ">BBB4sI"
+HEADER_SIZE = 3
+DATA_HEADER_SIZE = 11
+HELLO_FRESHNESS = ">8sI"
+HELLO_FRESHNESS_SIZE = 12
+NONCE_SIZE = 16
+TAG_SIZE = 16
+MAX_COUNTER = 0xFFFFFFFF
+REHELLO_INTERVAL_MS = 1000
+MAX_PEERS = 4  # Pares com estado guardado (na prática só o PC)
+
+def _hmac(key, data):
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+class Session:
+    def __init__(self, key, nonce_i, nonce_r, initiator, replay_window):
+        master = _hmac(key, b"trash-session" + nonce_i + nonce_r)
+        i2r = (_hmac(master, b"i2r-enc"), _hmac(master, b"i2r-mac"))
+        r2i = (_hmac(master, b"r2i-enc"), _hmac(master, b"r2i-mac"))
+        send, recv = (i2r, r2i) if initiator else (r2i, i2r)
+        self.send_key, self.send_mac = send
+        self.recv_key, self.recv_mac = recv
+        self.id = _hmac(master, b"id")[:4]
+        # Objetos ECB usados só para cifrar (derivação do IV): podem ser reaproveitados
+        self.send_iv = ucryptolib.aes(self.send_key, 1)
+        self.recv_iv = ucryptolib.aes(self.recv_key, 1)
+        self.send_counter = 0
+        self.recv_highest = 0
+        self.recv_window = 0
+        self.replay_window = replay_window
+        self.created_at = time.ticks_ms()
+
+    def iv(self, cipher, counter):
+        block = bytearray(16)
+        block[:4] = self.id
+        struct.pack_into(">I", block, 4, counter)
+        return cipher.encrypt(block)
+
+    def is_replay(self, counter):
+        if counter > self.recv_highest:
+            return False
+        offset = self.recv_highest - counter
+        return offset >= self.replay_window or bool(self.recv_window >> offset & 1)
+
+    def mark_received(self, counter):
+        if counter > self.recv_highest:
+            shift = counter - self.recv_highest
+            self.recv_window = (self.recv_window << shift | 1) & ((1 << self.replay_window) - 1)
+            self.recv_highest = counter
+        else:
+            self.recv_window |= 1 << (self.recv_highest - counter)
+
 class SecurityManager:
-    def __init__(self, auth_key: str, token_timeout: int = 30):
+    def __init__(self, auth_key: str, replay_window: int = 64, max_sessions_per_peer: int = 2):
         if isinstance(auth_key, str):
             auth_key = auth_key.encode()
         self.auth_key = hashlib.sha256(auth_key).digest()  # 32 bytes
-        self.token_timeout = token_timeout
+        self.replay_window = replay_window
+        self.max_sessions_per_peer = max_sessions_per_peer
+        self.sessions = {}      # IP -> [sessões confirmadas], ativa primeiro
+        self.candidates = {}    # IP -> [sessões abertas por HELLO, ainda sem DATA]
+        self.handshakes = {}    # nonce_i -> (destino, início em ms)
+        self.hello_seen = {}    # IP -> (época, contador, quando em ms)
+        self.rehello_at = {}
+        self.epoch = os.urandom(8)
+        self.hello_counter = 0
 
-    # -------- AES Helpers --------
-    def _pad(self, s: bytes) -> bytes:
-        pad_len = 16 - (len(s) % 16)
-        return s + bytes([pad_len]) * pad_len
+    # -------- Handshake --------
+    def hello(self, target):
+        nonce = os.urandom(NONCE_SIZE)
+        now = time.ticks_ms()
+        for pending in list(self.handshakes):
+            if time.ticks_diff(now, self.handshakes[pending][1]) > 30000:
+                del self.handshakes[pending]
+        self.handshakes[nonce] = (target, now)
+        self.hello_counter += 1
+        frame = (struct.pack(FRAME_HEADER, WIRE_MAGIC, WIRE_VERSION, HELLO) + nonce
+                 + struct.pack(HELLO_FRESHNESS, self.epoch, self.hello_counter))
+        return frame + _hmac(self.auth_key, frame)[:TAG_SIZE]
 
-    def _unpad(self, s: bytes) -> bytes:
-        return s[:-s[-1]]
+    def _store_session(self, table, peer, session):
+        if peer not in self.sessions and peer not in self.candidates:
+            self._evict_peers()
+        sessions = table.setdefault(peer, [])
+        sessions.insert(0, session)
+        del sessions[self.max_sessions_per_peer:]
 
-    # -------- Encrypt / Decrypt --------
-    def encrypt_message(self, msg: str) -> str:
-        timestamp = int(time.time())
-        payload = json.dumps({"message": msg, "timestamp": timestamp}).encode()
+    def _evict_peers(self):
+        peers = set(self.sessions) | set(self.candidates)
+        if len(peers) < MAX_PEERS:
+            return
+        now = time.ticks_ms()
+        oldest = max(peers, key=lambda peer: time.ticks_diff(
+            now, (self.sessions.get(peer) or self.candidates[peer])[0].created_at))
+        self.sessions.pop(oldest, None)
+        self.candidates.pop(oldest, None)
 
-        iv = b"1234567890ABCDEF"
-        cipher = ucryptolib.aes(self.auth_key, 2, iv)
-        encrypted = cipher.encrypt(self._pad(payload))
+    def _trim(self, table, at):
+        # Descarta as entradas mais antigas além de MAX_PEERS; at(valor) -> ticks_ms
+        while len(table) > MAX_PEERS:
+            now = time.ticks_ms()
+            del table[max(table, key=lambda peer: time.ticks_diff(now, at(table[peer])))]
 
-        signature = hmac.new(self.auth_key, iv + encrypted, hashlib.sha256).hexdigest()
+    def has_session(self, peer):
+        return bool(self.sessions.get(peer))
 
-        packet = {
-            "iv": ubinascii.b2a_base64(iv).decode().strip(),
-            "data": ubinascii.b2a_base64(encrypted).decode().strip(),
-            "signature": signature,
-        }
-        return json.dumps(packet)
+    def forget(self, peer):
+        self.sessions.pop(peer, None)
+        self.candidates.pop(peer, None)
 
-    def decrypt_message(self, enc_str: str):
-        try:
-            packet = json.loads(enc_str)
-            iv = ubinascii.a2b_base64(packet["iv"])
-            encrypted = ubinascii.a2b_base64(packet["data"])
-            signature = packet["signature"]
+    # -------- Envio --------
+    def seal(self, msg, peer):
+        """Pacote DATA na sessão ativa com `peer`, ou None se não houver sessão"""
+        sessions = self.sessions.get(peer)
+        if not sessions or sessions[0].send_counter >= MAX_COUNTER:
+            return None
+        session = sessions[0]
+        session.send_counter += 1
+        counter = session.send_counter
 
-            expected_signature = hmac.new(
-                self.auth_key, iv + encrypted, hashlib.sha256
-            ).hexdigest()
-            if not hmac.compare_digest(signature, expected_signature):
-                return None
+        padded = self._pad(msg.encode())
+        body_end = DATA_HEADER_SIZE + len(padded)
+        packet = bytearray(body_end + TAG_SIZE)
+        view = memoryview(packet)
+        struct.pack_into(DATA_HEADER, packet, 0, WIRE_MAGIC, WIRE_VERSION, DATA, session.id, counter)
+        cipher = ucryptolib.aes(session.send_key, 2, session.iv(session.send_iv, counter))
+        cipher.encrypt(padded, view[DATA_HEADER_SIZE:body_end])
+        view[body_end:] = _hmac(session.send_mac, view[:body_end])[:TAG_SIZE]
+        return packet
 
-            cipher = ucryptolib.aes(self.auth_key, 2, iv)  # CBC
-            decrypted = self._unpad(cipher.decrypt(encrypted))
-            payload = json.loads(decrypted.decode())
+    # -------- Recepção --------
+    def open(self, data, peer):
+        """(mensagem, resposta para o par, (destino do handshake, par) se uma sessão abriu)"""
+        view = memoryview(data)
+        if len(view) < HEADER_SIZE + TAG_SIZE:
+            return None, None, None
+        magic, version, kind = struct.unpack_from(FRAME_HEADER, view, 0)
+        if magic != WIRE_MAGIC or version != WIRE_VERSION:
+            return None, None, None
+        try:
+            if kind == DATA:
+                return self._open_data(view, peer)
+            if kind == HELLO:
+                return None, self._answer_hello(view, peer), None
+            if kind == HELLO_ACK:
+                established = self._finish_handshake(view, peer)
+                # DATA vazio de confirmação: o PC passa a usar a sessão no envio
+                return None, established and self.seal("", peer), established
+        except Exception:
+            pass
+        return None, None, None
 
-            if abs(int(time.time()) - int(payload["timestamp"])) > self.token_timeout:
-                return None
+    def _check_tag(self, key, view):
+        body_end = len(view) - TAG_SIZE
+        return hmac.compare_digest(bytes(view[body_end:]), _hmac(key, view[:body_end])[:TAG_SIZE])
 
-            return payload["message"]
-        except Exception:
+    def _answer_hello(self, view, peer):
+        size = HEADER_SIZE + NONCE_SIZE + HELLO_FRESHNESS_SIZE + TAG_SIZE
+        if len(view) != size or not self._check_tag(self.auth_key, view):
+            return None
+        nonce_i = bytes(view[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE])
+        epoch, counter = struct.unpack_from(HELLO_FRESHNESS, view, HEADER_SIZE + NONCE_SIZE)
+        seen = self.hello_seen.get(peer)
+        if seen is not None and seen[0] == epoch and counter <= seen[1]:
+            return None  # HELLO repetido (retransmissão ou replay)
+        self.hello_seen[peer] = (epoch, counter, time.ticks_ms())
+        self._trim(self.hello_seen, lambda seen: seen[2])
+        nonce_r = os.urandom(NONCE_SIZE)
+        # Só recebe até o primeiro DATA autenticado (ver _open_data)
+        self._store_session(self.candidates, peer,
+                            Session(self.auth_key, nonce_i, nonce_r, False, self.replay_window))
+        frame = struct.pack(FRAME_HEADER, WIRE_MAGIC, WIRE_VERSION, HELLO_ACK) + nonce_i + nonce_r
+        return frame + _hmac(self.auth_key, frame)[:TAG_SIZE]
+
+    def _finish_handshake(self, view, peer):
+        if len(view) != HEADER_SIZE + 2 * NONCE_SIZE + TAG_SIZE or not self._check_tag(self.auth_key, view):
+            return None
+        nonce_i = bytes(view[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE])
+        nonce_r = bytes(view[HEADER_SIZE + NONCE_SIZE:HEADER_SIZE + 2 * NONCE_SIZE])
+        pending = self.handshakes.get(nonce_i)
+        if pending is None:
             return None
+        self._store_session(self.sessions, peer,
+                            Session(self.auth_key, nonce_i, nonce_r, True, self.replay_window))
+        return pending[0], peer
+
+    def _open_data(self, view, peer):
+        body_end = len(view) - TAG_SIZE
+        if body_end <= DATA_HEADER_SIZE or (body_end - DATA_HEADER_SIZE) % 16:
+            return None, None, None
+        _, _, _, session_id, counter = struct.unpack_from(DATA_HEADER, view, 0)
+
+        sessions = self.sessions.get(peer, [])
+        candidates = self.candidates.get(peer, [])
+        session = None
+        for known in sessions + candidates:
+            if known.id == session_id:
+                session = known
+                break
+        if session is None:
+            # O PC reiniciou (ou nós): propõe uma sessão nova, no máximo 1 HELLO/s por par
+            now = time.ticks_ms()
+            last = self.rehello_at.get(peer)
+            if last is not None and time.ticks_diff(now, last) < REHELLO_INTERVAL_MS:
+                return None, None, None
+            self.rehello_at[peer] = now
+            self._trim(self.rehello_at, lambda at: at)
+            return None, self.hello(peer), None
+        if not self._check_tag(session.recv_mac, view) or session.is_replay(counter):
+            return None, None, None
+        session.mark_received(counter)
+        # Sessão confirmada nos dois sentidos: passa a ser a usada no envio
+        if session in candidates:
+            candidates.remove(session)
+            if not candidates:
+                del self.candidates[peer]
+            self._store_session(self.sessions, peer, session)
+        elif sessions[0] is not session:
+            sessions.remove(session)
+            sessions.insert(0, session)
+
+        cipher = ucryptolib.aes(session.recv_key, 2, session.iv(session.recv_iv, counter))
+        return self._unpad(cipher.decrypt(view[DATA_HEADER_SIZE:body_end])).decode(), None, None
+
+    # -------- AES Helpers --------
+    def _pad(self, s: bytes) -> bytes:
+        pad_len = 16 - (len(s) % 16)
+        return s + bytes([pad_len]) * pad_len
+
+    def _unpad(self, s: bytes) -> bytes:
+        return s[:-s[-1]]
@@ -1,7 +1,8 @@
 import usocket as socket
 import uasyncio as asyncio
-import ujson
+import utime as time
 from security import SecurityManager
+from reliability import ACK_PREFIX, RELIABLE_PREFIX, DuplicateFilter, ReliableSender
 from config import NetworkConfig
 class UDPCommunicator:
     def __init__(self):
@@ -10,45 +11,157 @@ class UDPCommunicator:
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self.sock.bind(("0.0.0.0", self.port))
+        # Não bloqueante: o listener espera o socket pelo ipoll do loop (ver _wait_readable)
+        # e lê até o recvfrom levantar OSError (nada mais a ler)
+        self.sock.setblocking(False)
 
-        self.security = SecurityManager(NetworkConfig.AUTH_KEY, NetworkConfig.TOKEN_TIMEOUT)
+        # Sessões com o PC; mensagens aguardam o handshake por destino
+        self.security = SecurityManager(NetworkConfig.AUTH_KEY, NetworkConfig.REPLAY_WINDOW)
+        self.pending = {}        # destino -> [(mensagem, enfileirada_em ms)]
+        self.hello_sent_at = {}  # destino -> último HELLO (ms)
         self.running = True
         self.msg_queue = asyncio.Queue()
 
+        # Entrega confiável: ack, retransmissão com RTO adaptativo, duplicatas descartadas
+        self.reliable = ReliableSender(
+            self._send_wire, NetworkConfig.RELIABLE_WINDOW, NetworkConfig.RELIABLE_MAX_RETRIES,
+            NetworkConfig.RELIABLE_INITIAL_RTO_MS, NetworkConfig.RELIABLE_MIN_RTO_MS,
+            NetworkConfig.RELIABLE_MAX_RTO_MS, on_failure=self._on_delivery_failure)
+        self.duplicates = DuplicateFilter(NetworkConfig.RELIABLE_DEDUP_SIZE)
+        self.on_delivery_failure = None  # callback(mensagem, ip) quando o par não confirma
+        self.retransmit_wakeup = asyncio.Event()  # Mensagem confiável nova: recalcula o próximo prazo
+
     async def start(self):
         loop = asyncio.get_event_loop()
         loop.create_task(self._listener())
+        loop.create_task(self._retransmitter())
         await asyncio.sleep(0)  # Ensures the function uses an async feature
 
     def stop(self):
         self.running = False
+        self.retransmit_wakeup.set()
         try:
             self.sock.close()
         except Exception:
             pass
         print("UDPCommunicatorESP32 parado")
 
+    async def _wait_readable(self):
+        # Suspende a task até o socket ter dados: o loop do uasyncio inclui o socket no
+        # ipoll com que espera a próxima task, então o pacote é lido assim que chega e o
+        # loop não acorda à toa (mesmo mecanismo dos streams do uasyncio)
+        yield asyncio.core._io_queue.queue_read(self.sock)
+
     async def _listener(self):
         print("UDP Listener ativo na porta", self.port)
         while self.running:
-            try:
-                data, addr = self.sock.recvfrom(1024)
-            except OSError:
-                await asyncio.sleep(0.05)
-                continue
-
-            raw_msg = data.decode().strip()
-            msg = self.security.decrypt_message(raw_msg)
-            if not msg:
+            await self._wait_readable()
+            while self.running:
+                try:
+                    data, addr = self.sock.recvfrom(1024)
+                except OSError:
+                    break  # Nada mais a ler
+                await self._on_datagram(data, addr)
+
+    async def _on_datagram(self, data, addr):
+        ip = addr[0]
+        msg, reply, established = self.security.open(data, ip)
+        if reply:
+            self.sock.sendto(reply, (ip, self.port))
+        if established:
+            self._flush_pending(*established)
+        if not msg:
+            if msg is None and not reply and not established:
                 print("Mensagem inválida de", addr)
-                continue
+            return
+        if msg[0] == "@":
+            msg = self._receive_control(msg, ip)
+            if not msg:
+                return
+
+        await self.msg_queue.put((msg, addr))
+
+    def _receive_control(self, msg, ip):
+        """Trata ack e mensagem confiável; devolve o conteúdo só na primeira entrega"""
+        try:
+            if msg.startswith(ACK_PREFIX):
+                self.reliable.on_ack(int(msg[len(ACK_PREFIX):]), ip)
+                return None
+            if msg.startswith(RELIABLE_PREFIX):
+                message_id, _, body = msg[len(RELIABLE_PREFIX):].partition(":")
+                message_id = int(message_id)
+                # Confirma sempre: o ack anterior pode ter se perdido
+                self._send_wire(ACK_PREFIX + str(message_id), ip)
+                return body if self.duplicates.is_new(message_id, ip) else None
+        except ValueError:
+            print("Mensagem de controle malformada de", ip)
+            return None
+        return msg
+
+    async def _retransmitter(self):
+        while self.running:
+            # Dorme até o próximo prazo, ou sem prazo até chegar uma mensagem confiável
+            delay = self.reliable.next_delay_ms()
+            if delay is None:
+                await self.retransmit_wakeup.wait()
+            elif delay > 0:
+                try:
+                    await asyncio.wait_for_ms(self.retransmit_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self.retransmit_wakeup.clear()
+            self.reliable.retransmit_due()
+
+    def _on_delivery_failure(self, message, ip):
+        print("Sem ack de", ip, "para", message)
+        if self.on_delivery_failure is not None:
+            self.on_delivery_failure(message, ip)
 
-            await self.msg_queue.put((msg, addr))
+    def send_message(self, message, ip="255.255.255.255", reliable=False, deadline=None):
+        """
+        Envia na sessão com `ip`; sem sessão (ou em broadcast), enfileira e faz o handshake.
+        Com `reliable`, a mensagem é retransmitida até o ack do par (só unicast) ou até
+        `deadline` (ticks_ms), quando houver.
+        """
+        if reliable and ip != "255.255.255.255":
+            self.reliable.send(message, ip, self.security.has_session(ip), deadline)
+            self.retransmit_wakeup.set()
+        else:
+            self._send_wire(message, ip)
 
-    def send_message(self, message, ip="255.255.255.255"):
+    def _send_wire(self, message, ip):
         try:
-            encrypted = self.security.encrypt_message(message)
-            self.sock.sendto(encrypted.encode(), (ip, self.port))
-            print("[UDP] Enviado para", ip, "->", message)
+            packet = self.security.seal(message, ip)
+            if packet is not None:
+                self.sock.sendto(packet, (ip, self.port))
+                print("[UDP] Enviado para", ip, "->", message)
+                return
+
+            now = time.ticks_ms()
+            queue = self.pending.setdefault(ip, [])
+            queue.append((message, now))
+            del queue[:-NetworkConfig.PENDING_MESSAGES]
+            last = self.hello_sent_at.get(ip)
+            if last is not None and time.ticks_diff(now, last) < NetworkConfig.HANDSHAKE_RETRY * 1000:
+                return
+            self.hello_sent_at[ip] = now
+            self.sock.sendto(self.security.hello(ip), (ip, self.port))
         except Exception as e:
             print("Erro ao enviar:", e)
+
+    async def send_message_async(self, message, ip="255.255.255.255", reliable=False, deadline=None):
+        self.send_message(message, ip, reliable, deadline)
+        await asyncio.sleep(0)
+
+    def _flush_pending(self, target, peer):
+        """Envia ao par as mensagens que aguardavam o handshake iniciado para `target`"""
+        now = time.ticks_ms()
+        max_age = NetworkConfig.HANDSHAKE_RETRY * 5000
+        messages = [message for message, queued_at in self.pending.get(target, ())
+                    if time.ticks_diff(now, queued_at) <= max_age]
+        if target == peer:
+            self.pending.pop(target, None)
+            self.hello_sent_at.pop(target, None)
+        print("Sessão segura com", peer, "estabelecida")
+        for message in messages:
+            self._send_wire(message, peer)
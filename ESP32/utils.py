@@ -15,5 +15,8 @@ def get_logger(name):
         
         def warning(self, message):
             self.log("WARN", message)
+
+        def success(self, message):
+            self.log("OK", message)
     
     return Logger(name)
\ No newline at end of file
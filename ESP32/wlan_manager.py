@@ -44,11 +44,21 @@ class WlanManager:
     def get_ip(self):
         """Retorna o IP atual"""
         return self.ip
+
+    def refresh_ip(self):
+        """Relê o IP da interface; retorna True se mudou (ex.: nova concessão do DHCP)"""
+        self.connected = self.sta_if.isconnected()
+        if not self.connected:
+            return False
+        ip = self.sta_if.ifconfig()[0]
+        changed = ip != self.ip
+        self.ip = ip
+        return changed
     
     def get_network_prefix(self):
         """Extrai o prefixo da rede do IP (ex: 192.168.1)"""
         try:
-            parts = self.get_ip.split('.')
+            parts = self.get_ip().split('.')
             if len(parts) == 4:
                 return '.'.join(parts[:3])
         except Exception:
@@ -0,0 +1,196 @@
+"""
+Tempo até parear (time-to-pair) da descoberta por anúncio/resposta, em loopback.
+
+O PC usa o Announcer, o PeerCache e o DeviceRegistry reais; o ESP32 é simulado com o
+mesmo algoritmo do ESP32/main.py (PING unicast ao IP do cache, depois broadcast com
+intervalo dobrando) num socket preso a 127.0.0.x, o que permite trocar o IP dele.
+Cenários:
+    boot do ESP32 sem cache        só broadcast
+    boot do ESP32 com cache        unicast ao PC do cache
+    ESP32 troca de IP (DHCP)       127.0.0.2 -> 127.0.0.3, re-pareia pelo cache
+    IP do PC no cache desatualizado unicast perdido, cai para o broadcast
+    reinício do PC com cache       o PC anuncia direto ao ESP32 do cache
+Em loopback o broadcast do PC não alcança um socket preso a 127.0.0.x, então o reinício
+do PC só é medido com cache (numa LAN o anúncio em broadcast também chegaria).
+Uso: python bench_discovery.py [--runs 5] [--port 20888]
+"""
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+from statistics import median
+from config import UDPConfig
+from device_registry import DeviceRegistry
+from discovery import Announcer, PeerCache
+from udp_communicator import BROADCAST, UDPCommunicator
+
+STALE_PC_IP = "192.0.2.1"  # TEST-NET: ninguém responde
+
+def _poll(comm, handler):
+    while comm.running:
+        try:
+            msg, addr, _ = comm.msg_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        handler(msg, addr)
+
+class PCSide:
+    """Parte de descoberta do PCMessenger"""
+
+    def __init__(self, port, esp_port, cache_path):
+        self.udp = UDPCommunicator(port=port, ignore_local=False, peer_port=esp_port)
+        self.devices = DeviceRegistry()
+        self.peers = PeerCache(cache_path)
+        self.discovery = Announcer(self.udp.send_message, self.peers)
+        self.moved = threading.Event()
+        threading.Thread(target=_poll, args=(self.udp, self._handle), daemon=True).start()
+
+    def start(self):
+        self.udp.start()
+        self.discovery.start()
+
+    def stop(self):
+        self.discovery.stop()
+        self.udp.stop()
+
+    def _handle(self, msg, addr):
+        kind, _, announced_id = msg.partition(":")
+        if kind not in ("PING", "ESP_ONLINE"):
+            return
+        device, _ = self.devices.touch(addr, announced_id or None)
+        if self.peers.update(device.device_id, addr[0]):
+            self.moved.set()
+        self.discovery.mark_paired()
+        if kind == "PING":
+            self.udp.send_message("PC_ONLINE", addr[0])
+
+class SimulatedESP32:
+    """Descoberta do ESP32/main.py sobre um UDPCommunicator preso a `host`"""
+
+    def __init__(self, host, port, pc_port, cache, device_id="esp-bench"):
+        self.udp = UDPCommunicator(port=port, ignore_local=False, peer_port=pc_port, host=host)
+        self.cache = cache  # Simula o peers.json da flash
+        self.device_id = device_id
+        self.pc_ip = None
+        self.paired = threading.Event()
+        self.time_to_pair = None
+        threading.Thread(target=_poll, args=(self.udp, self._handle), daemon=True).start()
+
+    def boot(self):
+        self.udp.start()
+        threading.Thread(target=self._pair, daemon=True).start()
+
+    def stop(self):
+        self.udp.stop()
+
+    def _ping(self, ip):
+        self.udp.send_message("PING:" + self.device_id, ip)
+
+    def _pair(self):
+        started = time.monotonic()
+        cached = self.cache.get("pc")
+        if cached:
+            self._ping(cached)
+            self.paired.wait(UDPConfig.DISCOVERY_CACHE_TIMEOUT)
+        delay = UDPConfig.DISCOVERY_FAST_INTERVAL
+        while self.udp.running and not self.paired.is_set():
+            self._ping(BROADCAST)
+            self.paired.wait(delay)
+            delay = min(delay * 2, UDPConfig.ANNOUNCE_INTERVAL)
+        if self.paired.is_set():
+            self.time_to_pair = time.monotonic() - started
+
+    def _handle(self, msg, addr):
+        if msg != "PC_ONLINE":
+            return
+        announced = self.paired.is_set()
+        self.pc_ip = addr[0]
+        self.cache["pc"] = addr[0]
+        self.paired.set()
+        if announced:
+            self.udp.send_message("ESP_ONLINE:" + self.device_id, addr[0])
+
+def _wait(event, timeout=40.0):
+    if not event.wait(timeout):
+        raise TimeoutError("não pareou")
+
+def scenario(name, port, cache_dir):
+    pc_port, esp_port = port, port + 1
+    cache_path = os.path.join(cache_dir, f"{name}-{port}.json")
+    pc = PCSide(pc_port, esp_port, cache_path)
+    pc.start()
+    try:
+        if name == "esp_boot_no_cache":
+            esp = SimulatedESP32("127.0.0.2", esp_port, pc_port, {})
+            esp.boot()
+            _wait(esp.paired)
+            time.sleep(0.05)
+            esp.stop()
+            return esp.time_to_pair
+
+        if name in ("esp_boot_cached", "pc_ip_stale"):
+            cached_ip = "127.0.0.1" if name == "esp_boot_cached" else STALE_PC_IP
+            esp = SimulatedESP32("127.0.0.2", esp_port, pc_port, {"pc": cached_ip})
+            esp.boot()
+            _wait(esp.paired)
+            time.sleep(0.05)
+            esp.stop()
+            return esp.time_to_pair
+
+        if name == "esp_dhcp_change":
+            cache = {}
+            esp = SimulatedESP32("127.0.0.2", esp_port, pc_port, cache)
+            esp.boot()
+            _wait(esp.paired)
+            time.sleep(0.1)
+            esp.stop()
+            pc.moved.clear()
+            started = time.monotonic()
+            # Mesma flash, IP novo: o PC só conhece o endereço antigo
+            esp = SimulatedESP32("127.0.0.3", esp_port, pc_port, cache)
+            esp.boot()
+            _wait(pc.moved)
+            elapsed = time.monotonic() - started
+            esp.stop()
+            return elapsed
+
+        if name == "pc_restart_cached":
+            esp = SimulatedESP32("127.0.0.2", esp_port, pc_port, {})
+            esp.boot()
+            _wait(esp.paired)
+            pc.stop()
+            time.sleep(0.1)
+            pc = PCSide(pc_port, esp_port, cache_path)  # Mesmo data/peers.json
+            pc.start()
+            _wait(pc.discovery.paired)
+            esp.stop()
+            return pc.discovery.time_to_pair
+    finally:
+        pc.stop()
+    raise ValueError(name)
+
+SCENARIOS = {
+    "esp_boot_no_cache": "boot do ESP32 sem cache",
+    "esp_boot_cached": "boot do ESP32 com cache",
+    "esp_dhcp_change": "ESP32 troca de IP (DHCP)",
+    "pc_ip_stale": "IP do PC no cache desatualizado",
+    "pc_restart_cached": "reinício do PC com cache",
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tempo até parear PC e ESP32 por cenário")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=20888)
+    args = parser.parse_args()
+
+    print(f"{'cenário':<34} {'mediana ms':>10} {'máx ms':>8}")
+    port = args.port
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, label in SCENARIOS.items():
+            times = []
+            for _ in range(args.runs):
+                times.append(scenario(name, port, cache_dir))
+                port += 2
+            print(f"{label:<34} {median(times) * 1e3:>10.1f} {max(times) * 1e3:>8.1f}")
@@ -0,0 +1,45 @@
+"""
+Benchmark de latência do ensemble: um predict_batch com K vistas vs K predicts sequenciais.
+
+Uso: python bench_ensemble.py [--weights caminho.h5] [--sizes 1 2 4 8] [--repeats 10]
+"""
+import argparse
+import time
+import numpy as np
+from config import MLConfig
+from ml_model import TrashNetModel, make_augmentations
+
+def _time_call(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Latência do ensemble em função de K")
+    parser.add_argument("--weights", default=None, help="Pesos .h5 (opcional; sem pesos usa inicialização aleatória)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8, 12])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    model = TrashNetModel(args.weights)
+    image = np.random.randint(0, 256, MLConfig.MODEL_INPUT_SHAPE, dtype=np.uint8)
+
+    # Aquecimento (tracing do grafo e alocação de buffers)
+    model.predict_batch([image])
+
+    print(f"{'K':>3}  {'batch p50 (ms)':>15}  {'batch p95 (ms)':>15}  {'seq p50 (ms)':>13}  {'x single':>8}")
+    single_p50 = None
+    for k in args.sizes:
+        views = make_augmentations(image, k)
+        model.predict_batch(views)  # aquece o formato de batch K
+
+        batch_p50, batch_p95 = _time_call(lambda: model.predict_batch(views), args.repeats)
+        seq_p50, _ = _time_call(lambda: [model.predict(v) for v in views], args.repeats)
+        if single_p50 is None:
+            single_p50 = batch_p50
+        print(f"{k:>3}  {batch_p50 * 1000:>15.1f}  {batch_p95 * 1000:>15.1f}  "
+              f"{seq_p50 * 1000:>13.1f}  {batch_p50 / single_p50:>8.2f}")
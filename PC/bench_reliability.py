@@ -0,0 +1,110 @@
+"""
+Benchmark da entrega confiável num enlace com perdas simulado em loopback.
+
+Dois UDPCommunicator (um "ESP32" e o PC) trocam mensagens por um enlace que descarta
+pacotes com probabilidade `loss` em cada sentido (handshake e acks inclusive) e atrasa
+cada um em delay ± jitter. Compara envio sem ack, retransmissão com RTO fixo e com RTO
+adaptativo (RFC 6298): fração entregue, latência envio→entrega (p50/p99), retransmissões
+e duplicatas que chegaram à aplicação.
+Uso: python bench_reliability.py [--messages 200] [--interval 0.1] [--loss 0 0.05 0.2 0.4]
+"""
+import argparse
+import random
+import threading
+import time
+from utils import RollingStats
+from udp_communicator import UDPCommunicator
+
+class LossyCommunicator(UDPCommunicator):
+    def __init__(self, port, peer_port, loss, delay, jitter, rng):
+        super().__init__(port=port, ignore_local=False, peer_port=peer_port)
+        self.loss, self.delay, self.jitter, self.rng = loss, delay, jitter, rng
+
+    def _sendto(self, packet, addr):
+        if self.rng.random() < self.loss:
+            return
+        latency = max(0.0, self.delay + self.rng.uniform(-self.jitter, self.jitter))
+        timer = threading.Timer(latency, self._deliver_late, args=(packet, addr))
+        timer.daemon = True
+        timer.start()
+
+    def _deliver_late(self, packet, addr):
+        if self.running:
+            try:
+                self.sock.sendto(packet, addr)
+            except OSError:
+                pass
+
+class Receiver:
+    def __init__(self, comm):
+        self.comm = comm
+        self.latency = RollingStats(window=100000)
+        self.seen = set()
+        self.duplicates = 0
+        threading.Thread(target=self._poll, daemon=True).start()
+
+    def _poll(self):
+        while self.comm.running:
+            try:
+                msg, _, _ = self.comm.msg_queue.get(timeout=0.2)
+            except Exception:
+                continue
+            _, index, sent_at = msg.split(":")
+            if index in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(index)
+            self.latency.add(time.monotonic() - float(sent_at))
+
+def run(mode, loss, messages, interval, port, delay, jitter, seed):
+    rng = random.Random(seed)
+    esp = LossyCommunicator(port, port + 1, loss, delay, jitter, rng)
+    pc = LossyCommunicator(port + 1, port, loss, delay, jitter, rng)
+    if mode == "fixed":
+        # Temporizador fixo: sem medida de RTT nem backoff
+        sender = esp.reliable
+        sender.initial_rto = sender.min_rto = sender.max_rto = 0.25
+    receiver = Receiver(pc)
+    esp.start()
+    pc.start()
+
+    for i in range(messages):
+        esp.send_message(f"MOVIMENTO_DETECTADO:{i}:{time.monotonic()!r}", "127.0.0.1", reliable=mode != "none")
+        time.sleep(interval)
+
+    # Espera as retransmissões pendentes (ou a desistência)
+    deadline = time.monotonic() + 20.0
+    while time.monotonic() < deadline:
+        stats = esp.reliable.get_stats()
+        if mode == "none" or stats["in_flight"] + stats["backlog"] == 0:
+            break
+        time.sleep(0.05)
+    time.sleep(delay + jitter + 0.1)
+    stats = esp.get_stats()
+    esp.stop()
+    pc.stop()
+
+    summary = receiver.latency.summary()
+    labels = {"none": "sem ack", "fixed": "RTO fixo 250ms", "adaptive": "RTO adaptativo"}
+    print(f"{loss:>5.0%} {labels[mode]:<16} {len(receiver.seen) / messages:>9.1%} "
+          f"{summary['p50'] * 1e3:>8.1f} {summary['p99'] * 1e3:>8.1f} {summary['max'] * 1e3:>8.1f} "
+          f"{stats['retransmissions']:>8} {stats['failed']:>7} {receiver.duplicates:>5}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Entrega e latência da camada confiável com perdas")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.1, help="Intervalo entre mensagens (s)")
+    parser.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.05, 0.2, 0.4])
+    parser.add_argument("--delay", type=float, default=0.004, help="Atraso do enlace por sentido (s)")
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--port", type=int, default=19888)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'perda':>5} {'modo':<16} {'entregues':>9} {'p50 ms':>8} {'p99 ms':>8} {'máx ms':>8} "
+          f"{'retrans':>8} {'falhas':>7} {'dup':>5}")
+    port = args.port
+    for loss in args.loss:
+        for mode in ("none", "fixed", "adaptive"):
+            run(mode, loss, args.messages, args.interval, port, args.delay, args.jitter, args.seed)
+            port += 2
@@ -0,0 +1,46 @@
+"""
+Benchmark do protocolo de sessão: custo do handshake, bytes por pacote DATA e
+tempo de cifragem/decifragem para mensagens típicas (o JSON antigo tinha ~190-215 B).
+
+Uso: python bench_security.py [--iterations 5000]
+"""
+import argparse
+import time
+from config import UDPConfig
+from security import SecurityManager
+
+MESSAGES = ["PING", "MOVIMENTO_DETECTADO", "WASTE_TYPE:4:PLASTICO", "PC_STATUS:WARMING_UP"]
+
+def handshake(initiator, responder):
+    _, ack, _ = responder.open(initiator.hello("responder"), "initiator")
+    _, confirm, _ = initiator.open(ack, "responder")
+    responder.open(confirm, "initiator")  # O respondedor só envia depois do 1º DATA
+
+def _measure(sender, receiver, message, iterations):
+    start = time.perf_counter()
+    packets = [sender.seal(message, "responder") for _ in range(iterations)]
+    encode = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for packet in packets:
+        receiver.open(packet, "initiator")
+    decode = (time.perf_counter() - start) / iterations
+    assert receiver.open(sender.seal(message, "responder"), "initiator")[0] == message
+    return len(packets[0]), encode, decode
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Handshake, bytes e tempo por pacote do protocolo de sessão")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    initiator = SecurityManager(UDPConfig.AUTH_KEY, UDPConfig.REPLAY_WINDOW)
+    responder = SecurityManager(UDPConfig.AUTH_KEY, UDPConfig.REPLAY_WINDOW)
+    start = time.perf_counter()
+    for _ in range(100):
+        handshake(initiator, responder)
+    print(f"handshake: {(time.perf_counter() - start) / 100 * 1e6:.0f} µs")
+
+    print(f"{'mensagem':<22} {'bytes':>6} {'cifra µs':>9} {'decifra µs':>11}")
+    for message in MESSAGES:
+        size, encode, decode = _measure(initiator, responder, message, args.iterations)
+        print(f"{message:<22} {size:>6} {encode * 1e6:>9.1f} {decode * 1e6:>11.1f}")
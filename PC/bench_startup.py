@@ -0,0 +1,53 @@
+"""
+Benchmark de inicialização do modelo: reconstrução Keras + load_weights vs artefato em cache.
+
+Cada medição roda num processo novo (inclui o import do TensorFlow), como num restart real.
+Uso: python bench_startup.py [--weights caminho.h5] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+def _child(mode, weights):
+    start = time.perf_counter()
+    import numpy as np
+    from ml_model import TrashNetModel
+
+    model = TrashNetModel(weights, use_cache=(mode != "keras"))
+    loaded = time.perf_counter() - start
+    model.predict_batch(np.zeros((1,) + model.input_shape, dtype=np.uint8))
+    first_predict = time.perf_counter() - start
+    print(json.dumps({"load": loaded, "first_predict": first_predict}))
+
+def _run(mode, weights):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--weights", weights],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    from config import MLConfig
+
+    parser = argparse.ArgumentParser(description="Tempo de inicialização com e sem cache do modelo")
+    parser.add_argument("--weights", default=MLConfig.MODEL_WEIGHTS_PATH)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", choices=["keras", "cache"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.weights)
+        sys.exit(0)
+
+    # Primeira execução com cache: exporta o artefato se a chave ainda não existir
+    export = _run("cache", args.weights)
+    print(f"cache (exportação/primeira carga): load {export['load']:.2f} s")
+
+    for mode in ("keras", "cache"):
+        results = [_run(mode, args.weights) for _ in range(args.runs)]
+        load = sorted(r["load"] for r in results)[len(results) // 2]
+        first = sorted(r["first_predict"] for r in results)[len(results) // 2]
+        print(f"{mode:>6}: load p50 {load:.2f} s, até a primeira predição p50 {first:.2f} s")
@@ -0,0 +1,103 @@
+"""
+Benchmark do transporte UDP do PC: listener em thread + fila (com o processador fazendo
+polling, como o PCMessenger) vs asyncio DatagramProtocol com handlers em tasks.
+
+Um emissor em outro processo abre uma sessão e envia pacotes DATA em loopback; mede pacotes/s
+entregues ao handler e a latência recepção→handler e envio→handler (p50/p99).
+Uso: python bench_udp.py [--packets 20000] [--port 18888] [--burst 32]
+"""
+import argparse
+import multiprocessing
+import queue
+import socket
+import threading
+import time
+from config import UDPConfig
+from security import SecurityManager
+from utils import RollingStats
+from udp_communicator import AsyncUDPCommunicator, UDPCommunicator
+
+class Recorder:
+    def __init__(self, expected):
+        self.expected = expected
+        self.handled = 0
+        self.receive_to_handler = RollingStats(window=expected)
+        self.send_to_handler = RollingStats(window=expected)
+        self.done = threading.Event()
+        self.first_at = None
+        self.last_at = 0.0
+
+    def __call__(self, msg, addr, received_at):
+        now = time.monotonic()
+        if self.first_at is None:
+            self.first_at = received_at
+        sent_at = float(msg.split(":")[2])
+        self.receive_to_handler.add(now - received_at)
+        self.send_to_handler.add(now - sent_at)
+        self.handled += 1
+        self.last_at = now
+        if self.handled >= self.expected:
+            self.done.set()
+
+def _poll_queue(comm, recorder):
+    # Mesmo padrão do PCMessenger._processor
+    while comm.running:
+        try:
+            recorder(*comm.msg_queue.get(timeout=0.5))
+        except queue.Empty:
+            continue
+
+def _send(port, packets, burst):
+    """Processo emissor (um "ESP32" muito rápido), fora do GIL do receptor"""
+    sender = SecurityManager(UDPConfig.AUTH_KEY, UDPConfig.REPLAY_WINDOW)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2.0)
+    target = ("127.0.0.1", port)
+    sock.sendto(sender.hello("pc"), target)
+    ack, _ = sock.recvfrom(UDPConfig.UDP_BUFFER_SIZE)
+    _, confirm, _ = sender.open(ack, "pc")
+    sock.sendto(confirm, target)
+
+    for i in range(packets):
+        sock.sendto(sender.seal(f"BENCH:{i}:{time.monotonic()!r}", "pc"), target)
+        if i % burst == burst - 1:
+            time.sleep(0.0005)  # Rajadas, como vários ESP32 disparando juntos
+    sock.close()
+
+def run(transport, port, packets, burst, decrypt_in_executor=False):
+    if transport == "thread":
+        comm = UDPCommunicator(port=port, ignore_local=False)
+    else:
+        comm = AsyncUDPCommunicator(port=port, ignore_local=False, decrypt_in_executor=decrypt_in_executor)
+    recorder = Recorder(packets)
+    if transport == "thread":
+        threading.Thread(target=_poll_queue, args=(comm, recorder), daemon=True).start()
+    else:
+        comm.set_handler(recorder)
+    comm.start()
+
+    process = multiprocessing.Process(target=_send, args=(port, packets, burst))
+    process.start()
+    process.join()
+    recorder.done.wait(timeout=5.0)
+    elapsed = max(1e-9, recorder.last_at - (recorder.first_at or recorder.last_at))
+    comm.stop()
+
+    label = transport + (" + executor" if decrypt_in_executor else "")
+    rx, e2e = recorder.receive_to_handler.summary(), recorder.send_to_handler.summary()
+    print(f"{label:<18} {recorder.handled:>7}/{packets:<7} {recorder.handled / elapsed:>9.0f} "
+          f"{rx['p50'] * 1e6:>9.0f} {rx['p99'] * 1e6:>9.0f} {e2e['p50'] * 1e6:>9.0f} {e2e['p99'] * 1e6:>9.0f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pacotes/s e latência até o handler por transporte UDP")
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=18888)
+    parser.add_argument("--burst", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'transporte':<18} {'entregues':>15} {'pacotes/s':>9} {'rx p50µs':>9} {'rx p99µs':>9} "
+          f"{'e2e p50µs':>9} {'e2e p99µs':>9}")
+    run("thread", args.port, args.packets, args.burst)
+    run("asyncio", args.port + 1, args.packets, args.burst)
+    run("asyncio", args.port + 2, args.packets, args.burst, decrypt_in_executor=True)
@@ -1,43 +1,517 @@
 import cv2
 import numpy as np
-import os
 import time
-from typing import Optional
-from config import CameraConfig
-from utils import log_error, log_info
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from config import CameraConfig, MLConfig
+from image_writer import write_image
+from utils import RollingStats, log_error, log_info, log_warning
 
-def capture_image() -> Optional[np.ndarray]:
-    """Captura uma imagem única da câmera e retorna em formato compatível com o modelo"""
-    cap = cv2.VideoCapture(CameraConfig.CAMERA_INDEX)
+# --- Serviço de câmera ---
+class CameraService:
+    """Mantém a câmera aberta e drena frames continuamente para um buffer circular"""
 
-    if not cap.isOpened():
-        log_error("Câmera não disponível")
-        return None
+    def __init__(self, camera_index: int = CameraConfig.CAMERA_ID,
+                 buffer_size: int = CameraConfig.FRAME_BUFFER_SIZE):
+        self.camera_index = camera_index
+        self.frames = deque(maxlen=buffer_size)  # (timestamp, frame)
+        self.condition = threading.Condition()
+        self.cap = None
+        self.exposure = None  # Último valor de CAP_PROP_EXPOSURE lido pelo grabber
+        self.running = False
+        self.thread = None
+
+        # Fundo da lixeira vazia, aprendido com frames ociosos
+        self.background = BackgroundModel() if CameraConfig.USE_BACKGROUND_MODEL else None
+        self.active_captures = 0
+        self.last_capture_end = 0.0
+        self.last_background_update = 0.0
+
+        # Estatísticas
+        self.frame_count = 0
+        self.reopen_count = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._grabber, daemon=True)
+        self.thread.start()
+        log_info(f"Serviço de câmera {self.camera_index} iniciado")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=CameraConfig.FRAME_TIMEOUT)
+        self._release()
+        log_info(f"Serviço de câmera {self.camera_index} parado")
+
+    def _open(self) -> bool:
+        """Abre o dispositivo e aquece a câmera"""
+        cap = cv2.VideoCapture(self.camera_index)
+        if not cap.isOpened():
+            cap.release()
+            return False
 
-    try:
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, CameraConfig.CAPTURE_WIDTH)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CameraConfig.CAPTURE_HEIGHT)
 
-        # Aquece a câmera
         for _ in range(CameraConfig.CAMERA_WARMUP_ATTEMPTS):
-            ret, frame = cap.read()
+            ret, _ = cap.read()
             if ret:
-                break
+                self.cap = cap
+                return True
             time.sleep(CameraConfig.CAMERA_WARMUP_DELAY)
-        else:
-            log_error("Falha no aquecimento da câmera")
+
+        log_error(f"Falha no aquecimento da câmera {self.camera_index}")
+        cap.release()
+        return False
+
+    def _release(self):
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+
+    def _grabber(self):
+        failures = 0
+        while self.running:
+            if self.cap is None:
+                if not self._open():
+                    log_warning(f"Câmera {self.camera_index} não disponível, tentando novamente...")
+                    time.sleep(CameraConfig.CAMERA_REOPEN_DELAY)
+                    continue
+                failures = 0
+                log_info(f"Câmera {self.camera_index} aberta")
+
+            try:
+                ret, frame = self.cap.read()
+            except Exception as e:
+                log_error(f"ERRO na leitura da câmera {self.camera_index}: {e}")
+                ret, frame = False, None
+
+            if not ret or frame is None:
+                failures += 1
+                if failures >= CameraConfig.CAMERA_MAX_READ_FAILURES:
+                    log_error(f"Câmera {self.camera_index} caiu, reabrindo...")
+                    self._release()
+                    self.reopen_count += 1
+                else:
+                    time.sleep(0.05)
+                continue
+
+            failures = 0
+            try:
+                self.exposure = self.cap.get(cv2.CAP_PROP_EXPOSURE)
+            except Exception:
+                self.exposure = None
+
+            now = time.monotonic()
+            with self.condition:
+                self.frames.append((now, frame))
+                self.frame_count += 1
+                self.condition.notify_all()
+            self._learn_background(now, frame)
+
+        self._release()
+
+    # ----------------- Modelo de fundo -----------------
+    def begin_capture(self):
+        with self.condition:
+            self.active_captures += 1
+
+    def end_capture(self):
+        with self.condition:
+            self.active_captures -= 1
+            self.last_capture_end = time.monotonic()
+
+    def _learn_background(self, now: float, frame: np.ndarray):
+        """Atualiza o fundo em baixa frequência, só com a câmera ociosa (sem captura recente)"""
+        if self.background is None or self.active_captures:
+            return
+        if now - self.last_background_update < CameraConfig.BG_UPDATE_INTERVAL:
+            return
+        if now - self.last_capture_end < CameraConfig.BG_SETTLE_TIME:
+            return
+        self.last_background_update = now
+        try:
+            self.background.update(frame)
+        except Exception as e:
+            log_error(f"ERRO ao atualizar o fundo da câmera {self.camera_index}: {e}")
+
+    # ----------------- Acesso aos frames -----------------
+    def get_latest_frame(self, max_age: Optional[float] = None) -> Optional[Tuple[float, np.ndarray]]:
+        """Retorna o frame mais recente (timestamp, frame), opcionalmente limitado por idade"""
+        with self.condition:
+            if not self.frames:
+                return None
+            timestamp, frame = self.frames[-1]
+        if max_age is not None and time.monotonic() - timestamp > max_age:
             return None
+        return timestamp, frame
+
+    def get_frames_since(self, timestamp: float) -> List[Tuple[float, np.ndarray]]:
+        """Retorna todos os frames do buffer capturados após o timestamp (time.monotonic)"""
+        with self.condition:
+            return [(ts, frame) for ts, frame in self.frames if ts > timestamp]
+
+    def wait_for_frame(self, after: float, timeout: float = CameraConfig.FRAME_TIMEOUT) -> Optional[Tuple[float, np.ndarray]]:
+        """Bloqueia até chegar um frame capturado após `after` ou até o timeout"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if self.frames and self.frames[-1][0] > after:
+                    return self.frames[-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "camera_index": self.camera_index,
+            "frames": self.frame_count,
+            "reopens": self.reopen_count,
+            "buffered": len(self.frames),
+            "open": self.cap is not None,
+        }
+        if self.background is not None:
+            stats["background"] = self.background.get_stats()
+        return stats
+
+# --- Instâncias compartilhadas ---
+_services: Dict[int, CameraService] = {}
+_services_lock = threading.Lock()
+
+def get_camera_service(camera_index: Optional[int] = None) -> CameraService:
+    """Retorna (e inicia, se necessário) o serviço persistente da câmera"""
+    if camera_index is None:
+        camera_index = CameraConfig.CAMERA_ID
+    with _services_lock:
+        service = _services.get(camera_index)
+        if service is None:
+            service = CameraService(camera_index)
+            _services[camera_index] = service
+            service.start()
+        return service
+
+def stop_camera_services():
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        service.stop()
+
+def get_camera_stats() -> Dict[str, Any]:
+    with _services_lock:
+        services = list(_services.values())
+    return {service.camera_index: service.get_stats() for service in services}
+
+# --- Modelo de fundo (lixeira vazia) ---
+class NoObjectDetected(Exception):
+    """O frame capturado não difere do fundo: gatilho falso, a inferência é dispensada"""
+
+class BackgroundModel:
+    """
+    Média móvel lenta de uma cópia reduzida e suavizada da cena vazia. A atualização é
+    seletiva (pixels de primeiro plano não entram) e, se a cena inteira mudar por muito
+    tempo (ex.: iluminação), o fundo é reaprendido do zero.
+    """
+
+    def __init__(self, width: int = CameraConfig.BG_WIDTH,
+                 learning_rate: float = CameraConfig.BG_LEARNING_RATE,
+                 threshold: float = CameraConfig.BG_DIFF_THRESHOLD,
+                 min_area: float = CameraConfig.BG_MIN_OBJECT_AREA):
+        self.width = width
+        self.learning_rate = learning_rate
+        self.threshold = threshold
+        self.min_area = min_area
+        self.background: Optional[np.ndarray] = None  # float32 BGR reduzido
+        self.lock = threading.Lock()
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+        # Estatísticas
+        self.updates = 0
+        self.relearns = 0
+        self.changed_streak = 0
+        self.checks = 0
+        self.no_object = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.updates >= CameraConfig.BG_MIN_UPDATES
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, frame.shape[0] * self.width // frame.shape[1])
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    def _mask(self, small: np.ndarray) -> np.ndarray:
+        """Máscara uint8 (255 = primeiro plano): maior diferença entre canais acima do limiar"""
+        diff = cv2.absdiff(small, self.background)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        mask = (diff > self.threshold).astype(np.uint8) * 255
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        return cv2.dilate(mask, self.kernel, iterations=2)
+
+    def update(self, frame: np.ndarray):
+        """Incorpora um frame ocioso ao fundo"""
+        small = self._prepare(frame)
+        with self.lock:
+            if self.background is None or self.background.shape != small.shape:
+                self.background = small
+                self.updates = 1
+                return
+
+            mask = self._mask(small)
+            if cv2.countNonZero(mask) > CameraConfig.BG_RELEARN_AREA * mask.size:
+                self.changed_streak += 1
+                if self.changed_streak >= CameraConfig.BG_RELEARN_UPDATES:
+                    self.background = small
+                    self.updates = 1
+                    self.relearns += 1
+                    self.changed_streak = 0
+                    log_warning("Cena vazia mudou de forma persistente, reaprendendo o fundo")
+                return
+            self.changed_streak = 0
+            cv2.accumulateWeighted(small, self.background, self.learning_rate, mask=cv2.bitwise_not(mask))
+            self.updates += 1
 
-        # Timer para estabilização de luz
-        log_info("Câmera ativada. Aguardando 3 segundos para estabilização da luz...")
-        for i in range(3, 0, -1):
-            log_info(f"Capturando em {i} segundo(s)...")
-            time.sleep(1)
+    def locate(self, frame: np.ndarray) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+        """
+        Retorna (caixa (x, y, w, h) em coordenadas do frame, fração de primeiro plano).
+        A caixa envolve as regiões com área mínima; None quando não há objeto.
+        """
+        small = self._prepare(frame)
+        with self.lock:
+            mask = self._mask(small)
+        fraction = cv2.countNonZero(mask) / mask.size
 
-        # Captura final
-        log_info("📸 Capturando imagem agora!")
-        ret, frame = cap.read()
-        if not ret or frame is None:
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_pixels = self.min_area * mask.size
+        boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_pixels]
+
+        with self.lock:
+            self.checks += 1
+            if not boxes:
+                self.no_object += 1
+        if not boxes:
+            return None, fraction
+
+        x0 = min(x for x, _, _, _ in boxes)
+        y0 = min(y for _, y, _, _ in boxes)
+        x1 = max(x + w for x, _, w, _ in boxes)
+        y1 = max(y + h for _, y, _, h in boxes)
+        scale_x = frame.shape[1] / mask.shape[1]
+        scale_y = frame.shape[0] / mask.shape[0]
+        box = (int(x0 * scale_x), int(y0 * scale_y), int((x1 - x0) * scale_x), int((y1 - y0) * scale_y))
+        return box, fraction
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "updates": self.updates,
+            "relearns": self.relearns,
+            "checks": self.checks,
+            "no_object": self.no_object,
+            "skip_rate": self.no_object / self.checks if self.checks else 0.0,
+        }
+
+def crop_to_box(frame: np.ndarray, box: Tuple[int, int, int, int],
+                margin: float = CameraConfig.BG_CROP_MARGIN,
+                min_size: float = CameraConfig.BG_MIN_CROP) -> np.ndarray:
+    """Recorte (view, sem cópia) da caixa com margem, com lado mínimo proporcional ao frame"""
+    frame_h, frame_w = frame.shape[:2]
+    x, y, w, h = box
+    w2 = max(w * (1 + 2 * margin), min_size * frame_w) / 2
+    h2 = max(h * (1 + 2 * margin), min_size * frame_h) / 2
+    cx, cy = x + w / 2, y + h / 2
+    x0, x1 = int(max(0, cx - w2)), int(min(frame_w, cx + w2))
+    y0, y1 = int(max(0, cy - h2)), int(min(frame_h, cy + h2))
+    return frame[y0:y1, x0:x1]
+
+def locate_object(frame: np.ndarray, camera_index: Optional[int] = None) -> Tuple[Optional[Tuple[int, int, int, int]], Dict[str, Any]]:
+    """
+    Compara o frame com o fundo da câmera. info["object"]: True (caixa encontrada),
+    False (nenhum objeto) ou None (fundo ainda não aprendido; usar o frame inteiro).
+    """
+    background = get_camera_service(camera_index).background
+    if background is None or not background.ready:
+        return None, {"object": None}
+    box, fraction = background.locate(frame)
+    return box, {"object": box is not None, "foreground": fraction}
+
+def crop_frames_to_object(frames: List[np.ndarray], camera_index: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Recorta os frames na caixa do objeto encontrada no primeiro deles. Levanta
+    NoObjectDetected se o fundo indicar que não há objeto.
+    """
+    box, info = locate_object(frames[0], camera_index)
+    if info["object"] is False:
+        raise NoObjectDetected(f"Nenhum objeto em relação ao fundo (primeiro plano {info['foreground']:.1%})")
+    if box is None:
+        return frames
+    log_info(f"Objeto em {box} (primeiro plano {info['foreground']:.1%})")
+    return [crop_to_box(frame, box) for frame in frames]
+
+# --- Estabilização de exposição ---
+_capture_waits = RollingStats()
+_capture_converged = {"converged": 0, "timeout": 0}
+
+def frame_statistics(frame: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Luminância média e histograma normalizado de uma cópia reduzida do frame"""
+    height = max(1, frame.shape[0] * CameraConfig.STATS_WIDTH // frame.shape[1])
+    small = cv2.resize(frame, (CameraConfig.STATS_WIDTH, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    hist = cv2.calcHist([gray], [0], None, [32], [0, 256])
+    cv2.normalize(hist, hist, 1.0, 0.0, cv2.NORM_L1)
+    return float(gray.mean()), hist
+
+def wait_for_stable_frame(service: CameraService,
+                          max_wait: float = CameraConfig.STABILITY_MAX_WAIT,
+                          required_frames: int = CameraConfig.STABILITY_FRAMES) -> Tuple[Optional[Tuple[float, np.ndarray]], Dict[str, Any]]:
+    """
+    Observa os frames conforme chegam e retorna assim que luminância, histograma e
+    exposição ficam dentro da tolerância por `required_frames` frames seguidos.
+    Se não convergir em `max_wait`, retorna o último frame recebido.
+    """
+    start = time.monotonic()
+    deadline = start + max_wait
+    last_ts = start
+    previous = None
+    previous_exposure = service.exposure
+    stable = 0
+    frames_seen = 0
+    latest = None
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        item = service.wait_for_frame(after=last_ts, timeout=remaining)
+        if item is None:
+            break
+        last_ts, frame = item
+        latest = item
+        frames_seen += 1
+
+        luma, hist = frame_statistics(frame)
+        exposure = service.exposure
+        if previous is not None:
+            luma_ok = abs(luma - previous[0]) <= CameraConfig.STABILITY_LUMA_TOLERANCE
+            hist_ok = cv2.compareHist(previous[1], hist, cv2.HISTCMP_BHATTACHARYYA) <= CameraConfig.STABILITY_HIST_TOLERANCE
+            exposure_ok = (exposure is None or previous_exposure is None or
+                           abs(exposure - previous_exposure) <= CameraConfig.STABILITY_EXPOSURE_TOLERANCE)
+            stable = stable + 1 if (luma_ok and hist_ok and exposure_ok) else 0
+        previous = (luma, hist)
+        previous_exposure = exposure
+
+        if stable >= required_frames:
+            break
+
+    converged = stable >= required_frames
+    info = {
+        "mode": "stable",
+        "waited": time.monotonic() - start,
+        "frames": frames_seen,
+        "converged": converged,
+    }
+    return latest, info
+
+def _record_capture_wait(info: Dict[str, Any]):
+    _capture_waits.add(info["waited"])
+    _capture_converged["converged" if info["converged"] else "timeout"] += 1
+    log_info(f"Espera de estabilização ({info['mode']}): {info['waited'] * 1000:.0f} ms, "
+             f"{info['frames']} frame(s), {'convergiu' if info['converged'] else 'sem convergência'}")
+
+def get_capture_stats() -> Dict[str, Any]:
+    """Tempos de espera das capturas, para ajuste das tolerâncias em produção"""
+    stats = _capture_waits.summary()
+    stats.update(_capture_converged)
+    return stats
+
+# --- Seleção do frame mais nítido ---
+def sharpness_score(frame: np.ndarray) -> float:
+    """Variância do Laplaciano numa cópia reduzida em escala de cinza (maior = mais nítido)"""
+    height = max(1, frame.shape[0] * CameraConfig.SHARPNESS_WIDTH // frame.shape[1])
+    small = cv2.resize(frame, (CameraConfig.SHARPNESS_WIDTH, height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+def select_sharpest_frame(frames: List[np.ndarray]) -> Tuple[int, float]:
+    """Retorna (índice, score) do frame mais nítido da lista"""
+    scores = [sharpness_score(frame) for frame in frames]
+    best = int(np.argmax(scores))
+    return best, scores[best]
+
+def collect_burst(service: CameraService, since: float,
+                  count: int = CameraConfig.BURST_SIZE,
+                  max_wait: float = CameraConfig.BURST_MAX_WAIT) -> List[Tuple[float, np.ndarray]]:
+    """Últimos `count` frames após `since`, aguardando novos frames se o buffer não bastar"""
+    frames = service.get_frames_since(since)[-count:]
+    deadline = time.monotonic() + max_wait
+    while len(frames) < count:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        item = service.wait_for_frame(after=frames[-1][0] if frames else since, timeout=remaining)
+        if item is None:
+            break
+        frames.append(item)
+    return frames
+
+# --- Captura ---
+def capture_frames(camera_index: Optional[int] = None,
+                   count: int = CameraConfig.BURST_SIZE) -> List[np.ndarray]:
+    """Aguarda a estabilização e retorna uma rajada de até `count` frames BGR crus"""
+    service = get_camera_service(camera_index)
+    service.begin_capture()  # Suspende o aprendizado do fundo enquanto há objeto na cena
+    try:
+        return _capture_frames(service, count)
+    finally:
+        service.end_capture()
+
+def _capture_frames(service: CameraService, count: int) -> List[np.ndarray]:
+    trigger = time.monotonic()
+
+    if CameraConfig.CAPTURE_MODE == "fixed":
+        # Timer fixo para estabilização de luz
+        seconds = CameraConfig.FIXED_STABILIZATION_SECONDS
+        log_info(f"Aguardando {seconds} segundos para estabilização da luz...")
+        time.sleep(seconds)
+        latest = service.wait_for_frame(after=time.monotonic())
+        info = {"mode": "fixed", "waited": time.monotonic() - trigger,
+                "frames": 1, "converged": latest is not None}
+    else:
+        latest, info = wait_for_stable_frame(service)
+
+    if latest is None:
+        return []
+    _record_capture_wait(info)
+
+    # Rajada: no modo "stable" os frames da janela estável já estão no buffer
+    since = trigger if info["mode"] == "stable" else latest[0] - 1e-6
+    burst = collect_burst(service, since, count) or [latest]
+    return [frame for _, frame in burst]
+
+def capture_frame(camera_index: Optional[int] = None) -> Optional[np.ndarray]:
+    """Captura uma rajada após o gatilho e retorna apenas o frame BGR mais nítido"""
+    frames = capture_frames(camera_index)
+    if not frames:
+        return None
+    best, score = select_sharpest_frame(frames)
+    log_info(f"📸 Frame {best + 1}/{len(frames)} selecionado (nitidez {score:.1f})")
+    return frames[best]
+
+def capture_image(camera_index: Optional[int] = None) -> Optional[np.ndarray]:
+    """Captura uma imagem da câmera persistente e retorna em formato compatível com o modelo"""
+    try:
+        frame = capture_frame(camera_index)
+        if frame is None:
             log_error("Falha ao capturar imagem")
             return None
 
@@ -49,37 +523,36 @@ def capture_image() -> Optional[np.ndarray]:
     except Exception as e:
         log_error(f"ERRO na captura: {e}")
         return None
-    finally:
-        cap.release()
 
-def preprocess_image(frame: np.ndarray) -> Optional[np.ndarray]:
-    """Pré-processa a imagem para o modelo ML"""
+# --- Pré-processamento ---
+# Buffer de redimensionamento reutilizado por thread (os workers capturam em paralelo)
+_buffers = threading.local()
+
+def _resize_buffer(shape: Tuple[int, ...]) -> np.ndarray:
+    buffer = getattr(_buffers, "resize", None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.uint8)
+        _buffers.resize = buffer
+    return buffer
+
+def preprocess_image(frame: np.ndarray, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """
+    Pré-processa a imagem para o modelo ML: redimensiona e converte BGR→RGB, mantendo uint8.
+    A normalização (/255) é feita dentro do grafo do modelo. Se `out` for informado
+    (ex.: uma posição de um batch), o resultado é escrito nele sem nova alocação.
+    """
     try:
-        img = cv2.resize(frame, (224, 224))  # tamanho esperado pelo modelo
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = img.astype("float32") / 255.0  # normalização
-        return img
+        height, width = MLConfig.MODEL_INPUT_SHAPE[:2]
+        resized = cv2.resize(frame, (width, height), dst=_resize_buffer((height, width) + frame.shape[2:]))
+        return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=out)
     except Exception as e:
         log_error(f"ERRO no pré-processamento: {e}")
         return None
 
 def save_image_to_test(image_array, filename_prefix="captured"):
-    """Salva a imagem na pasta 'test/'"""
+    """Salva a imagem na pasta de teste de forma síncrona (a classificação usa o ImageWriter)"""
     try:
-        test_dir = "test"
-        if not os.path.exists(test_dir):
-            os.makedirs(test_dir)
-            log_info(f"Diretório criado: {test_dir}")
-
-        timestamp = int(time.time())
-        filename = f"{test_dir}/{filename_prefix}_{timestamp}.jpg"
-
-        if len(image_array.shape) == 3:
-            image_bgr = cv2.cvtColor((image_array * 255).astype('uint8'), cv2.COLOR_RGB2BGR)
-        else:
-            image_bgr = (image_array * 255).astype('uint8')
-
-        cv2.imwrite(filename, image_bgr)
+        filename, _ = write_image(image_array, CameraConfig.TEST_IMAGE_DIR, filename_prefix)
         log_info(f"Imagem salva em: {filename}")
         return filename
     except Exception as e:
@@ -0,0 +1,360 @@
+import os
+import mmap
+import glob
+import time
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import cv2
+import numpy as np
+from config import CameraConfig, MLConfig
+from utils import get_logger
+
+logger = get_logger("CaptureStore")
+
+# Registro do índice (arquivo .idx ao lado de cada shard), tamanho fixo para leitura com np.fromfile
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "<f8"),    # time.time() da captura
+    ("device", "S32"),
+    ("label", "S16"),        # Classe prevista pelo modelo (nome original, ex.: b"plastic")
+    ("confidence", "<f4"),
+    ("offset", "<u8"),       # Posição do registro no shard
+    ("length", "<u4"),
+    ("height", "<u2"),
+    ("width", "<u2"),
+    ("channels", "<u1"),
+    ("encoding", "<u1"),
+])
+
+# Embeddings do backbone (arquivo .emb ao lado do shard): cabeçalho com a dimensão e
+# linhas (offset do registro no shard, vetor float16)
+_EMB_MAGIC = b"TEMB"
+_EMB_HEADER = 16
+
+def embedding_dtype(dim: int) -> np.dtype:
+    return np.dtype([("offset", "<u8"), ("vector", "<f2", (dim,))])
+
+ENCODINGS = {"raw": 0, "jpg": 1, "png": 2}
+_ENCODING_NAMES = {value: name for name, value in ENCODINGS.items()}
+
+TimeBound = Union[float, datetime, None]
+
+def _shard_paths(directory: str, shard_id: int) -> Tuple[str, str]:
+    base = os.path.join(directory, f"shard-{shard_id:06d}")
+    return f"{base}.bin", f"{base}.idx"
+
+def _embedding_path(directory: str, shard_id: int) -> str:
+    return os.path.join(directory, f"shard-{shard_id:06d}.emb")
+
+def _read_embedding_dim(path: str) -> Optional[int]:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_EMB_HEADER)
+    except OSError:
+        return None
+    if len(header) < _EMB_HEADER or header[:4] != _EMB_MAGIC:
+        return None
+    return int(np.frombuffer(header, dtype="<u4", count=1, offset=4)[0])
+
+def _shard_ids(directory: str) -> List[int]:
+    ids = []
+    for path in glob.glob(os.path.join(directory, "shard-*.idx")):
+        try:
+            ids.append(int(os.path.basename(path)[6:-4]))
+        except ValueError:
+            continue
+    return sorted(ids)
+
+class CaptureStore:
+    """
+    Armazena as capturas em shards append-only de tamanho limitado. Cada shard tem um
+    índice com timestamp, dispositivo, classe prevista, confiança e offset de cada registro.
+    O registro entra no índice só depois que os bytes estão no shard, então um índice
+    nunca aponta para dados incompletos.
+    """
+
+    def __init__(self, directory: str = CameraConfig.IMAGE_SAVE_DIR,
+                 shard_max_bytes: int = CameraConfig.STORE_SHARD_MAX_BYTES):
+        self.directory = directory
+        self.shard_max_bytes = shard_max_bytes
+        self.lock = threading.Lock()
+        self.data_file = None
+        self.index_file = None
+        self.embedding_file = None
+        self.embedding_dim: Optional[int] = None
+        self.shard_id = 0
+        self.shard_size = 0
+        self.records = 0
+
+        os.makedirs(directory, exist_ok=True)
+        ids = _shard_ids(directory)
+        if ids:
+            self._open_shard(ids[-1])
+        else:
+            self._open_shard(1)
+
+    def _open_shard(self, shard_id: int):
+        self.close()
+        data_path, index_path = _shard_paths(self.directory, shard_id)
+
+        # Descarta um registro parcial (queda entre a escrita dos dados e a do índice)
+        index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        index_size -= index_size % INDEX_DTYPE.itemsize
+        end = 0
+        if index_size:
+            with open(index_path, "rb") as f:
+                f.seek(index_size - INDEX_DTYPE.itemsize)
+                last = np.frombuffer(f.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)[0]
+            end = int(last["offset"]) + int(last["length"])
+
+        self.data_file = open(data_path, "ab")
+        self.data_file.truncate(end)
+        self.index_file = open(index_path, "ab")
+        self.index_file.truncate(index_size)
+        self.shard_id = shard_id
+        self.shard_size = end
+        self._recover_embeddings(end)
+
+    def _recover_embeddings(self, end: int):
+        """Descarta embeddings de registros que não chegaram ao índice"""
+        path = _embedding_path(self.directory, self.shard_id)
+        dim = _read_embedding_dim(path)
+        if dim is None:
+            return
+        dtype = embedding_dtype(dim)
+        rows = (os.path.getsize(path) - _EMB_HEADER) // dtype.itemsize
+        offsets = np.fromfile(path, dtype=dtype, offset=_EMB_HEADER, count=rows)["offset"]
+        keep = int(np.searchsorted(offsets, end))  # offsets crescentes (append-only)
+        self.embedding_file = open(path, "ab")
+        self.embedding_file.truncate(_EMB_HEADER + keep * dtype.itemsize)
+        self.embedding_dim = dim
+
+    def _write_embedding(self, offset: int, embedding: np.ndarray):
+        embedding = np.asarray(embedding, dtype=np.float16).ravel()
+        if self.embedding_file is None:
+            path = _embedding_path(self.directory, self.shard_id)
+            self.embedding_file = open(path, "wb")
+            self.embedding_file.write(_EMB_MAGIC + np.uint32(len(embedding)).tobytes() + bytes(_EMB_HEADER - 8))
+            self.embedding_dim = len(embedding)
+        if len(embedding) != self.embedding_dim:
+            logger.warning(f"Embedding de dimensão {len(embedding)} ignorado (shard usa {self.embedding_dim})")
+            return
+        row = np.zeros(1, dtype=embedding_dtype(self.embedding_dim))
+        row["offset"] = offset
+        row["vector"] = embedding
+        self.embedding_file.write(row.tobytes())
+        self.embedding_file.flush()
+
+    def append(self, data: bytes, encoding: str, shape: Sequence[int],
+               device: Optional[str] = None, label: Optional[str] = None,
+               confidence: float = 0.0, timestamp: Optional[float] = None,
+               embedding: Optional[np.ndarray] = None) -> Tuple[int, int, int]:
+        """Acrescenta uma imagem já codificada (e seu embedding); retorna (shard, offset, bytes)"""
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record["timestamp"] = time.time() if timestamp is None else timestamp
+        record["device"] = (device or "").encode()[:32]
+        record["label"] = (label or "").encode()[:16]
+        record["confidence"] = confidence
+        record["length"] = len(data)
+        record["height"], record["width"], record["channels"] = height, width, channels
+        record["encoding"] = ENCODINGS[encoding]
+
+        with self.lock:
+            if self.shard_size and self.shard_size + len(data) > self.shard_max_bytes:
+                self._open_shard(self.shard_id + 1)
+                logger.info(f"Novo shard iniciado: {self.shard_id:06d}")
+            offset = self.shard_size
+            record["offset"] = offset
+            self.data_file.write(data)
+            self.data_file.flush()
+            if embedding is not None:
+                self._write_embedding(offset, embedding)
+            self.index_file.write(record.tobytes())
+            self.index_file.flush()
+            self.shard_size += len(data)
+            self.records += 1
+            return self.shard_id, offset, len(data)
+
+    def append_image(self, image_array: np.ndarray, image_format: str = CameraConfig.IMAGE_FORMAT,
+                     **metadata) -> Tuple[int, int, int]:
+        """Codifica (RGB uint8) e acrescenta a imagem"""
+        if image_format == "raw":
+            data = np.ascontiguousarray(image_array).tobytes()  # pixels crus, lidos direto do mmap
+        else:
+            from image_writer import encode_image
+            data, _ = encode_image(image_array, image_format)
+        return self.append(data, image_format, image_array.shape, **metadata)
+
+    def close(self):
+        for f in (self.data_file, self.index_file, self.embedding_file):
+            if f is not None:
+                f.close()
+        self.data_file = None
+        self.index_file = None
+        self.embedding_file = None
+        self.embedding_dim = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"shard": self.shard_id, "shard_bytes": self.shard_size, "appended": self.records}
+
+# ----------------- Leitura -----------------
+def _to_epoch(value: TimeBound) -> Optional[float]:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+class CaptureStoreReader:
+    """Lê os shards via mmap e entrega batches filtrados por classe, dispositivo ou período"""
+
+    def __init__(self, directory: str = CameraConfig.IMAGE_SAVE_DIR):
+        self.directory = directory
+
+    def shards(self) -> List[int]:
+        return _shard_ids(self.directory)
+
+    def read_index(self, shard_id: int) -> np.ndarray:
+        _, index_path = _shard_paths(self.directory, shard_id)
+        size = os.path.getsize(index_path)
+        # Ignora um registro parcial no fim (escrita em andamento)
+        return np.fromfile(index_path, dtype=INDEX_DTYPE, count=size // INDEX_DTYPE.itemsize)
+
+    def select(self, classes: Optional[Sequence[str]] = None, devices: Optional[Sequence[str]] = None,
+               start: TimeBound = None, end: TimeBound = None,
+               min_confidence: Optional[float] = None,
+               newest: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Para cada shard com registros que passam no filtro, gera (shard, registros do índice)
+        em ordem cronológica. `newest` limita aos N registros mais recentes.
+        """
+        if newest is not None:
+            # Percorre do shard mais novo para o mais antigo até juntar N registros
+            selected, remaining = [], newest
+            for shard_id in reversed(self.shards()):
+                if remaining <= 0:
+                    break
+                for _, records in self._select_shards([shard_id], classes, devices, start, end, min_confidence):
+                    records = records[-remaining:]
+                    selected.append((shard_id, records))
+                    remaining -= len(records)
+            yield from reversed(selected)
+            return
+        yield from self._select_shards(self.shards(), classes, devices, start, end, min_confidence)
+
+    def _select_shards(self, shard_ids, classes, devices, start, end, min_confidence):
+        start, end = _to_epoch(start), _to_epoch(end)
+        for shard_id in shard_ids:
+            index = self.read_index(shard_id)
+            if not len(index):
+                continue
+            # Shards são cronológicos: pula sem olhar registro a registro quando fora do período
+            if (start is not None and index["timestamp"][-1] < start) or \
+               (end is not None and index["timestamp"][0] >= end):
+                continue
+
+            mask = np.ones(len(index), dtype=bool)
+            if classes is not None:
+                mask &= np.isin(index["label"], [c.encode() for c in classes])
+            if devices is not None:
+                mask &= np.isin(index["device"], [d.encode() for d in devices])
+            if start is not None:
+                mask &= index["timestamp"] >= start
+            if end is not None:
+                mask &= index["timestamp"] < end
+            if min_confidence is not None:
+                mask &= index["confidence"] >= min_confidence
+            if mask.any():
+                yield shard_id, index[mask]
+
+    def read_embeddings(self, shard_id: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(offsets, vetores float16 (N, D)) do shard, ou None se ele não tem embeddings"""
+        path = _embedding_path(self.directory, shard_id)
+        dim = _read_embedding_dim(path)
+        if dim is None:
+            return None
+        dtype = embedding_dtype(dim)
+        rows = np.fromfile(path, dtype=dtype, offset=_EMB_HEADER,
+                           count=(os.path.getsize(path) - _EMB_HEADER) // dtype.itemsize)
+        return rows["offset"], rows["vector"]
+
+    def iter_embeddings(self, **filters) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Gera (registros do índice, embeddings float32 (N, D)) dos registros filtrados que têm embedding"""
+        for shard_id, records in self.select(**filters):
+            embeddings = self.read_embeddings(shard_id)
+            if embeddings is None:
+                continue
+            offsets, vectors = embeddings
+            if not len(offsets):
+                continue
+            positions = np.minimum(np.searchsorted(offsets, records["offset"]), len(offsets) - 1)
+            found = offsets[positions] == records["offset"]
+            if found.any():
+                yield records[found], vectors[positions[found]].astype(np.float32)
+
+    def count(self, **filters) -> int:
+        return sum(len(records) for _, records in self.select(**filters))
+
+    def iter_batches(self, batch_size: int = 32,
+                     image_shape: Sequence[int] = MLConfig.MODEL_INPUT_SHAPE,
+                     **filters) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Gera (imagens uint8 RGB (B, H, W, C), registros do índice). Registros "raw" são
+        copiados direto do mmap; os demais são decodificados. Imagens de outro tamanho
+        são redimensionadas para `image_shape`.
+        """
+        image_shape = tuple(image_shape)
+        height, width = image_shape[:2]
+        batch = np.empty((batch_size,) + image_shape, dtype=np.uint8)
+        batch_records = []
+
+        for shard_id, records in self.select(**filters):
+            data_path, _ = _shard_paths(self.directory, shard_id)
+            with open(data_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for record in records:
+                    image_array = self._decode(mm, record)
+                    if image_array is None:
+                        logger.warning(f"Registro ilegível no shard {shard_id:06d} (offset {record['offset']})")
+                        continue
+                    if image_array.shape[:2] != (height, width):
+                        image_array = cv2.resize(image_array, (width, height))
+                    batch[len(batch_records)] = image_array
+                    del image_array  # libera a view do mmap antes de fechá-lo
+                    batch_records.append(record)
+                    if len(batch_records) == batch_size:
+                        yield batch.copy(), np.array(batch_records, dtype=INDEX_DTYPE)
+                        batch_records = []
+
+        if batch_records:
+            yield batch[:len(batch_records)].copy(), np.array(batch_records, dtype=INDEX_DTYPE)
+
+    @staticmethod
+    def _decode(mm: mmap.mmap, record) -> Optional[np.ndarray]:
+        offset, length = int(record["offset"]), int(record["length"])
+        raw = np.frombuffer(mm, dtype=np.uint8, count=length, offset=offset)
+        encoding = _ENCODING_NAMES.get(int(record["encoding"]))
+        if encoding == "raw":
+            shape = (int(record["height"]), int(record["width"]), int(record["channels"]))
+            return raw.reshape(shape)
+        image_bgr = cv2.imdecode(raw, cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            return None
+        return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+# Instância compartilhada (um único escritor por diretório)
+_store: Optional[CaptureStore] = None
+_store_lock = threading.Lock()
+
+def get_capture_store() -> CaptureStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CaptureStore()
+        return _store
+
+def close_capture_store():
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
@@ -1,21 +1,45 @@
-from typing import List
+from typing import Dict, List, Tuple
 
 class UDPConfig:    
     # --- UDP ---
     UDP_PORT = 8888
     UDP_BUFFER_SIZE = 1024
     UDP_SOCKET_TIMEOUT = 1.0
+    SOCKET_RCVBUF = 1 << 20  # Buffer do kernel para rajadas de pacotes (bytes)
+    MSG_QUEUE_SIZE = 256  # Mensagens recebidas aguardando o processador (excedentes são descartadas)
+    TRANSPORT = "asyncio"         # "asyncio" (DatagramProtocol, handlers como tasks) ou "thread" (listener bloqueante)
+    DECRYPT_IN_EXECUTOR = False   # (asyncio) Decifra os pacotes num pool de threads em vez do event loop
+    DECRYPT_WORKERS = 2
 
     # --- Segurança ---
     AUTH_KEY = "TR4SH_4I_S3CUR3_K3Y_2024_M4K3DC_D3C0747387"
-    TOKEN_TIMEOUT = 30  # segundos
     AUTH_TIMEOUT = 5  # Adicionado
+    REPLAY_WINDOW = 64        # Contadores fora de ordem aceitos por sessão (anti-replay)
+    HANDSHAKE_RETRY = 1.0     # Reenvia o HELLO se a sessão não abrir nesse tempo (s)
+    PENDING_MESSAGES = 16     # Mensagens por destino aguardando o handshake
+
+    # --- Entrega confiável (MOVIMENTO_DETECTADO, WASTE_TYPE) ---
+    RELIABLE_WINDOW = 8           # Mensagens sem ack por par; as demais aguardam vaga
+    RELIABLE_MAX_RETRIES = 6      # Retransmissões antes de desistir da mensagem
+    RELIABLE_INITIAL_RTO = 0.25   # RTO antes da primeira medida de RTT do par (s)
+    RELIABLE_MIN_RTO = 0.03       # Piso do RTO (s): RTT de LAN/Wi-Fi, não de Internet
+    RELIABLE_MAX_RTO = 1.0        # Teto do RTO com backoff (s)
+    RELIABLE_DEDUP_SIZE = 128     # IDs recentes lembrados por par (>= RELIABLE_WINDOW do par)
+
+    # --- Descoberta (anúncio/resposta) ---
+    PEER_CACHE_PATH = "data/peers.json"  # Último endereço conhecido de cada ESP32
+    DISCOVERY_CACHE_TIMEOUT = 0.5 # Espera pela resposta dos pares do cache antes do broadcast (s)
+    DISCOVERY_FAST_INTERVAL = 0.5 # Primeiro intervalo entre anúncios até parear; dobra a cada um (s)
+    ANNOUNCE_INTERVAL = 30.0      # Anúncios (unicast aos pares conhecidos) depois de pareado (s)
 
 class CameraConfig:
     CAMERA_ID: int = 1
     IMAGE_SAVE_DIR: str = "data/captured"
     IMAGE_SAVE_PATH: str = f"{IMAGE_SAVE_DIR}/waste_capture"
-    IMAGE_FORMAT: str = "jpg"
+    IMAGE_FORMAT: str = "jpg"                 # "jpg", "png" ou "raw" (.npy sem compressão)
+    JPEG_QUALITY: int = 90
+    PNG_COMPRESSION: int = 3                  # 0 (rápido) a 9 (menor arquivo)
+    TEST_IMAGE_DIR: str = "test"
     
     # --- Dimensões ---
     IMAGE_WIDTH: int = 512
@@ -33,6 +57,49 @@ class CameraConfig:
     CAMERA_WARMUP_ATTEMPTS: int = 10
     CAMERA_WARMUP_DELAY: float = 0.5
 
+    # --- Serviço de câmera (grabber contínuo) ---
+    FRAME_BUFFER_SIZE: int = 30          # Frames mantidos no buffer circular
+    FRAME_TIMEOUT: float = 2.0           # Espera máxima por um frame novo (s)
+    CAMERA_REOPEN_DELAY: float = 2.0     # Intervalo entre tentativas de reabrir (s)
+    CAMERA_MAX_READ_FAILURES: int = 5    # Leituras falhas seguidas antes de reabrir
+
+    # --- Estabilização de exposição ---
+    CAPTURE_MODE: str = "stable"              # "stable" (convergência medida) ou "fixed" (timer)
+    FIXED_STABILIZATION_SECONDS: int = 3      # Usado apenas no modo "fixed"
+    STABILITY_FRAMES: int = 4                 # Frames consecutivos dentro da tolerância
+    STABILITY_MAX_WAIT: float = 3.0           # Espera máxima pela convergência (s)
+    STABILITY_LUMA_TOLERANCE: float = 2.0     # Variação máxima da luminância média (0-255)
+    STABILITY_HIST_TOLERANCE: float = 0.05    # Distância de Bhattacharyya máxima entre histogramas
+    STABILITY_EXPOSURE_TOLERANCE: float = 0.0 # Variação máxima de CAP_PROP_EXPOSURE
+    STATS_WIDTH: int = 160                    # Largura da cópia reduzida usada nas estatísticas
+
+    # --- Seleção do frame mais nítido ---
+    BURST_SIZE: int = 5                       # Frames avaliados após o gatilho
+    BURST_MAX_WAIT: float = 0.5               # Espera máxima para completar a rajada (s)
+    SHARPNESS_WIDTH: int = 320                # Largura da cópia reduzida usada no score de nitidez
+
+    # --- Modelo de fundo (lixeira vazia) ---
+    USE_BACKGROUND_MODEL: bool = True         # Recorta o objeto e dispensa gatilhos sem objeto
+    BG_WIDTH: int = 160                       # Largura da cópia reduzida usada no fundo
+    BG_LEARNING_RATE: float = 0.02            # Peso de cada frame ocioso na média móvel
+    BG_UPDATE_INTERVAL: float = 1.0           # Intervalo entre atualizações do fundo (s)
+    BG_SETTLE_TIME: float = 5.0               # Sem aprender por este tempo após uma captura (s)
+    BG_MIN_UPDATES: int = 10                  # Atualizações antes de usar o fundo
+    BG_DIFF_THRESHOLD: float = 25.0           # Diferença (0-255) para um pixel ser primeiro plano
+    BG_MIN_OBJECT_AREA: float = 0.01          # Área mínima de uma região de objeto (fração do frame)
+    BG_RELEARN_AREA: float = 0.5              # Cena ociosa com mais primeiro plano que isso "mudou"
+    BG_RELEARN_UPDATES: int = 30              # Atualizações seguidas com a cena mudada para reaprender
+    BG_CROP_MARGIN: float = 0.15              # Margem em volta da caixa do objeto (fração do lado)
+    BG_MIN_CROP: float = 0.25                 # Lado mínimo do recorte (fração do frame)
+
+    # --- Gravação assíncrona das capturas ---
+    WRITER_QUEUE_SIZE: int = 64               # Imagens aguardando gravação
+    WRITER_OVERFLOW_POLICY: str = "drop_oldest"  # Fila cheia: "drop_oldest" ou "drop_newest"
+
+    # --- Capture store (shards append-only em IMAGE_SAVE_DIR) ---
+    USE_CAPTURE_STORE: bool = True            # False: um arquivo por captura em TEST_IMAGE_DIR
+    STORE_SHARD_MAX_BYTES: int = 256 * 1024 * 1024
+
 class MLConfig:
     # --- Tipos de Resíduo ---
     WASTE_TYPES: List[str] = ["PAPELAO", "VIDRO", "METAL", "PAPEL", "PLASTICO", "LIXO"]
@@ -42,8 +109,85 @@ class MLConfig:
     
     # --- Modelo ---
     MODEL_INPUT_SHAPE = (224, 224, 3)  # Modelo treinado usa 224x224
+    MODEL_WEIGHTS_PATH: str = "weights/weights-029-0.83.weights.h5"
+    USE_MODEL_CACHE: bool = True              # Carrega o artefato SavedModel exportado
+    MODEL_CACHE_DIR: str = "data/model_cache"
+
+    # --- Backend de inferência ---
+    INFERENCE_BACKEND: str = "keras"          # "keras" (grafo TF) ou "tflite"
+    TFLITE_QUANTIZATION: str = "dynamic"      # "float32", "float16", "dynamic", "int8" (só ops int8) ou "int8_fallback"
+    TFLITE_NUM_THREADS: int = 4
+    TFLITE_BATCH_SIZES: Tuple[int, ...] = (1, 2, 4, 8, 16)  # Um interpretador por tamanho; o batch é completado até o próximo
+    TFLITE_CALIBRATION_DIR: str = "test"      # Capturas usadas na calibração int8/int8_fallback
+    TFLITE_CALIBRATION_SIZE: int = 200
+
+    # --- Workers de inferência em processos separados ---
+    INFERENCE_MODE: str = "thread"            # "thread" (no processo principal) ou "process"
+    INFERENCE_WORKERS: int = 1                # Processos de inferência
+    WORKER_START_TIMEOUT: float = 300.0       # Carga do modelo no worker (s)
+    WORKER_REQUEST_TIMEOUT: float = 30.0      # Espera máxima por um batch (s)
+    WORKER_RESTART_DELAY: float = 5.0         # Intervalo entre tentativas de reinício (s)
     USE_MOCK_MODEL = False  # Agora usa o modelo real
 
+    # --- Ensemble multi-frame ---
+    ENSEMBLE_SIZE: int = 1             # K frames por classificação (1 = desativado)
+    ENSEMBLE_SOURCE: str = "burst"     # "burst" (rajada da câmera) ou "augment" (flips/recortes)
+    ENSEMBLE_COMBINE: str = "mean"     # "mean" (média das softmax) ou "vote" (maioria)
+
+    # --- Scheduler de inferência (micro-batching) ---
+    SCHEDULER_MAX_BATCH: int = 16         # Imagens por forward pass
+    SCHEDULER_MAX_LATENCY: float = 0.05   # Latência máxima adicionada ao primeiro pedido (s)
+    INFERENCE_TIMEOUT: float = 30.0       # Espera máxima pelo resultado de um pedido (s)
+
+    # --- Cascata de modelos (estágio barato antes do TrashNetModel) ---
+    USE_CASCADE: bool = False
+    # (arquitetura do MODEL_REGISTRY, pesos, confiança top-1 mínima para aceitar a resposta),
+    # em ordem; o que nenhum estágio aceitar segue para o modelo completo
+    CASCADE_STAGES: List[Tuple[str, str, float]] = [
+        ("trashnet_lite", "weights/trashnet-lite.weights.h5", 0.9),
+    ]
+
+    # --- Troca de modelo sem parada (hot-swap) ---
+    DEPLOY_REQUEST_PATH: str = "data/deploy.txt"  # Caminho dos pesos/artefato novos; verificado periodicamente
+    SHADOW_MIN_IMAGES: int = 200          # Imagens comparadas em sombra antes de decidir (0 = troca direta)
+    SHADOW_TIMEOUT: float = 3600.0        # Desiste da avaliação em sombra após esse tempo (s)
+    SHADOW_QUEUE_SIZE: int = 4            # Batches aguardando o candidato (os mais antigos são descartados)
+    SHADOW_MIN_AGREEMENT: float = 0.9     # Concordância top-1 mínima com o modelo atual
+    PROBATION_MIN_IMAGES: int = 50        # Imagens antes de checar o modelo novo para rollback
+    PROBATION_IMAGES: int = 500           # Imagens até liberar o modelo anterior
+    ROLLBACK_ERROR_MARGIN: float = 0.02   # Aumento tolerado na taxa de erro de inferência
+    ROLLBACK_LATENCY_RATIO: float = 1.5   # Latência média por imagem tolerada (x a do modelo anterior)
+
+    # --- Backbone/cabeça e classificador kNN ---
+    CLASSIFIER_MODE: str = "softmax"      # "softmax" (cabeça treinada) ou "knn" (índice local de embeddings)
+    STORE_EMBEDDINGS: bool = True         # Grava o embedding do backbone ao lado de cada captura
+    EMBEDDING_INDEX_PATH: str = "data/embedding_index.npz"
+    KNN_K: int = 10                       # Vizinhos consultados
+    KNN_TEMPERATURE: float = 0.05         # Suavização dos pesos por similaridade de cosseno
+
+    # --- Cache de resultados por hash perceptual ---
+    USE_RESULT_CACHE: bool = True
+    RESULT_CACHE_HASH: str = "phash"      # "phash" (mais robusto a ruído) ou "dhash" (mais barato)
+    RESULT_CACHE_MAX_DISTANCE: int = 5    # Distância de Hamming máxima (bits de 64) para um acerto
+    RESULT_CACHE_TTL: float = 10.0        # Validade de um resultado (s)
+    RESULT_CACHE_SIZE: int = 16           # Entradas por dispositivo
+
+class PipelineConfig:
+    # --- Dispositivos ---
+    # Capturas simultâneas. Uma captura ocupa a thread durante toda a convergência da
+    # exposição e a rajada, então são necessárias tantas threads quanto lixeiras: o pool
+    # usa max(WORKER_THREADS, len(CAMERA_MAP)); acima disso as lixeiras passam a esperar
+    WORKER_THREADS: int = 10
+    CAMERA_MAP: Dict[str, int] = {}       # ID/IP do dispositivo -> índice da câmera
+
+    # --- Backpressure de gatilhos ---
+    TRIGGER_DEADLINE: float = 8.0         # Vida útil de um MOVIMENTO_DETECTADO (s)
+    COALESCE_WINDOW: float = 2.0          # Gatilhos pendentes mais próximos que isso são fundidos (s)
+    DEVICE_QUEUE_SIZE: int = 2            # Gatilhos pendentes por dispositivo
+
+    # --- Métricas ---
+    STATS_LOG_INTERVAL: int = 60  # segundos
+
 class CommunicationConfig:
     # --- Prefixos de Mensagem ---
     MESSAGE_PREFIXES = {
@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from config import CameraConfig, PipelineConfig
+from utils import RollingStats
+
+class DeviceState:
+    """Estado de uma lixeira (ESP32) conhecida pelo PC"""
+
+    def __init__(self, device_id: str, addr: Tuple[str, int], camera_index: int):
+        self.device_id = device_id
+        self.ip = addr[0]
+        self.port = addr[1]
+        self.camera_index = camera_index
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+        # Classificação em andamento
+        self.in_flight = False
+        self.in_flight_since: Optional[float] = None
+        self.deadline: Optional[float] = None  # time.monotonic() após o qual o pedido é descartado
+        self.captured = False                  # A captura do pedido em andamento já terminou
+
+        # Gatilhos aguardando (recebido_em, prazo), limitados por DEVICE_QUEUE_SIZE
+        self.pending = deque()
+
+        # Estatísticas
+        self.classifications = 0
+        self.failures = 0
+        self.no_object = 0
+        self.coalesced = 0
+        self.dropped_stale = 0
+        self.dropped_overflow = 0
+        self.latency = RollingStats(window=200)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ip": self.ip,
+            "camera_index": self.camera_index,
+            "last_seen": round(time.time() - self.last_seen, 1),
+            "in_flight": self.in_flight,
+            "pending": len(self.pending),
+            "classifications": self.classifications,
+            "failures": self.failures,
+            "no_object": self.no_object,
+            "coalesced": self.coalesced,
+            "dropped_stale": self.dropped_stale,
+            "dropped_overflow": self.dropped_overflow,
+            "latency": self.latency.summary(),
+        }
+
+class DeviceRegistry:
+    """Registro thread-safe dos dispositivos, indexado por ID (por padrão o IP)"""
+
+    def __init__(self, camera_map: Optional[Dict[str, int]] = None):
+        self.camera_map = camera_map if camera_map is not None else PipelineConfig.CAMERA_MAP
+        self.devices: Dict[str, DeviceState] = {}
+        self.by_ip: Dict[str, str] = {}  # IP -> ID anunciado por último desse endereço
+        self.lock = threading.Lock()
+
+    def _camera_for(self, device_id: str, ip: str) -> int:
+        if device_id in self.camera_map:
+            return self.camera_map[device_id]
+        return self.camera_map.get(ip, CameraConfig.CAMERA_ID)
+
+    def touch(self, addr: Tuple[str, int], device_id: Optional[str] = None) -> Tuple[DeviceState, bool]:
+        """
+        Registra atividade do dispositivo; retorna (estado, é_novo). Sem `device_id`, vale o
+        último ID anunciado desse IP (ou o próprio IP), então o ID sobrevive a uma troca de IP.
+        """
+        ip = addr[0]
+        with self.lock:
+            device_id = device_id or self.by_ip.get(ip, ip)
+            device = self.devices.get(device_id)
+            if device is None and device_id != ip and ip in self.devices:
+                # Conhecido só pelo IP até anunciar o ID: o estado passa para o ID
+                device = self.devices.pop(ip)
+                device.device_id = device_id
+                device.camera_index = self._camera_for(device_id, ip)
+                self.devices[device_id] = device
+            is_new = device is None
+            if is_new:
+                device = DeviceState(device_id, addr, self._camera_for(device_id, ip))
+                self.devices[device_id] = device
+            else:
+                if device.ip != ip and self.by_ip.get(device.ip) == device_id:
+                    # Trocou de IP: o endereço antigo pode ir para outro dispositivo
+                    del self.by_ip[device.ip]
+                device.ip, device.port = addr[0], addr[1]
+            if device_id != ip:
+                self.by_ip[ip] = device_id
+            device.last_seen = time.time()
+            return device, is_new
+
+    def get(self, device_id: str) -> Optional[DeviceState]:
+        with self.lock:
+            return self.devices.get(device_id)
+
+    def all(self) -> List[DeviceState]:
+        with self.lock:
+            return list(self.devices.values())
+
+    # ----------------- Gatilhos -----------------
+    def _begin(self, device: DeviceState, received_at: float, deadline: float):
+        device.in_flight = True
+        device.in_flight_since = received_at
+        device.deadline = deadline
+        device.captured = False
+
+    def submit_trigger(self, device: DeviceState, received_at: float) -> str:
+        """
+        Aplica a política de backpressure a um MOVIMENTO_DETECTADO e retorna a ação:
+        "start" (iniciar agora), "coalesced" (fundido a um pedido existente),
+        "queued" (aguarda o pedido em andamento), "stale" ou "overflow" (descartado).
+        """
+        now = time.monotonic()
+        deadline = received_at + PipelineConfig.TRIGGER_DEADLINE
+        with self.lock:
+            if now > deadline:
+                device.dropped_stale += 1
+                return "stale"
+
+            if not device.in_flight:
+                self._begin(device, received_at, deadline)
+                return "start"
+
+            # A captura ainda não aconteceu: o pedido em andamento já verá o item
+            if not device.captured:
+                device.coalesced += 1
+                return "coalesced"
+
+            # Gatilho repetido logo após outro pendente: mesmo item
+            if device.pending and received_at - device.pending[-1][0] <= PipelineConfig.COALESCE_WINDOW:
+                device.pending[-1] = (received_at, deadline)
+                device.coalesced += 1
+                return "coalesced"
+
+            if len(device.pending) >= PipelineConfig.DEVICE_QUEUE_SIZE:
+                device.dropped_overflow += 1
+                return "overflow"
+
+            device.pending.append((received_at, deadline))
+            return "queued"
+
+    def mark_captured(self, device: DeviceState):
+        with self.lock:
+            device.captured = True
+
+    def is_expired(self, device: DeviceState) -> bool:
+        """True (e contabiliza o descarte) se o pedido em andamento passou do prazo"""
+        with self.lock:
+            if device.deadline is not None and time.monotonic() > device.deadline:
+                device.dropped_stale += 1
+                return True
+            return False
+
+    def finish(self, device: DeviceState, success: bool, dropped: bool = False, no_object: bool = False) -> bool:
+        """
+        Encerra o pedido em andamento (`dropped` = descartado por prazo, já contabilizado;
+        `no_object` = gatilho sem objeto na cena, inferência dispensada).
+        Se houver um gatilho pendente dentro do prazo, ele já é marcado como em andamento
+        e a função retorna True (o chamador o inicia).
+        """
+        now = time.monotonic()
+        with self.lock:
+            if success and device.in_flight_since is not None:
+                device.latency.add(now - device.in_flight_since)
+            if success:
+                device.classifications += 1
+            elif no_object:
+                device.no_object += 1
+            elif not dropped:
+                device.failures += 1
+
+            device.in_flight = False
+            device.in_flight_since = None
+            device.deadline = None
+            device.captured = False
+
+            while device.pending:
+                received_at, deadline = device.pending.popleft()
+                if now > deadline:
+                    device.dropped_stale += 1
+                    continue
+                self._begin(device, received_at, deadline)
+                return True
+            return False
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.devices)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            devices = list(self.devices.values())
+            return {
+                "coalesced": sum(d.coalesced for d in devices),
+                "dropped_stale": sum(d.dropped_stale for d in devices),
+                "dropped_overflow": sum(d.dropped_overflow for d in devices),
+                "devices": {device.device_id: device.to_dict() for device in devices},
+            }
@@ -0,0 +1,158 @@
+"""
+Descoberta por anúncio/resposta entre PC e ESP32, com cache dos últimos endereços.
+
+    ESP32 -> "PING:<id>"        anúncio/sonda do ESP32; o PC responde "PC_ONLINE"
+    PC    -> "PC_ONLINE"        anúncio do PC; o ESP32 responde "ESP_ONLINE:<id>"
+    ESP32 -> "ESP_ONLINE:<id>"  sem resposta (encerra a troca)
+
+O `<id>` identifica o ESP32 independente do IP, então uma troca de endereço por DHCP só
+atualiza o cache. Na inicialização o PC manda unicast aos pares do cache (não depende de
+broadcast, que no Wi-Fi não tem retransmissão) e só então anuncia em broadcast, com
+intervalo dobrando até parear; depois segue anunciando em baixa taxa, em unicast aos pares
+conhecidos. Broadcast não tem sessão: cada um abre um handshake com todas as lixeiras que
+responderem, então depois de parear ele não é mais usado (uma lixeira nova se anuncia
+sozinha com PING).
+"""
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, Optional
+from utils import get_logger
+from config import UDPConfig
+from udp_communicator import BROADCAST
+
+logger = get_logger("Discovery")
+
+class PeerCache:
+    """Último IP de cada par (ID -> IP), persistido em JSON só quando um endereço muda"""
+
+    def __init__(self, path: str = UDPConfig.PEER_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.peers: Dict[str, Dict[str, float]] = self._load()
+        self.writes = 0
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                peers = json.load(f)
+            return {str(peer_id): entry for peer_id, entry in peers.items() if "ip" in entry}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Cache de pares inválido em {self.path}, ignorando: {e}")
+            return {}
+
+    def update(self, peer_id: str, ip: str) -> bool:
+        """Registra o endereço do par; retorna True se ele mudou (e o arquivo foi regravado)"""
+        with self.lock:
+            entry = self.peers.get(peer_id)
+            if entry is not None and entry["ip"] == ip:
+                entry["seen"] = time.time()
+                return False
+            self.peers[peer_id] = {"ip": ip, "seen": time.time()}
+            self._save_locked()
+            return True
+
+    def addresses(self) -> Dict[str, str]:
+        with self.lock:
+            return {peer_id: entry["ip"] for peer_id, entry in self.peers.items()}
+
+    def _save_locked(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.peers, f)
+            os.replace(tmp_path, self.path)
+            self.writes += 1
+        except OSError as e:
+            logger.error(f"Erro ao gravar o cache de pares em {self.path}: {e}")
+
+class Announcer:
+    """
+    Thread que anuncia `message`: unicast aos pares do cache, depois broadcast com
+    intervalo DISCOVERY_FAST_INTERVAL dobrando até ANNOUNCE_INTERVAL. Depois de pareado, a
+    cada ANNOUNCE_INTERVAL, unicast aos pares do cache (nas sessões já abertas com eles).
+    `mark_paired` é chamado quando um par responde; `wait_for_peer` bloqueia até isso (sem polling).
+    """
+
+    def __init__(self, send: Callable[[str, str], None], peers: PeerCache,
+                 message: str = "PC_ONLINE", broadcast: str = BROADCAST):
+        self.send = send
+        self.peers = peers
+        self.message = message
+        self.broadcast = broadcast
+        self.paired = threading.Event()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = threading.Thread(target=self._run, name="discovery", daemon=True)
+        self.started_at: Optional[float] = None
+        self.time_to_pair: Optional[float] = None
+        self.announcements = 0
+
+    def start(self):
+        self.running = True
+        self.started_at = time.monotonic()
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def mark_paired(self):
+        if not self.paired.is_set():
+            self.time_to_pair = time.monotonic() - self.started_at if self.started_at else None
+            self.paired.set()
+            logger.info(f"Par encontrado em {self.time_to_pair:.3f}s" if self.time_to_pair is not None
+                        else "Par encontrado")
+
+    def announce_now(self):
+        """Antecipa o próximo anúncio"""
+        self.wakeup.set()
+
+    def wait_for_peer(self, timeout: Optional[float] = None) -> bool:
+        return self.paired.wait(timeout)
+
+    def _run(self):
+        cached = sorted(set(self.peers.addresses().values()))
+        for ip in cached:
+            self._announce(ip)
+        # Os pares do cache costumam responder em um RTT; o broadcast fica para quem não respondeu
+        if cached and self.paired.wait(UDPConfig.DISCOVERY_CACHE_TIMEOUT):
+            logger.info(f"Pareado pelo cache ({len(cached)} endereço(s)), sem broadcast")
+            delay = UDPConfig.ANNOUNCE_INTERVAL
+        else:
+            delay = UDPConfig.DISCOVERY_FAST_INTERVAL
+            self._announce(self.broadcast)
+
+        while self.running:
+            if self.wakeup.wait(delay):
+                self.wakeup.clear()
+            if not self.running:
+                break
+            known = sorted(set(self.peers.addresses().values())) if self.paired.is_set() else []
+            if known:
+                for ip in known:
+                    self._announce(ip)
+                delay = UDPConfig.ANNOUNCE_INTERVAL
+            else:
+                self._announce(self.broadcast)
+                delay = min(delay * 2, UDPConfig.ANNOUNCE_INTERVAL)
+
+    def _announce(self, ip: str):
+        try:
+            self.send(self.message, ip)
+            self.announcements += 1
+        except Exception as e:
+            logger.error(f"Erro ao anunciar para {ip}: {e}")
+
+    def get_stats(self):
+        return {
+            "paired": self.paired.is_set(),
+            "time_to_pair": self.time_to_pair,
+            "announcements": self.announcements,
+            "cached_peers": len(self.peers.addresses()),
+            "cache_writes": self.peers.writes,
+        }
@@ -0,0 +1,132 @@
+"""
+Índice local de embeddings para o classificador por vizinhos mais próximos (kNN).
+
+O índice é montado com capturas rotuladas do próprio local e substitui a cabeça softmax
+quando MLConfig.CLASSIFIER_MODE = "knn": adapta o sistema ao lixo de cada local sem retreino.
+
+Uso: python embedding_index.py --folder rotuladas/ [--weights caminho.h5] [--out data/embedding_index.npz]
+     python embedding_index.py --store [--min-confidence 0.9]   (rótulos = classe prevista na captura)
+"""
+import os
+import argparse
+from typing import List, Optional, Sequence
+import numpy as np
+from config import CameraConfig, MLConfig
+from utils import get_logger
+
+logger = get_logger("EmbeddingIndex")
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class EmbeddingIndex:
+    """Embeddings normalizados (N, D) com rótulos; busca por similaridade de cosseno vetorizada"""
+
+    def __init__(self, vectors: np.ndarray, labels: np.ndarray, classes: Sequence[str],
+                 k: int = MLConfig.KNN_K, temperature: float = MLConfig.KNN_TEMPERATURE):
+        self.vectors = normalize_rows(vectors)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.classes = list(classes)
+        self.k = k
+        self.temperature = temperature
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def predict_proba(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        (N, D) → (N, classes): os k vizinhos mais similares votam com peso
+        softmax(similaridade / temperatura), normalizado como uma distribuição.
+        """
+        queries = normalize_rows(embeddings)
+        similarities = queries @ self.vectors.T  # (N, M)
+        k = min(self.k, similarities.shape[1])
+        neighbours = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(similarities, neighbours, axis=1)
+
+        weights = np.exp((top - top.max(axis=1, keepdims=True)) / self.temperature)
+        probabilities = np.zeros((len(queries), len(self.classes)), dtype=np.float32)
+        rows = np.repeat(np.arange(len(queries)), k)
+        np.add.at(probabilities, (rows, self.labels[neighbours].ravel()), weights.ravel())
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, vectors=self.vectors.astype(np.float16), labels=self.labels,
+                 classes=np.array(self.classes))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = MLConfig.EMBEDDING_INDEX_PATH, **kwargs) -> "EmbeddingIndex":
+        with np.load(path) as data:
+            return cls(data["vectors"], data["labels"], [str(c) for c in data["classes"]], **kwargs)
+
+def load_embedding_index(path: str = MLConfig.EMBEDDING_INDEX_PATH) -> Optional[EmbeddingIndex]:
+    """Índice do kNN, ou None se ainda não foi montado"""
+    if not os.path.exists(path):
+        logger.error(f"Índice de embeddings não encontrado em {path}; usando a cabeça softmax")
+        return None
+    index = EmbeddingIndex.load(path)
+    logger.info(f"Índice kNN carregado: {len(index)} embeddings de {path}")
+    return index
+
+# ----------------- Montagem -----------------
+def build_from_folder(model, root: str, batch_size: int = 32) -> EmbeddingIndex:
+    """Embeddings do backbone para root/<classe>/*.jpg (decodificação paralela do evaluate.py)"""
+    from evaluate import folder_dataset, list_labelled_images
+
+    paths, labels = list_labelled_images(root, model.classes)
+    keep = [i for i, label in enumerate(labels) if label >= 0]
+    paths, labels = [paths[i] for i in keep], [labels[i] for i in keep]
+    if not paths:
+        raise SystemExit(f"Nenhuma imagem rotulada em {root}")
+
+    vectors, targets = [], []
+    for images, batch_labels in folder_dataset(paths, labels, batch_size, decoder="opencv").as_numpy_iterator():
+        vectors.append(model.embed_batch(images))
+        targets.append(batch_labels)
+    return EmbeddingIndex(np.concatenate(vectors), np.concatenate(targets), model.classes)
+
+def build_from_store(classes: Sequence[str], directory: str = CameraConfig.IMAGE_SAVE_DIR,
+                     **filters) -> EmbeddingIndex:
+    """Reaproveita os embeddings gravados ao lado das capturas (sem rodar o backbone)"""
+    from capture_store import CaptureStoreReader
+
+    lookup = {name.encode(): i for i, name in enumerate(classes)}
+    vectors: List[np.ndarray] = []
+    labels: List[np.ndarray] = []
+    for records, embeddings in CaptureStoreReader(directory).iter_embeddings(**filters):
+        known = np.array([label in lookup for label in records["label"]], dtype=bool)
+        vectors.append(embeddings[known])
+        labels.append(np.array([lookup[label] for label in records["label"][known]], dtype=np.int64))
+    if not vectors or not sum(len(v) for v in vectors):
+        raise SystemExit(f"Nenhum embedding rotulado no capture store em {directory}")
+    return EmbeddingIndex(np.concatenate(vectors), np.concatenate(labels), classes)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monta o índice de embeddings do classificador kNN")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--folder", help="Pasta com subpastas por classe")
+    source.add_argument("--store", nargs="?", const=CameraConfig.IMAGE_SAVE_DIR, help="Diretório do capture store")
+    parser.add_argument("--weights", default=MLConfig.MODEL_WEIGHTS_PATH)
+    parser.add_argument("--min-confidence", type=float, default=None, help="(store) Confiança mínima na captura")
+    parser.add_argument("--out", default=MLConfig.EMBEDDING_INDEX_PATH)
+    args = parser.parse_args()
+
+    from ml_model import TrashNetModel
+
+    if args.folder:
+        model = TrashNetModel(args.weights)
+        if not model.supports_embeddings:
+            raise SystemExit("O backend configurado não expõe embeddings (use keras ou o artefato em cache)")
+        index = build_from_folder(model, args.folder)
+    else:
+        index = build_from_store(TrashNetModel.CLASSES, args.store, min_confidence=args.min_confidence)
+
+    index.save(args.out)
+    counts = np.bincount(index.labels, minlength=len(index.classes))
+    logger.info(f"Índice gravado em {args.out}: " +
+                ", ".join(f"{name} {count}" for name, count in zip(index.classes, counts)))
@@ -0,0 +1,328 @@
+"""
+Avaliação em lote do TrashNetModel: pipeline tf.data com decodificação e redimensionamento
+em paralelo, batches e prefetch, passando pelo mesmo predict_batch da produção.
+
+Fontes:
+  --folder pasta/     subpastas com o nome da classe (pasta/glass/*.jpg); imagens soltas
+                      na raiz entram sem rótulo (só throughput e distribuição das predições)
+  --store [dir]       capture store; o rótulo é a classe prevista no momento da captura,
+                      então a acurácia mede a concordância com o modelo que estava em produção
+
+Com --background (imagem ou pasta da lixeira vazia, mesma câmera das imagens de --folder),
+cada imagem também passa pelo recorte do modelo de fundo: o relatório inclui a taxa de
+"sem objeto" (inferência dispensada) e a acurácia nos recortes ao lado da do frame inteiro.
+
+Uso: python evaluate.py --folder dataset/ [--weights caminho.h5] [--batch-size 32] [--top-k 3]
+     python evaluate.py --store [--classes glass metal] [--since 2024-01-01] [--json saida.json]
+     python evaluate.py --folder frames/ --background vazia/
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+from config import CameraConfig, MLConfig
+from utils import get_logger
+
+logger = get_logger("Evaluate")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def list_labelled_images(root: str, class_names: Sequence[str]) -> Tuple[List[str], List[int]]:
+    """Arquivos de `root/<classe>/` com o índice da classe; arquivos na raiz recebem -1"""
+    lookup = {name.lower(): i for i, name in enumerate(class_names)}
+    paths, labels = [], []
+    for entry in sorted(os.listdir(root)):
+        full = os.path.join(root, entry)
+        if os.path.isdir(full):
+            label = lookup.get(entry.lower())
+            if label is None:
+                logger.warning(f"Pasta '{entry}' não corresponde a nenhuma classe do modelo, ignorada")
+                continue
+            for name in sorted(os.listdir(full)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(full, name))
+                    labels.append(label)
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            paths.append(full)
+            labels.append(-1)
+    return paths, labels
+
+def _load_with_opencv(path) -> np.ndarray:
+    """Mesmo pré-processamento da produção (cv2 + preprocess_image), usado via tf.numpy_function"""
+    from camera import preprocess_image
+
+    frame = cv2.imread(path.decode() if isinstance(path, bytes) else str(path))
+    height, width, channels = MLConfig.MODEL_INPUT_SHAPE
+    if frame is None:
+        return np.zeros((height, width, channels), dtype=np.uint8)
+    processed = preprocess_image(frame)
+    return processed if processed is not None else np.zeros((height, width, channels), dtype=np.uint8)
+
+def build_background(path: str):
+    """BackgroundModel aprendido com uma imagem ou uma pasta de imagens da lixeira vazia"""
+    from camera import BackgroundModel
+
+    paths = [path] if os.path.isfile(path) else [
+        os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    background = BackgroundModel()
+    for frame_path in paths:
+        frame = cv2.imread(frame_path)
+        if frame is not None:
+            background.update(frame)
+    if background.background is None:
+        raise SystemExit(f"Nenhuma imagem de fundo em {path}")
+    logger.info(f"Fundo aprendido com {len(paths)} imagem(ns)")
+    return background
+
+def _load_with_crop(background, path) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """(frame inteiro, recorte no objeto, tem_objeto), como na produção com o modelo de fundo"""
+    from camera import crop_to_box, preprocess_image
+
+    height, width, channels = MLConfig.MODEL_INPUT_SHAPE
+    empty = np.zeros((height, width, channels), dtype=np.uint8)
+    frame = cv2.imread(path.decode() if isinstance(path, bytes) else str(path))
+    if frame is None:
+        return empty, empty, False
+    full = preprocess_image(frame)
+    box, _ = background.locate(frame)
+    if box is None:
+        return full, empty, False
+    return full, preprocess_image(crop_to_box(frame, box)), True
+
+def folder_dataset(paths: Sequence[str], labels: Sequence[int], batch_size: int,
+                   decoder: str = "tf", background=None):
+    """
+    tf.data: (imagens uint8 RGB (B, H, W, 3), rótulos (B,)) com decodificação paralela.
+    Com `background` (BackgroundModel), os elementos ganham (recortes, tem_objeto).
+    """
+    import tensorflow as tf
+
+    height, width, channels = MLConfig.MODEL_INPUT_SHAPE
+
+    def load_tf(path, label):
+        data = tf.io.read_file(path)
+        image = tf.io.decode_image(data, channels=channels, expand_animations=False)
+        image = tf.image.resize(image, (height, width))
+        return tf.saturate_cast(tf.round(image), tf.uint8), label
+
+    def load_opencv(path, label):
+        image = tf.numpy_function(_load_with_opencv, [path], tf.uint8)
+        image.set_shape((height, width, channels))
+        return image, label
+
+    def load_crop(path, label):
+        full, crop, has_object = tf.numpy_function(
+            lambda p: _load_with_crop(background, p), [path], (tf.uint8, tf.uint8, tf.bool))
+        full.set_shape((height, width, channels))
+        crop.set_shape((height, width, channels))
+        has_object.set_shape(())
+        return full, label, crop, has_object
+
+    if background is not None:
+        load = load_crop
+    else:
+        load = load_tf if decoder == "tf" else load_opencv
+    dataset = tf.data.Dataset.from_tensor_slices((list(paths), np.asarray(labels, dtype=np.int32)))
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def store_dataset(class_names: Sequence[str], batch_size: int, directory: str = CameraConfig.IMAGE_SAVE_DIR,
+                  **filters):
+    """tf.data sobre o capture store (leitura via mmap no CaptureStoreReader) com prefetch"""
+    import tensorflow as tf
+    from capture_store import CaptureStoreReader
+
+    lookup = {name.encode(): i for i, name in enumerate(class_names)}
+    reader = CaptureStoreReader(directory)
+    input_shape = tuple(MLConfig.MODEL_INPUT_SHAPE)
+
+    def generate():
+        for images, records in reader.iter_batches(batch_size=batch_size, image_shape=input_shape, **filters):
+            labels = np.array([lookup.get(label, -1) for label in records["label"]], dtype=np.int32)
+            yield images, labels
+
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=(
+        tf.TensorSpec((None,) + input_shape, tf.uint8),
+        tf.TensorSpec((None,), tf.int32),
+    ))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+class _Tally:
+    """Acumula matriz de confusão, acertos top-k e distribuição das predições"""
+
+    def __init__(self, num_classes: int, top_k: int):
+        self.top_k = top_k
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.predicted_counts = np.zeros(num_classes, dtype=np.int64)
+        self.top_k_hits = 0
+        self.total = 0
+        self.labelled = 0
+
+    def add(self, probabilities: np.ndarray, labels: np.ndarray):
+        predicted = probabilities.argmax(axis=1)
+        self.predicted_counts += np.bincount(predicted, minlength=len(self.predicted_counts))
+        self.total += len(probabilities)
+
+        known = labels >= 0
+        if known.any():
+            np.add.at(self.confusion, (labels[known], predicted[known]), 1)
+            top = np.argsort(probabilities[known], axis=1)[:, -self.top_k:]
+            self.top_k_hits += int(np.sum(top == labels[known][:, None]))
+            self.labelled += int(known.sum())
+
+    def report(self, class_names: Sequence[str]) -> Dict[str, Any]:
+        correct = np.diag(self.confusion)
+        support = self.confusion.sum(axis=1)
+        predicted_totals = self.confusion.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            recall = np.where(support > 0, correct / support, 0.0)
+            precision = np.where(predicted_totals > 0, correct / predicted_totals, 0.0)
+        labelled = self.labelled
+        return {
+            "images": self.total,
+            "labelled": labelled,
+            "top1_accuracy": float(correct.sum() / labelled) if labelled else None,
+            f"top{self.top_k}_accuracy": float(self.top_k_hits / labelled) if labelled else None,
+            "classes": list(class_names),
+            "confusion": self.confusion.tolist(),
+            "per_class": {name: {"support": int(support[i]), "precision": float(precision[i]),
+                                 "recall": float(recall[i])}
+                          for i, name in enumerate(class_names)},
+            "predicted": {name: int(self.predicted_counts[i]) for i, name in enumerate(class_names)},
+        }
+
+def evaluate(model, dataset, class_names: Sequence[str], top_k: int = 3) -> Dict[str, Any]:
+    """
+    Roda o dataset batch a batch no modelo; retorna throughput, matriz de confusão e acurácias.
+    Com elementos (imagens, rótulos, recortes, tem_objeto) — ver folder_dataset com
+    `background` — avalia também os recortes e conta as imagens sem objeto.
+    """
+    full = _Tally(len(class_names), top_k)
+    crop = _Tally(len(class_names), top_k)
+    no_object = 0
+    no_object_labelled = 0
+    with_background = False
+    inference_time = 0.0
+
+    start = time.perf_counter()
+    for element in dataset.as_numpy_iterator():
+        images, labels = element[0], element[1]
+        batch_start = time.perf_counter()
+        full.add(model.predict_batch(images), labels)
+        inference_time += time.perf_counter() - batch_start
+
+        if len(element) == 4:
+            with_background = True
+            crops, objects = element[2], element[3].astype(bool)
+            no_object += int((~objects).sum())
+            no_object_labelled += int(((~objects) & (labels >= 0)).sum())
+            if objects.any():
+                crop.add(model.predict_batch(crops[objects]), labels[objects])
+    elapsed = time.perf_counter() - start
+
+    report = full.report(class_names)
+    report.update({
+        "seconds": elapsed,
+        "images_per_second": full.total / elapsed if elapsed > 0 else 0.0,
+        "inference_images_per_second": full.total / inference_time if inference_time > 0 else 0.0,
+    })
+    if with_background:
+        report["crop"] = crop.report(class_names)
+        report["no_object"] = {
+            "images": no_object,
+            "rate": no_object / full.total if full.total else 0.0,
+            # Imagens rotuladas contêm um objeto: aqui "sem objeto" é um descarte indevido
+            "labelled": no_object_labelled,
+        }
+    return report
+
+def _print_accuracy(report: Dict[str, Any], top_k: int):
+    classes = report["classes"]
+    print(f"Top-1: {report['top1_accuracy']:.2%} | Top-{top_k}: {report[f'top{top_k}_accuracy']:.2%} "
+          f"({report['labelled']} rotuladas)")
+    width = max(len(name) for name in classes)
+    print("\nMatriz de confusão (linhas: rótulo, colunas: predição)")
+    print(" " * (width + 2) + " ".join(f"{name[:6]:>6}" for name in classes) + "  recall")
+    for name, row in zip(classes, report["confusion"]):
+        recall = report["per_class"][name]["recall"]
+        print(f"{name:>{width}}  " + " ".join(f"{count:>6}" for count in row) + f"  {recall:>6.1%}")
+    print(" " * (width + 2) + " ".join(f"{report['per_class'][name]['precision']:>6.1%}" for name in classes)
+          + "  precision")
+
+def print_report(report: Dict[str, Any], top_k: int):
+    print(f"\n{report['images']} imagens em {report['seconds']:.1f} s: {report['images_per_second']:.1f} img/s "
+          f"(só inferência: {report['inference_images_per_second']:.1f} img/s)")
+
+    if not report["labelled"]:
+        print("Sem rótulos; distribuição das predições:")
+        for name, count in report["predicted"].items():
+            print(f"  {name:>10}: {count}")
+    else:
+        _print_accuracy(report, top_k)
+
+    if "crop" in report:
+        skipped = report["no_object"]
+        print(f"\nModelo de fundo: {skipped['images']} sem objeto ({skipped['rate']:.1%}), "
+              f"{skipped['labelled']} delas rotuladas (descartes indevidos)")
+        if report["crop"]["labelled"]:
+            print(f"Recortes ({report['crop']['images']} imagens com objeto) — frame inteiro: "
+                  f"{report['top1_accuracy']:.2%} top-1")
+            _print_accuracy(report["crop"], top_k)
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Avaliação em lote do TrashNetModel")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--folder", help="Pasta com subpastas por classe")
+    source.add_argument("--store", nargs="?", const=CameraConfig.IMAGE_SAVE_DIR, help="Diretório do capture store")
+    parser.add_argument("--weights", default=MLConfig.MODEL_WEIGHTS_PATH)
+    parser.add_argument("--backend", choices=["keras", "tflite"], default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--decoder", choices=["tf", "opencv"], default="tf",
+                        help="tf: decode/resize no tf.data; opencv: mesmo pré-processamento da produção")
+    parser.add_argument("--classes", nargs="+", help="(store) Apenas estas classes")
+    parser.add_argument("--devices", nargs="+", help="(store) Apenas estes dispositivos")
+    parser.add_argument("--since", help="(store) Data inicial ISO, ex.: 2024-01-01")
+    parser.add_argument("--until", help="(store) Data final ISO (exclusiva)")
+    parser.add_argument("--min-confidence", type=float, default=None)
+    parser.add_argument("--background", help="(folder) Imagem ou pasta da lixeira vazia para avaliar o recorte")
+    parser.add_argument("--json", help="Grava o relatório completo neste arquivo")
+    args = parser.parse_args(argv)
+
+    from ml_model import TrashNetModel
+
+    model = TrashNetModel(args.weights, backend=args.backend)
+    class_names = list(model.classes)
+
+    if args.folder:
+        paths, labels = list_labelled_images(args.folder, class_names)
+        if not paths:
+            raise SystemExit(f"Nenhuma imagem encontrada em {args.folder}")
+        logger.info(f"{len(paths)} imagens em {args.folder} ({sum(1 for l in labels if l >= 0)} rotuladas)")
+        background = build_background(args.background) if args.background else None
+        dataset = folder_dataset(paths, labels, args.batch_size, args.decoder, background)
+    else:
+        dataset = store_dataset(class_names, args.batch_size, args.store, classes=args.classes,
+                                devices=args.devices, start=_parse_date(args.since),
+                                end=_parse_date(args.until), min_confidence=args.min_confidence)
+
+    model.predict_batch(np.zeros((1,) + tuple(MLConfig.MODEL_INPUT_SHAPE), dtype=np.uint8))  # aquecimento
+    report = evaluate(model, dataset, class_names, args.top_k)
+    print_report(report, args.top_k)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Relatório gravado em {args.json}")
+    return report
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,209 @@
+import io
+import os
+import time
+import threading
+import itertools
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+import cv2
+import numpy as np
+from config import CameraConfig
+from utils import RollingStats, get_logger
+
+logger = get_logger("ImageWriter")
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+IMAGE_FORMATS = ("jpg", "png", "raw")
+
+# Sequência do processo: junto com o timestamp garante nomes únicos mesmo no mesmo milissegundo
+_sequence = itertools.count()
+
+def unique_filename(directory: str, prefix: str, extension: str) -> str:
+    """Nome ordenável por tempo, ex.: waste_capture_20240101-120000-123_000042.jpg"""
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    return os.path.join(directory, f"{prefix}_{stamp}-{int(now * 1000) % 1000:03d}_{next(_sequence):06d}.{extension}")
+
+def encode_image(image_array: np.ndarray, image_format: str = CameraConfig.IMAGE_FORMAT,
+                 jpeg_quality: int = CameraConfig.JPEG_QUALITY) -> Tuple[bytes, str]:
+    """Codifica uma imagem RGB uint8; retorna (bytes, extensão)"""
+    if image_format == "raw":
+        # .npy preserva shape e dtype sem custo de compressão
+        buffer = io.BytesIO()
+        np.save(buffer, image_array, allow_pickle=False)
+        return buffer.getvalue(), "npy"
+
+    image_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR) if image_array.ndim == 3 else image_array
+    if image_format == "png":
+        ok, encoded = cv2.imencode(".png", image_bgr, [cv2.IMWRITE_PNG_COMPRESSION, CameraConfig.PNG_COMPRESSION])
+    elif image_format == "jpg":
+        ok, encoded = cv2.imencode(".jpg", image_bgr, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+    else:
+        raise ValueError(f"Formato de imagem desconhecido: {image_format} (use um de {IMAGE_FORMATS})")
+    if not ok:
+        raise RuntimeError(f"cv2.imencode falhou ({image_format})")
+    return encoded.tobytes(), image_format
+
+def write_image(image_array: np.ndarray, directory: str, prefix: str = "captured",
+                image_format: str = CameraConfig.IMAGE_FORMAT,
+                jpeg_quality: int = CameraConfig.JPEG_QUALITY) -> Tuple[str, int]:
+    """Codifica e grava a imagem de forma síncrona; retorna (caminho, bytes gravados)"""
+    data, extension = encode_image(image_array, image_format, jpeg_quality)
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        path = unique_filename(directory, prefix, extension)
+        try:
+            # "x": nunca sobrescreve um arquivo existente (ex.: outro processo gravando na mesma pasta)
+            with open(path, "xb") as f:
+                f.write(data)
+            return path, len(data)
+        except FileExistsError:
+            continue
+
+class ImageWriter:
+    """
+    Grava as capturas em segundo plano. A classificação apenas enfileira a imagem;
+    com a fila cheia, descarta a mais antiga ("drop_oldest") ou a nova ("drop_newest").
+    Com um `store` (CaptureStore) as imagens vão para os shards junto com os metadados;
+    sem ele, cada imagem vira um arquivo em `directory`.
+    """
+
+    def __init__(self, directory: str = CameraConfig.TEST_IMAGE_DIR,
+                 queue_size: int = CameraConfig.WRITER_QUEUE_SIZE,
+                 overflow_policy: str = CameraConfig.WRITER_OVERFLOW_POLICY,
+                 image_format: str = CameraConfig.IMAGE_FORMAT,
+                 jpeg_quality: int = CameraConfig.JPEG_QUALITY,
+                 store=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de descarte desconhecida: {overflow_policy} (use um de {OVERFLOW_POLICIES})")
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Formato de imagem desconhecido: {image_format} (use um de {IMAGE_FORMATS})")
+
+        self.directory = directory
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.store = store
+
+        # Itens: (enfileirado_em, imagem, prefixo, metadados)
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # Métricas
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.lag = RollingStats()         # Do enfileiramento até o arquivo gravado (s)
+        self.write_times = RollingStats() # Codificação + escrita (s)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+        target = self.store.directory if self.store is not None else self.directory
+        logger.info(f"Gravação assíncrona em '{target}' ({self.image_format}, fila {self.queue_size}, "
+                    f"{self.overflow_policy})")
+
+    def stop(self, timeout: float = 5.0):
+        """Para a thread após gravar o que já está na fila (até `timeout` segundos)"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+        if self.pending:
+            logger.warning(f"{len(self.pending)} imagem(ns) não gravada(s) ao parar")
+
+    def submit(self, image_array: np.ndarray, prefix: str = "captured",
+               metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Enfileira a imagem (RGB uint8) sem bloquear. O array é gravado depois e não deve
+        ser modificado pelo chamador. `metadata` (device, label, confidence, timestamp) vai
+        para o índice do CaptureStore. Retorna False se a imagem nova foi descartada.
+        """
+        with self.condition:
+            if not self.running:
+                return False
+            self.enqueued += 1
+            if len(self.pending) >= self.queue_size:
+                self.dropped += 1
+                if self.overflow_policy == "drop_newest":
+                    return False
+                self.pending.popleft()
+            self.pending.append((time.monotonic(), image_array, prefix, metadata or {}))
+            self.condition.notify()
+        return True
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                enqueued_at, image_array, prefix, metadata = self.pending.popleft()
+
+            start = time.monotonic()
+            try:
+                if self.store is not None:
+                    shard, offset, size = self.store.append_image(image_array, self.image_format, **metadata)
+                    logger.debug(f"Imagem salva no shard {shard:06d} (offset {offset})")
+                else:
+                    path, size = write_image(image_array, self.directory, prefix, self.image_format, self.jpeg_quality)
+                    logger.debug(f"Imagem salva em: {path}")
+                self.written += 1
+                self.bytes_written += size
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Erro ao salvar imagem: {e}")
+            finished = time.monotonic()
+            self.write_times.add(finished - start)
+            self.lag.add(finished - enqueued_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "queue_depth": len(self.pending),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "bytes_written": self.bytes_written,
+            "lag": self.lag.summary(),
+            "write": self.write_times.summary(),
+        }
+        if self.store is not None:
+            stats["store"] = self.store.get_stats()
+        return stats
+
+# Instância compartilhada, iniciada sob demanda
+_writer: Optional[ImageWriter] = None
+_writer_lock = threading.Lock()
+
+def get_image_writer() -> ImageWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            store = None
+            if CameraConfig.USE_CAPTURE_STORE:
+                from capture_store import get_capture_store
+                store = get_capture_store()
+            _writer = ImageWriter(store=store)
+            _writer.start()
+        return _writer
+
+def stop_image_writer():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+        if writer.store is not None:
+            from capture_store import close_capture_store
+            close_capture_store()
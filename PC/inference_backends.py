@@ -0,0 +1,175 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+import numpy as np
+from config import MLConfig
+from utils import get_logger
+
+logger = get_logger("Backends")
+
+# --- Backends de inferência ---
+# Todos expõem predict_batch(batch uint8 RGB (N, H, W, C)) -> np.ndarray (N, classes).
+# Os que separam backbone e cabeça expõem também embed_batch(batch) -> (N, D) e
+# `head` = (kernel (D, classes), bias (classes,)) da camada softmax final.
+
+class KerasBackend:
+    """Executa o modelo Keras construído em memória"""
+
+    name = "keras"
+
+    def __init__(self, model):
+        from tensorflow.keras.models import Model
+
+        self.model = model
+        # Backbone: tudo até a penúltima camada; cabeça: a Dense softmax final
+        self.embed_model = Model(inputs=model.inputs, outputs=model.layers[-2].output)
+        kernel, bias = model.layers[-1].get_weights()
+        self.head = (np.asarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32))
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+    def embed_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.embed_model.predict_on_batch(batch))
+
+class SavedModelBackend:
+    """Executa a assinatura exportada de um SavedModel (grafo com pesos congelados)"""
+
+    name = "savedmodel"
+
+    def __init__(self, path: str):
+        import tensorflow as tf
+
+        self._tf = tf
+        self.path = path
+        self.loaded = tf.saved_model.load(path)
+        self.fn = self.loaded.signatures["serving_default"]
+        self.output_key = list(self.fn.structured_outputs.keys())[0]
+
+        # Backbone e cabeça exportados junto com o artefato
+        self.embed_fn = self.loaded.signatures["embed"]
+        with np.load(os.path.join(path, "head.npz")) as head:
+            self.head = (head["kernel"].astype(np.float32), head["bias"].astype(np.float32))
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        outputs = self.fn(self._tf.constant(batch))
+        return outputs[self.output_key].numpy()
+
+    def embed_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self.embed_fn(self._tf.constant(batch))["embeddings"].numpy()
+
+class TFLiteBackend:
+    """
+    Executa um modelo .tflite no interpretador, com número de threads configurável.
+    Cada tamanho de `batch_sizes` tem o seu interpretador, alocado uma vez na primeira
+    utilização; um batch é completado com zeros até o menor tamanho que o comporta (e
+    dividido se passar do maior), então o tamanho variável do micro-batching não
+    realoca tensores a cada chamada.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: int = 1,
+                 batch_sizes: Sequence[int] = MLConfig.TFLITE_BATCH_SIZES):
+        import tensorflow as tf
+
+        self._tf = tf
+        self.path = model_path
+        self.num_threads = num_threads
+        self.batch_sizes = sorted(set(batch_sizes))
+        self.interpreters: Dict[int, Tuple[Any, Dict[str, Any], Dict[str, Any]]] = {}
+        self.lock = threading.Lock()  # O interpretador não é thread-safe
+        _, self.input_detail, self.output_detail = self._interpreter(self.batch_sizes[0])
+
+    def _interpreter(self, batch_size: int):
+        """(interpretador, entrada, saída) alocados para `batch_size`"""
+        if batch_size not in self.interpreters:
+            interpreter = self._tf.lite.Interpreter(model_path=self.path, num_threads=self.num_threads)
+            input_detail = interpreter.get_input_details()[0]
+            if int(input_detail["shape"][0]) != batch_size:
+                shape = [batch_size] + list(input_detail["shape"][1:])
+                interpreter.resize_tensor_input(input_detail["index"], shape)
+            interpreter.allocate_tensors()
+            self.interpreters[batch_size] = (interpreter, interpreter.get_input_details()[0],
+                                             interpreter.get_output_details()[0])
+        return self.interpreters[batch_size]
+
+    def _bucket(self, count: int) -> int:
+        return next(size for size in self.batch_sizes if size >= count)
+
+    def _quantize_input(self, batch: np.ndarray) -> np.ndarray:
+        dtype = self.input_detail["dtype"]
+        if dtype == batch.dtype:
+            return batch
+        scale, zero_point = self.input_detail["quantization"]
+        if scale:
+            info = np.iinfo(dtype)
+            return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+        return batch.astype(dtype)
+
+    def _dequantize_output(self, output: np.ndarray) -> np.ndarray:
+        scale, zero_point = self.output_detail["quantization"]
+        if scale and output.dtype != np.float32:
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.astype(np.float32, copy=False)
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        batch = self._quantize_input(batch)
+        largest = self.batch_sizes[-1]
+        outputs = []
+        with self.lock:
+            for offset in range(0, len(batch), largest):
+                chunk = batch[offset:offset + largest]
+                interpreter, input_detail, output_detail = self._interpreter(self._bucket(len(chunk)))
+                padding = int(input_detail["shape"][0]) - len(chunk)
+                if padding:
+                    chunk = np.concatenate([chunk, np.zeros((padding,) + chunk.shape[1:], dtype=chunk.dtype)])
+                interpreter.set_tensor(input_detail["index"], chunk)
+                interpreter.invoke()
+                outputs.append(interpreter.get_tensor(output_detail["index"])[:len(chunk) - padding].copy())
+        if not outputs:
+            return np.zeros((0, int(self.output_detail["shape"][-1])), dtype=np.float32)
+        return self._dequantize_output(np.concatenate(outputs))
+
+# --- Conversão TFLite ---
+TFLITE_QUANTIZATIONS = ("float32", "float16", "dynamic", "int8", "int8_fallback")
+
+def convert_to_tflite(saved_model_path: str, output_path: str, quantization: str,
+                      calibration_images: Optional[Sequence[np.ndarray]] = None):
+    """
+    Converte o SavedModel exportado para TFLite.
+    "float16" e "dynamic" quantizam só os pesos; "int8" quantiza pesos e ativações de
+    todas as ops e falha se alguma não tiver kernel int8; "int8_fallback" deixa essas
+    ops em float. Os dois int8 exigem imagens de calibração (uint8, como entregues ao modelo).
+    """
+    import tensorflow as tf
+
+    if quantization not in TFLITE_QUANTIZATIONS:
+        raise ValueError(f"Quantização desconhecida: {quantization}")
+
+    # Só o grafo completo; a assinatura "embed" fica de fora do .tflite
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_path, signature_keys=["serving_default"])
+    if quantization != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization in ("int8", "int8_fallback"):
+        if not calibration_images:
+            raise ValueError("Quantização int8 requer imagens de calibração")
+
+        def representative_dataset():
+            for image_array in calibration_images:
+                yield [np.expand_dims(image_array, axis=0).astype(np.uint8)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if quantization == "int8_fallback":
+            # Ops sem kernel int8 (ex.: o cast da camada de normalização) ficam em float
+            converter.target_spec.supported_ops.append(tf.lite.OpsSet.TFLITE_BUILTINS)
+
+    tflite_model = converter.convert()
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    logger.info(f"Modelo TFLite ({quantization}) gravado em {output_path} ({len(tflite_model) / 1e6:.1f} MB)")
@@ -0,0 +1,192 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from config import MLConfig
+from utils import RollingStats, get_logger
+
+logger = get_logger("Scheduler")
+
+class InferenceRequest:
+    """
+    Pedido de inferência de um dispositivo: K imagens e o Future com as softmax (K, classes),
+    ou (softmax, embeddings (K, D) ou None) se `with_embeddings`.
+    """
+
+    def __init__(self, images: Sequence[np.ndarray], device: Optional[str] = None,
+                 with_embeddings: bool = False):
+        self.images = list(images)
+        self.device = device
+        self.with_embeddings = with_embeddings
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+class InferenceScheduler:
+    """
+    Agrupa pedidos de classificação de todos os dispositivos em micro-batches,
+    limitados por tamanho máximo e pela latência máxima adicionada ao primeiro pedido.
+    O `observer`, se informado, recebe (modelo, imagens, probabilidades ou None em caso de
+    falha, duração) após cada batch.
+    """
+
+    def __init__(self, model_provider: Callable[[], Any],
+                 max_batch_size: int = MLConfig.SCHEDULER_MAX_BATCH,
+                 max_latency: float = MLConfig.SCHEDULER_MAX_LATENCY,
+                 observer: Optional[Callable[[Any, List[np.ndarray], Optional[np.ndarray], float], None]] = None):
+        self.model_provider = model_provider
+        self.observer = observer
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.running = False
+        self.thread = None
+        self._carry: Optional[InferenceRequest] = None
+
+        # Métricas
+        self.batch_count = 0
+        self.request_count = 0
+        self.failure_count = 0
+        self.batch_sizes = RollingStats()
+        self.wait_times = RollingStats()
+        self.inference_times = RollingStats()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+        logger.info(f"Scheduler iniciado (batch máx. {self.max_batch_size}, latência máx. {self.max_latency * 1000:.0f} ms)")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+        # Falha os pedidos que não chegaram a ser processados
+        pending = [self._carry] if self._carry else []
+        self._carry = None
+        while True:
+            try:
+                pending.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Scheduler parado"))
+        logger.info("Scheduler parado")
+
+    def submit(self, images: Sequence[np.ndarray], device: Optional[str] = None,
+               with_embeddings: bool = False) -> Future:
+        """
+        Enfileira K imagens; o Future resolve com as probabilidades (K, classes) ou,
+        com `with_embeddings`, com (probabilidades, embeddings do backbone ou None)
+        """
+        request = InferenceRequest(images, device, with_embeddings)
+        if not self.running:
+            request.future.set_exception(RuntimeError("Scheduler não iniciado"))
+            return request.future
+        self.requests.put(request)
+        return request.future
+
+    # ----------------- Worker -----------------
+    def _next_request(self, timeout: float) -> Optional[InferenceRequest]:
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        try:
+            return self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self) -> List[InferenceRequest]:
+        first = self._next_request(timeout=0.5)
+        if first is None:
+            return []
+
+        batch = [first]
+        size = len(first.images)
+        deadline = first.submitted_at + self.max_latency
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            request = self._next_request(timeout=remaining)
+            if request is None:
+                break
+            if size + len(request.images) > self.max_batch_size:
+                self._carry = request  # Não cabe: abre o próximo batch
+                break
+            batch.append(request)
+            size += len(request.images)
+        return batch
+
+    def _worker(self):
+        while self.running:
+            batch = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: List[InferenceRequest]):
+        model = self.model_provider()
+        if model is None:
+            for request in batch:
+                request.future.set_exception(RuntimeError("Modelo não carregado"))
+            self.failure_count += len(batch)
+            return
+
+        images = [image for request in batch for image in request.images]
+        start = time.monotonic()
+        for request in batch:
+            self.wait_times.add(start - request.submitted_at)
+
+        try:
+            embeddings = None
+            if any(request.with_embeddings for request in batch) and hasattr(model, "predict_batch_with_embeddings"):
+                probabilities, embeddings = model.predict_batch_with_embeddings(images)
+            else:
+                probabilities = model.predict_batch(images)
+        except Exception as e:
+            logger.error(f"ERRO na inferência do batch: {e}")
+            self.failure_count += len(batch)
+            for request in batch:
+                request.future.set_exception(e)
+            self._observe(model, images, None, time.monotonic() - start)
+            return
+
+        elapsed = time.monotonic() - start
+        self.inference_times.add(elapsed)
+        self.batch_sizes.add(len(images))
+        self.batch_count += 1
+        self.request_count += len(batch)
+
+        offset = 0
+        for request in batch:
+            count = len(request.images)
+            result = probabilities[offset:offset + count]
+            if request.with_embeddings:
+                result = (result, None if embeddings is None else embeddings[offset:offset + count])
+            request.future.set_result(result)
+            offset += count
+        self._observe(model, images, probabilities, elapsed)
+
+    def _observe(self, model, images, probabilities, elapsed):
+        if self.observer is None:
+            return
+        try:
+            self.observer(model, images, probabilities, elapsed)
+        except Exception as e:
+            logger.error(f"Erro no observador do scheduler: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.requests.qsize() + (1 if self._carry else 0),
+            "batches": self.batch_count,
+            "requests": self.request_count,
+            "failures": self.failure_count,
+            "batch_size": self.batch_sizes.summary(),
+            "wait": self.wait_times.summary(),
+            "inference": self.inference_times.summary(),
+        }
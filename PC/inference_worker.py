@@ -0,0 +1,264 @@
+import time
+import queue
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Sequence
+import cv2
+import numpy as np
+from config import MLConfig
+from utils import get_logger
+
+logger = get_logger("InferenceWorker")
+
+class InferenceWorkerError(RuntimeError):
+    """Falha de um processo de inferência (queda, timeout ou erro no modelo)"""
+
+    def __init__(self, message: str, fatal: bool = True):
+        super().__init__(message)
+        self.fatal = fatal  # False: o worker continua utilizável (erro no próprio modelo)
+
+def load_trashnet(weights_path: str):
+    """Fábrica padrão dos workers: o mesmo modelo da produção (com a cascata, se ativa)"""
+    from ml_model import build_serving_model
+    return build_serving_model(weights_path)
+
+# ----------------- Processo filho -----------------
+def _worker_main(factory: Callable[[str], Any], weights_path: str, input_name: str, output_name: str,
+                 max_batch: int, input_shape: tuple, num_classes: int, conn):
+    try:
+        model = factory(weights_path)
+        # Segmentos criados (e removidos) pelo processo pai
+        shm_in = shared_memory.SharedMemory(name=input_name)
+        shm_out = shared_memory.SharedMemory(name=output_name)
+        inputs = np.ndarray((max_batch,) + tuple(input_shape), dtype=np.uint8, buffer=shm_in.buf)
+        outputs = np.ndarray((max_batch, num_classes), dtype=np.float32, buffer=shm_out.buf)
+    except Exception as e:
+        conn.send(("failed", str(e)))
+        return
+
+    conn.send(("ready", {"classes": list(model.classes), "cls_mapping": dict(model.cls_mapping)}))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, count = message
+        try:
+            outputs[:count] = model.predict_batch(inputs[:count])
+            conn.send((request_id, None))
+        except Exception as e:
+            conn.send((request_id, str(e)))
+
+    del inputs, outputs
+    shm_in.close()
+    shm_out.close()
+
+# ----------------- Lado do pai -----------------
+class InferenceWorker:
+    """Um processo de inferência com buffers de entrada/saída em memória compartilhada"""
+
+    def __init__(self, worker_id: int, factory: Callable[[str], Any], weights_path: str,
+                 max_batch: int, input_shape: tuple, num_classes: int):
+        self.worker_id = worker_id
+        self.factory = factory
+        self.weights_path = weights_path
+        self.max_batch = max_batch
+        self.input_shape = tuple(input_shape)
+        self.num_classes = num_classes
+
+        # Entradas uint8 RGB (a normalização está no grafo do modelo)
+        input_bytes = max_batch * int(np.prod(self.input_shape))
+        self.shm_in = shared_memory.SharedMemory(create=True, size=input_bytes)
+        self.shm_out = shared_memory.SharedMemory(create=True, size=max_batch * num_classes * 4)
+        self.inputs = np.ndarray((max_batch,) + self.input_shape, dtype=np.uint8, buffer=self.shm_in.buf)
+        self.outputs = np.ndarray((max_batch, num_classes), dtype=np.float32, buffer=self.shm_out.buf)
+
+        self.process = None
+        self.conn = None
+        self.info: Dict[str, Any] = {}
+        self.request_id = 0
+        self.restarts = 0
+
+    def start(self, timeout: float = MLConfig.WORKER_START_TIMEOUT) -> bool:
+        """Inicia o processo e aguarda o modelo carregar"""
+        ctx = mp.get_context("spawn")  # fork após o TensorFlow iniciar threads não é seguro
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.factory, self.weights_path, self.shm_in.name, self.shm_out.name,
+                  self.max_batch, self.input_shape, self.num_classes, child_conn),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        if not self.conn.poll(timeout):
+            logger.error(f"Worker {self.worker_id} não ficou pronto em {timeout:.0f} s")
+            self.kill()
+            return False
+        try:
+            status, payload = self.conn.recv()
+        except EOFError:
+            status, payload = "failed", "processo encerrado"
+        if status != "ready":
+            logger.error(f"Worker {self.worker_id} falhou ao carregar o modelo: {payload}")
+            self.kill()
+            return False
+
+        self.info = payload
+        logger.info(f"Worker {self.worker_id} pronto (pid {self.process.pid})")
+        return True
+
+    def kill(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=5)
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def run(self, count: int, timeout: float = MLConfig.WORKER_REQUEST_TIMEOUT) -> np.ndarray:
+        """Executa as `count` primeiras entradas já copiadas para `self.inputs`"""
+        if not self.is_alive():
+            raise InferenceWorkerError(f"Worker {self.worker_id} não está ativo")
+
+        self.request_id += 1
+        try:
+            self.conn.send((self.request_id, count))
+            deadline = time.monotonic() + timeout
+            # Aguarda em fatias para perceber a queda do processo sem esperar o timeout inteiro
+            while not self.conn.poll(0.1):
+                if not self.process.is_alive():
+                    raise InferenceWorkerError(f"Worker {self.worker_id} caiu durante a inferência")
+                if time.monotonic() > deadline:
+                    raise InferenceWorkerError(f"Worker {self.worker_id} excedeu {timeout:.0f} s")
+            request_id, error = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise InferenceWorkerError(f"Worker {self.worker_id} perdeu a conexão: {e}")
+
+        if request_id != self.request_id:
+            raise InferenceWorkerError(f"Worker {self.worker_id} respondeu fora de ordem")
+        if error:
+            raise InferenceWorkerError(f"Erro no worker {self.worker_id}: {error}", fatal=False)
+        return self.outputs[:count].copy()
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except Exception:
+                pass
+        if self.process is not None:
+            self.process.join(timeout=5)
+        self.kill()
+        del self.inputs, self.outputs
+        for shm in (self.shm_in, self.shm_out):
+            shm.close()
+            shm.unlink()
+
+class ProcessInferencePool:
+    """
+    Executa o TrashNetModel em processos separados, com a mesma interface usada pelo
+    scheduler (classes, cls_mapping, input_shape, predict_batch). Um worker que cai é
+    reiniciado em segundo plano e o pedido em andamento falha com InferenceWorkerError.
+    """
+
+    def __init__(self, weights_path: str, num_workers: int = MLConfig.INFERENCE_WORKERS,
+                 max_batch: int = MLConfig.SCHEDULER_MAX_BATCH,
+                 factory: Callable[[str], Any] = load_trashnet,
+                 input_shape: Sequence[int] = MLConfig.MODEL_INPUT_SHAPE,
+                 num_classes: int = len(MLConfig.WASTE_TYPES)):
+        self.input_shape = tuple(input_shape)
+        self.max_batch = max_batch
+        self.num_classes = num_classes
+        self.workers = [InferenceWorker(i, factory, weights_path, max_batch, self.input_shape, num_classes)
+                        for i in range(num_workers)]
+        self.available: "queue.Queue[InferenceWorker]" = queue.Queue()
+        self.classes: List[str] = []
+        self.cls_mapping: Dict[str, str] = {}
+        self.running = True
+        self.failures = 0
+
+    def start(self) -> bool:
+        """Inicia os workers; True se ao menos um ficou pronto"""
+        for worker in self.workers:
+            if worker.start():
+                self.classes = worker.info["classes"]
+                self.cls_mapping = worker.info["cls_mapping"]
+                self.available.put(worker)
+            else:
+                self._restart_later(worker)
+        return bool(self.classes)
+
+    def _restart_later(self, worker: InferenceWorker):
+        def restart():
+            while self.running:
+                worker.kill()
+                worker.restarts += 1
+                logger.warning(f"Reiniciando worker {worker.worker_id} (reinício nº {worker.restarts})")
+                if worker.start():
+                    self.available.put(worker)
+                    return
+                time.sleep(MLConfig.WORKER_RESTART_DELAY)
+
+        threading.Thread(target=restart, daemon=True).start()
+
+    def _fill(self, worker: InferenceWorker, images: Sequence[np.ndarray]):
+        """Copia (e redimensiona se preciso) as imagens direto no buffer compartilhado"""
+        height, width = self.input_shape[:2]
+        for i, image_array in enumerate(images):
+            if image_array.shape[:2] != (height, width):
+                image_array = cv2.resize(image_array, (width, height))
+            worker.inputs[i] = image_array
+
+    def predict_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        if not len(images):
+            return np.zeros((0, self.num_classes), dtype=np.float32)
+        results = []
+        for offset in range(0, len(images), self.max_batch):
+            chunk = images[offset:offset + self.max_batch]
+            try:
+                worker = self.available.get(timeout=MLConfig.WORKER_REQUEST_TIMEOUT)
+            except queue.Empty:
+                raise InferenceWorkerError("Nenhum worker de inferência disponível")
+
+            try:
+                self._fill(worker, chunk)
+                results.append(worker.run(len(chunk)))
+            except InferenceWorkerError as e:
+                self.failures += 1
+                if e.fatal:
+                    self._restart_later(worker)
+                else:
+                    self.available.put(worker)
+                raise
+            except Exception:
+                self.available.put(worker)
+                raise
+            else:
+                self.available.put(worker)
+        return np.concatenate(results, axis=0)
+
+    def predict(self, image_array: np.ndarray) -> np.ndarray:
+        return self.predict_batch([image_array])[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.workers),
+            "available": self.available.qsize(),
+            "failures": self.failures,
+            "restarts": sum(worker.restarts for worker in self.workers),
+        }
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            worker.stop()
@@ -1,68 +1,151 @@
 import time
+import asyncio
 import threading
 import queue
-from config import MLConfig
+from concurrent.futures import ThreadPoolExecutor
+from config import PipelineConfig
 from utils import get_logger
-from ml_model import classify_waste
-from udp_communicator import UDPCommunicator
+from ml_model import (RESULT_CACHE, ModelLoader, capture_for_classification, classify_probabilities, get_model,
+                      record_capture, start_model_loading, submit_views)
+from camera import NoObjectDetected, get_camera_service, get_camera_stats, stop_camera_services
+from image_writer import get_image_writer, stop_image_writer
+from inference_scheduler import InferenceScheduler
+from model_manager import ModelManager
+from device_registry import DeviceRegistry
+from discovery import Announcer, PeerCache
+from udp_communicator import AsyncUDPCommunicator, create_communicator
 
 logger = get_logger("PCMessenger")
 
+# Referência para as métricas de inicialização
+PROCESS_START = time.monotonic()
+
 class PCMessenger:
     def __init__(self):
-        self.udp = UDPCommunicator()
+        self.udp = create_communicator()
+        self.model_manager = ModelManager()
+        self.scheduler = InferenceScheduler(get_model, observer=self.model_manager.observe)
+        self.devices = DeviceRegistry()
+        self.peers = PeerCache()
+        self.discovery = Announcer(self.udp.send_message, self.peers)
+        # Uma thread por lixeira: uma captura não espera a de outra
+        self.workers = ThreadPoolExecutor(max_workers=max(PipelineConfig.WORKER_THREADS,
+                                                          len(self.devices.camera_map)),
+                                          thread_name_prefix="classify")
+        self.model_loader: ModelLoader = None
         self.running = True
-        self.esp_ip = None
+
+        # Tempos desde o início do processo (s)
+        self.startup_metrics = {
+            "time_to_first_pong": None,
+            "time_to_pair": None,
+            "time_to_model_ready": None,
+            "time_to_first_classification": None,
+        }
 
         # Thread processador
         self.processor_thread = threading.Thread(target=self._processor, daemon=True)
 
     def start(self):
+        # Abre a câmera já na inicialização para evitar aquecimento por classificação
+        get_camera_service()
+        get_image_writer()
+
+        # O modelo carrega em segundo plano; o PC já responde PING enquanto isso.
+        # O loader existe antes do transporte: a primeira mensagem já consulta o estado dele
+        self.model_loader = start_model_loading()
+        self.model_loader.add_callback(self._on_model_loaded)
+
+        self.scheduler.start()
+        if isinstance(self.udp, AsyncUDPCommunicator):
+            # Cada mensagem vira uma task no event loop do transporte
+            self.udp.set_handler(self._handle_message)
+        else:
+            self.processor_thread.start()
         self.udp.start()
-        self.processor_thread.start()
+        self.discovery.start()
         logger.info("PCMessenger iniciado!")
 
     def stop(self):
-        # Envia aviso de desligamento se ESP32 estiver conectado
-        if self.esp_ip:
+        # Envia aviso de desligamento a todos os ESP32 conhecidos
+        for device in self.devices.all():
             try:
-                self.udp.send_message("PC_OFFLINE", self.esp_ip)
-                logger.info(f"Aviso de desligamento enviado ao ESP32 ({self.esp_ip})")
+                self.udp.send_message("PC_OFFLINE", device.ip)
+                logger.info(f"Aviso de desligamento enviado ao ESP32 {device.device_id} ({device.ip})")
             except Exception as e:
                 logger.error(f"Erro ao enviar PC_OFFLINE: {e}")
 
         self.running = False
+        self.discovery.stop()
+        self.workers.shutdown(wait=False)
         self.udp.stop()
+        self.scheduler.stop()
+        self.model_manager.stop()
+        if self.model_loader is not None:
+            self.model_loader.stop()
+        stop_camera_services()
+        stop_image_writer()
         logger.info("PCMessenger parado")
 
     # ----------------- Processor -----------------
     def _processor(self):
         while self.running:
             try:
-                msg, addr = self.udp.msg_queue.get(timeout=0.5)
-                self._process_message(msg, addr)
+                msg, addr, received_at = self.udp.msg_queue.get(timeout=0.5)
+                self._process_message(msg, addr, received_at)
             except queue.Empty:
                 continue
 
-    def _process_message(self, msg, addr):
+    async def _handle_message(self, msg, addr, received_at=None):
+        """Handler do transporte asyncio; o que bloqueia sai do event loop (ver _remember_peer)"""
+        self._process_message(msg, addr, received_at)
+
+    def _process_message(self, msg, addr, received_at=None):
         ip = addr[0]
 
-        if self.esp_ip != ip:
-            self.esp_ip = ip
-            logger.success(f"ESP32 conectado: {self.esp_ip}")
+        # "PING:<id>" e "ESP_ONLINE:<id>" trazem o ID do ESP32, estável entre trocas de IP
+        announced_id = None
+        if msg.startswith("PING:") or msg.startswith("ESP_ONLINE:"):
+            announced_id = msg.split(":", 1)[1] or None
+            msg = msg.split(":", 1)[0]
+
+        device, is_new = self.devices.touch(addr, announced_id)
+        if is_new:
+            logger.success(f"ESP32 conectado: {device.device_id} (câmera {device.camera_index})")
+        if announced_id is not None:
+            self._remember_peer(device.device_id, ip)
+            self.discovery.mark_paired()
+            self._mark_startup("time_to_pair")
 
         if msg == "PING":
             self.udp.send_message("PC_ONLINE", ip)
+            self._mark_startup("time_to_first_pong")
+            if not self._model_ready():
+                self.udp.send_message(f"PC_STATUS:{self._model_status()}", ip)
+
+        elif msg == "ESP_ONLINE":
+            # Resposta a um anúncio do PC
+            if not self._model_ready():
+                self.udp.send_message(f"PC_STATUS:{self._model_status()}", ip)
 
         elif msg == "MOVIMENTO_DETECTADO":
-            logger.info("Movimento detectado pelo ESP32")
+            logger.info(f"Movimento detectado pelo ESP32 {device.device_id}")
+
+            if not self._model_ready():
+                logger.warning(f"Modelo ainda não está pronto ({self._model_status()}), gatilho ignorado")
+                self.udp.send_message(f"PC_STATUS:{self._model_status()}", ip)
+                return
 
-            # Executa classificação do resíduo
-            result = classify_waste()
-            if result:
-                command = f"WASTE_TYPE:{result['index']}:{result['name']}"
-                self.udp.send_message(command, ip)
-                logger.info("Enviado tipo do lixo!")
+            # Uma classificação por dispositivo; a captura roda no pool e a inferência no scheduler
+            action = self.devices.submit_trigger(device, received_at or time.monotonic())
+            if action == "start":
+                self.workers.submit(self._classify_for, device)
+            elif action == "queued":
+                logger.info(f"Classificação em andamento para {device.device_id}, gatilho enfileirado")
+            elif action == "coalesced":
+                logger.info(f"Gatilho duplicado de {device.device_id} fundido ao pedido existente")
+            else:
+                logger.warning(f"Gatilho de {device.device_id} descartado ({action})")
 
         elif msg.startswith("RESP:"):
             logger.info(f"ESP32 respondeu: {msg[5:]}")
@@ -70,18 +153,127 @@ class PCMessenger:
         else:
             logger.warning(f"Mensagem não reconhecida: {msg}")
 
+    # ----------------- Classificação -----------------
+    def _classify_for(self, device):
+        if self.devices.is_expired(device):
+            logger.warning(f"Pedido de {device.device_id} expirou antes da captura, descartando")
+            self._finish(device, success=False, dropped=True)
+            return
+
+        logger.info(f"=== INICIANDO CLASSIFICAÇÃO AUTOMÁTICA ({device.device_id}) ===")
+        try:
+            views = capture_for_classification(camera_index=device.camera_index)
+        except NoObjectDetected as e:
+            # Gatilho falso (ex.: mão sem item): nada a classificar nem a enviar
+            logger.info(f"Classificação de {device.device_id} dispensada: {e}")
+            self.devices.mark_captured(device)
+            self._finish(device, success=False, no_object=True)
+            return
+        except Exception as e:
+            logger.error(f"ERRO na captura para {device.device_id}: {e}")
+            views = []
+        self.devices.mark_captured(device)
+        if not views:
+            self._finish(device, success=False)
+            return
+        future = submit_views(views, self.scheduler.submit, device=device.device_id)
+        future.add_done_callback(lambda f: self._on_inference_done(f, device, views[0]))
+
+    def _on_inference_done(self, future, device, image_array):
+        result = None
+        probabilities, embeddings = None, None
+        try:
+            probabilities, embeddings = future.result()
+            result = classify_probabilities(probabilities)
+        except Exception as e:
+            logger.error(f"Falha na inferência para {device.device_id}: {e}")
+        record_capture(image_array, probabilities, device=device.device_id,
+                       embedding=None if embeddings is None else embeddings[0])
+
+        # O item já caiu: um WASTE_TYPE atrasado moveria o servo para o próximo item
+        if result and self.devices.is_expired(device):
+            logger.warning(f"Resultado para {device.device_id} chegou após o prazo, descartando")
+            self._finish(device, success=False, dropped=True)
+            return
+
+        if result:
+            command = f"WASTE_TYPE:{result['index']}:{result['name']}"
+            # Retransmite só enquanto o item ainda está na frente da lixeira
+            self.udp.send_message(command, device.ip, reliable=True, deadline=device.deadline)
+            logger.info(f"Enviado tipo do lixo para {device.device_id}!")
+            self._mark_startup("time_to_first_classification")
+        self._finish(device, success=result is not None)
+
+    def _finish(self, device, success, dropped=False, no_object=False):
+        # Inicia o próximo gatilho pendente do dispositivo, se houver
+        if self.devices.finish(device, success, dropped, no_object) and self.running:
+            self.workers.submit(self._classify_for, device)
+
+    def _remember_peer(self, device_id, ip):
+        """Atualiza o cache de pares; no event loop do transporte, a gravação vai para o executor"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._update_peer_cache(device_id, ip)  # Thread do processador
+        else:
+            loop.run_in_executor(None, self._update_peer_cache, device_id, ip)
+
+    def _update_peer_cache(self, device_id, ip):
+        if self.peers.update(device_id, ip):
+            logger.info(f"Endereço de {device_id} atualizado no cache: {ip}")
+
+    # ----------------- Prontidão do modelo -----------------
+    def _model_ready(self) -> bool:
+        return self.model_loader is not None and self.model_loader.is_ready()
+
+    def _model_status(self):
+        if self.model_loader is not None and self.model_loader.state == ModelLoader.FAILED:
+            return "FAILED"
+        return "WARMING_UP"
+
+    def _on_model_loaded(self, loader):
+        if not loader.is_ready():
+            logger.error("Falha ao carregar o modelo; classificações indisponíveis")
+            return
+        self._mark_startup("time_to_model_ready")
+        for device in self.devices.all():
+            self.udp.send_message("PC_STATUS:READY", device.ip)
+
+    def _mark_startup(self, name):
+        if self.startup_metrics[name] is None:
+            self.startup_metrics[name] = time.monotonic() - PROCESS_START
+            logger.info(f"Inicialização: {name} = {self.startup_metrics[name]:.2f} s")
+
+    def get_stats(self):
+        stats = {
+            "startup": self.startup_metrics,
+            "scheduler": self.scheduler.get_stats(),
+            "devices": self.devices.get_stats(),
+            "udp_dropped": self.udp.dropped_messages,
+            "udp_security": self.udp.security.get_stats(),
+            "udp_reliability": self.udp.get_stats(),
+            "image_writer": get_image_writer().get_stats(),
+            "cameras": get_camera_stats(),
+            "model_manager": self.model_manager.get_stats(),
+            "discovery": self.discovery.get_stats(),
+        }
+        if RESULT_CACHE is not None:
+            stats["result_cache"] = RESULT_CACHE.get_stats()
+        model = get_model()
+        if model is not None and hasattr(model, "get_stats"):
+            stats["model"] = model.get_stats()
+        return stats
+
     # ----------------- Descoberta ESP32 -----------------
-    def discover_esp32(self, attempts=5, wait=2.0):
+    def discover_esp32(self, timeout=10.0):
+        """Espera o primeiro ESP32 responder aos anúncios (a thread de descoberta segue anunciando)"""
         logger.info("Tentando descobrir ESP32...")
-        for _ in range(attempts):
-            self.udp.send_message("PING")
-            start = time.time()
-            while time.time() - start < wait:
-                if self.esp_ip:
-                    logger.success(f"ESP32 encontrado em {self.esp_ip}")
-                    return self.esp_ip
-                time.sleep(0.1)
-        logger.warning("ESP32 não encontrado")
+        if self.discovery.wait_for_peer(timeout):
+            devices = self.devices.all()
+            if devices:
+                logger.success(f"ESP32 encontrado em {devices[0].ip}")
+                return devices[0].ip
+        logger.warning(f"ESP32 não encontrado em {timeout:.0f}s; os anúncios continuam em segundo plano")
         return None
 
 # ----------------- Execução -----------------
@@ -92,7 +284,12 @@ if __name__ == "__main__":
     try:
         pc.discover_esp32()
         logger.info("Sistema PC pronto. Aguardando comunicação segura...")
+        last_stats = time.time()
         while True:
             time.sleep(1)
+            pc.model_manager.check_deploy_request()
+            if time.time() - last_stats >= PipelineConfig.STATS_LOG_INTERVAL:
+                last_stats = time.time()
+                logger.info(f"Métricas: {pc.get_stats()}")
     except KeyboardInterrupt:
         pc.stop()
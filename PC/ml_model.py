@@ -1,19 +1,39 @@
+import os
+import time
+import threading
 import numpy as np
 import traceback
-from typing import Optional, Dict, Any
-from config import MLConfig
-from utils import log_info, log_error
-from camera import capture_image, save_image_to_test
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, Callable, List, Sequence, Tuple
+from config import CameraConfig, MLConfig
+from utils import RollingStats, log_info, log_error
+from camera import (NoObjectDetected, capture_frame, capture_frames, crop_frames_to_object, preprocess_image,
+                    select_sharpest_frame)
+from image_writer import get_image_writer
+from result_cache import ResultCache
+from inference_backends import KerasBackend
 import cv2
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, Flatten, Input
-from resnet50 import ResNet50
 
 # --- Modelo ML ---
 class TrashNetModel:
-    def __init__(self, weights_path: str):
-        self.input_shape = (224, 224, 3)
-        self.classes = ["cardboard", "glass", "metal", "paper", "plastic", "trash"]
+    # Entra na chave do artefato em cache: qualquer mudança aqui força nova exportação
+    ARCH_CONFIG = {
+        "backbone": "resnet50",
+        "input_shape": [224, 224, 3],
+        "input_dtype": "uint8",     # Entrada RGB 0-255; a normalização é uma camada do grafo
+        "rescale": 1.0 / 255,
+        "fc_layers": [1024, 1024],
+        "num_classes": 6,
+    }
+    CLASSES = ["cardboard", "glass", "metal", "paper", "plastic", "trash"]
+
+    def __init__(self, weights_path: Optional[str], use_cache: bool = MLConfig.USE_MODEL_CACHE,
+                 backend: Optional[str] = None, arch_config: Optional[Dict[str, Any]] = None,
+                 classifier_mode: Optional[str] = None):
+        # Arquitetura (ver MODEL_REGISTRY); a padrão é a ResNet50 da produção
+        self.arch_config = dict(arch_config or self.ARCH_CONFIG)
+        self.input_shape = tuple(self.arch_config["input_shape"])
+        self.classes = list(self.CLASSES)
         self.cls_mapping = {
             "cardboard": "PAPELAO",
             "glass": "VIDRO",
@@ -22,89 +42,571 @@ class TrashNetModel:
             "plastic": "PLASTICO",
             "trash": "LIXO"
         }
-        self.model = self._build_model()
-        self.model.load_weights(weights_path)
+        # Modelo Keras em memória (None quando servido pelo artefato em cache)
+        self.model = None
+        backend = backend or MLConfig.INFERENCE_BACKEND
+        if weights_path and os.path.isdir(weights_path):
+            # Artefato SavedModel já exportado (ex.: implantação de um modelo novo)
+            from inference_backends import SavedModelBackend
+            self.backend = SavedModelBackend(weights_path)
+        elif weights_path and weights_path.endswith(".tflite"):
+            from inference_backends import TFLiteBackend
+            self.backend = TFLiteBackend(weights_path, MLConfig.TFLITE_NUM_THREADS)
+        elif weights_path and backend == "tflite":
+            from model_cache import load_or_convert_tflite
+            self.backend = load_or_convert_tflite(weights_path, self.arch_config, self._build_with_weights)
+        elif weights_path and use_cache:
+            from model_cache import load_or_export
+            self.backend = load_or_export(weights_path, self.arch_config, self._build_with_weights)
+        else:
+            self.model = self._build_model()
+            if weights_path:
+                self.model.load_weights(weights_path)
+            self.backend = KerasBackend(self.model)
+
+        # Classificador kNN sobre os embeddings do backbone (substitui a cabeça softmax)
+        self.knn = None
+        if (classifier_mode or MLConfig.CLASSIFIER_MODE) == "knn":
+            if self.supports_embeddings:
+                from embedding_index import load_embedding_index
+                self.knn = load_embedding_index()
+            else:
+                log_error(f"Backend {self.backend.name} não expõe embeddings; modo kNN indisponível")
 
-    def _build_model(self) -> Model:
-        inputs = Input(shape=self.input_shape)
-        x = ResNet50(input_tensor=inputs)
+    def _build_model(self) -> "Model":
+        # Importação tardia: o TensorFlow leva segundos para carregar
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import Dense, Flatten, Input, Rescaling
+
+        arch = self.arch_config
+        inputs = Input(shape=self.input_shape, dtype=arch["input_dtype"])
+        x = Rescaling(arch["rescale"], arch.get("offset", 0.0))(inputs)  # uint8 → float32
+        if arch["backbone"] == "resnet50":
+            from resnet50 import ResNet50
+            x = ResNet50(input_tensor=x)
+        elif arch["backbone"] == "mobilenetv2":
+            from tensorflow.keras.applications import MobileNetV2
+            x = MobileNetV2(input_tensor=x, include_top=False, weights=None,
+                            alpha=arch.get("alpha", 1.0), pooling=arch.get("pooling")).output
+        else:
+            raise ValueError(f"Backbone desconhecido: {arch['backbone']}")
         x = Flatten()(x)
-        x = Dense(1024, activation='relu')(x)
-        x = Dense(1024, activation='relu')(x)
-        predictions = Dense(6, activation='softmax')(x)
+        for units in arch["fc_layers"]:
+            x = Dense(units, activation='relu')(x)
+        predictions = Dense(arch["num_classes"], activation='softmax')(x)
         model = Model(inputs=inputs, outputs=predictions)
         return model
 
+    def _build_with_weights(self, weights_path: str) -> "Model":
+        model = self._build_model()
+        model.load_weights(weights_path)
+        return model
+
+    def _make_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        """Empilha as imagens (uint8 RGB) num único batch, redimensionando quando necessário"""
+        height, width = self.input_shape[:2]
+        batch = np.empty((len(images), height, width, self.input_shape[2]), dtype=np.uint8)
+        for i, image_array in enumerate(images):
+            if image_array.shape[:2] != (height, width):
+                image_array = cv2.resize(image_array, (width, height))
+            batch[i] = image_array
+        return batch
+
+    def _as_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        if isinstance(images, np.ndarray) and images.shape[1:] == self.input_shape and images.dtype == np.uint8:
+            return images
+        return self._make_batch(images)
+
+    @property
+    def supports_embeddings(self) -> bool:
+        return hasattr(self.backend, "embed_batch")
+
+    def predict_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        """Executa um único forward pass para N imagens e retorna as softmax (N, classes)"""
+        if self.knn is not None:
+            return self.predict_batch_with_embeddings(images)[0]
+        return self.backend.predict_batch(self._as_batch(images))
+
+    # ----------------- Backbone / cabeça -----------------
+    def embed_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        """Embeddings do backbone (saída da penúltima camada), (N, D)"""
+        return self.backend.embed_batch(self._as_batch(images))
+
+    def head(self, embeddings: np.ndarray) -> np.ndarray:
+        """Cabeça softmax treinada como operação de matriz: softmax(E·W + b)"""
+        kernel, bias = self.backend.head
+        logits = embeddings @ kernel + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def classify_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """(N, D) → (N, classes) pelo kNN local, se carregado, ou pela cabeça treinada"""
+        if self.knn is not None:
+            return self.knn.predict_proba(embeddings)
+        return self.head(embeddings)
+
+    def predict_batch_with_embeddings(self, images: Sequence[np.ndarray]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(probabilidades, embeddings); sem suporte a embeddings no backend, (probabilidades, None)"""
+        if not self.supports_embeddings:
+            return self.backend.predict_batch(self._as_batch(images)), None
+        embeddings = self.embed_batch(images)
+        return self.classify_embeddings(embeddings), embeddings
+
     def predict(self, image_array: np.ndarray) -> np.ndarray:
-        if image_array.shape[:2] != (224, 224):
-            image_resized = cv2.resize(image_array, (224, 224))
-        else:
-            image_resized = image_array
-        image_batch = np.expand_dims(image_resized, axis=0)
-        predictions = self.model.predict(image_batch, verbose=0)
-        return predictions[0]
+        return self.predict_batch([image_array])[0]
+
+# --- Ensemble ---
+def make_augmentations(image_array: np.ndarray, count: int) -> List[np.ndarray]:
+    """Gera até 12 variações baratas da imagem: original, flips e recortes centrais/cantos"""
+    height, width = image_array.shape[:2]
+    crop_h, crop_w = int(height * 0.9), int(width * 0.9)
+    offsets = [((height - crop_h) // 2, (width - crop_w) // 2),
+               (0, 0), (0, width - crop_w), (height - crop_h, 0), (height - crop_h, width - crop_w)]
+
+    views = [image_array, cv2.flip(image_array, 1)]
+    for top, left in offsets:
+        crop = cv2.resize(image_array[top:top + crop_h, left:left + crop_w], (width, height))
+        views.append(crop)
+        views.append(cv2.flip(crop, 1))
+    return views[:max(1, count)]
+
+def combine_predictions(probabilities: np.ndarray, method: str = MLConfig.ENSEMBLE_COMBINE) -> Tuple[int, float]:
+    """
+    Combina as softmax (K, classes) de um ensemble em (classe, confiança).
+    "mean": argmax da média. "vote": classe mais votada (empate decidido pela média);
+    em ambos a confiança é a probabilidade média da classe escolhida.
+    """
+    mean = probabilities.mean(axis=0)
+    if method == "vote":
+        votes = np.bincount(np.argmax(probabilities, axis=1), minlength=probabilities.shape[1])
+        candidates = np.flatnonzero(votes == votes.max())
+        predicted_class = int(candidates[np.argmax(mean[candidates])])
+    else:
+        predicted_class = int(np.argmax(mean))
+    return predicted_class, float(mean[predicted_class])
+
+# --- Registro de modelos e cascata ---
+MODEL_REGISTRY: Dict[str, Dict[str, Any]] = {
+    "trashnet": TrashNetModel.ARCH_CONFIG,
+    # Estágio barato: MobileNetV2 estreita com entrada reduzida, pesos próprios
+    "trashnet_lite": {
+        "backbone": "mobilenetv2",
+        "input_shape": [160, 160, 3],
+        "input_dtype": "uint8",
+        "rescale": 1.0 / 127.5,
+        "offset": -1.0,             # MobileNetV2 espera entrada em [-1, 1]
+        "alpha": 0.5,
+        "pooling": "avg",
+        "fc_layers": [256],
+        "num_classes": 6,
+    },
+}
+
+def build_model(name: str, weights_path: Optional[str], **kwargs) -> TrashNetModel:
+    """Instancia uma arquitetura do MODEL_REGISTRY com os pesos informados"""
+    if name not in MODEL_REGISTRY:
+        raise ValueError(f"Modelo desconhecido: {name} (use um de {list(MODEL_REGISTRY)})")
+    return TrashNetModel(weights_path, arch_config=MODEL_REGISTRY[name], **kwargs)
+
+class CascadeStage:
+    def __init__(self, name: str, model: Any, threshold: Optional[float]):
+        self.name = name
+        self.model = model
+        self.threshold = threshold  # None: último estágio, aceita tudo
+        self.seen = 0               # Imagens que chegaram ao estágio
+        self.accepted = 0           # Imagens respondidas pelo estágio
+        self.times = RollingStats() # Tempo do estágio por imagem (s)
+
+class CascadeModel:
+    """
+    Cascata por confiança: cada imagem passa pelos estágios em ordem e fica com a primeira
+    resposta cuja confiança top-1 atinja o limiar do estágio; o último (o TrashNetModel
+    completo) responde o que sobrar. A decisão é por imagem, então as vistas de um
+    ensemble podem ser respondidas por estágios diferentes. Expõe a mesma interface do
+    TrashNetModel usada pelo scheduler (sem embeddings: as dimensões diferem entre estágios).
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Any, Optional[float]]]):
+        if not stages:
+            raise ValueError("A cascata precisa de ao menos um estágio")
+        self.stages = [CascadeStage(name, model, threshold) for name, model, threshold in stages]
+        self.stages[-1].threshold = None
+        final = self.stages[-1].model
+        self.classes = final.classes
+        self.cls_mapping = final.cls_mapping
+        self.input_shape = final.input_shape
+        self.images = 0
+        self.latency = RollingStats()  # Tempo total da cascata por imagem (s)
+
+    def predict_batch(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        start = time.monotonic()
+        count = len(images)
+        probabilities = None
+        pending = np.arange(count)
+        for stage in self.stages:
+            if not len(pending):
+                break
+            subset = images[pending] if isinstance(images, np.ndarray) else [images[i] for i in pending]
+            stage_start = time.monotonic()
+            stage_probabilities = stage.model.predict_batch(subset)
+            stage.times.add((time.monotonic() - stage_start) / len(pending))
+            stage.seen += len(pending)
+
+            if probabilities is None:
+                probabilities = np.empty((count, stage_probabilities.shape[1]), dtype=np.float32)
+            probabilities[pending] = stage_probabilities
+            if stage.threshold is None:
+                stage.accepted += len(pending)
+                break
+            confident = stage_probabilities.max(axis=1) >= stage.threshold
+            stage.accepted += int(confident.sum())
+            pending = pending[~confident]
+
+        self.images += count
+        self.latency.add((time.monotonic() - start) / max(1, count))
+        return probabilities
+
+    def predict(self, image_array: np.ndarray) -> np.ndarray:
+        return self.predict_batch([image_array])[0]
+
+    def warmup(self):
+        """Aquece todos os estágios (o último só recebe imagens de baixa confiança)"""
+        for stage in self.stages:
+            stage.model.predict_batch(np.zeros((1,) + tuple(stage.model.input_shape), dtype=np.uint8))
+
+    def stop(self):
+        for stage in self.stages:
+            if hasattr(stage.model, "stop"):
+                stage.model.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxa de acerto de cada estágio (fração de todas as imagens) e latência média resultante"""
+        return {
+            "images": self.images,
+            "latency_per_image": self.latency.summary(),
+            "stages": [{
+                "name": stage.name,
+                "threshold": stage.threshold,
+                "seen": stage.seen,
+                "accepted": stage.accepted,
+                "reach_rate": stage.seen / self.images if self.images else 0.0,
+                "hit_rate": stage.accepted / self.images if self.images else 0.0,
+                "time_per_image": stage.times.summary(),
+            } for stage in self.stages],
+        }
+
+def build_serving_model(weights_path: str) -> Any:
+    """TrashNetModel, ou a cascata com os estágios baratos de MLConfig.CASCADE_STAGES"""
+    model = TrashNetModel(weights_path)
+    if not MLConfig.USE_CASCADE or not MLConfig.CASCADE_STAGES:
+        return model
+    stages = [(name, build_model(name, stage_weights, classifier_mode="softmax"), threshold)
+              for name, stage_weights, threshold in MLConfig.CASCADE_STAGES]
+    stages.append(("trashnet", model, None))
+    log_info("Cascata de modelos: " + " → ".join(name for name, _, _ in stages))
+    return CascadeModel(stages)
 
 # --- Carregamento global do modelo ---
-def load_model() -> Optional[TrashNetModel]:
+def load_model(weights_path: Optional[str] = None) -> Optional[TrashNetModel]:
     try:
-        weights_path = MLConfig.MODEL_WEIGHTS_PATH
-        model = TrashNetModel(weights_path)
-        log_info("Modelo TrashNet carregado com sucesso")
+        weights_path = weights_path or MLConfig.MODEL_WEIGHTS_PATH
+        if MLConfig.INFERENCE_MODE == "process":
+            # Inferência isolada em processos; frames trocados por memória compartilhada
+            from inference_worker import ProcessInferencePool
+            model = ProcessInferencePool(weights_path)
+            if not model.start():
+                model.stop()
+                raise RuntimeError("nenhum worker de inferência ficou pronto")
+        else:
+            model = build_serving_model(weights_path)
+        log_info(f"Modelo TrashNet carregado com sucesso ({weights_path})")
         return model
     except Exception as e:
         log_error(f"Falha ao carregar modelo TrashNet: {e}")
         return None
 
-MODEL = load_model()
+def warmup_model(model: Any):
+    """Inferência de aquecimento: traça o grafo antes do primeiro pedido real"""
+    if hasattr(model, "warmup"):
+        model.warmup()
+    else:
+        model.predict_batch(np.zeros((1,) + tuple(model.input_shape), dtype=np.uint8))
+
+class ModelLoader:
+    """Carrega o modelo em segundo plano e expõe o estado de prontidão"""
+
+    IDLE = "IDLE"
+    LOADING = "LOADING"
+    WARMING_UP = "WARMING_UP"
+    READY = "READY"
+    FAILED = "FAILED"
+
+    def __init__(self, factory: Callable[[], Optional[TrashNetModel]] = load_model):
+        self.factory = factory
+        self.state = self.IDLE
+        self.model: Optional[TrashNetModel] = None
+        self.ready_event = threading.Event()
+        self.callbacks: List[Callable[["ModelLoader"], None]] = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+        # Tempos de inicialização (s)
+        self.load_time: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.state = self.LOADING
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        log_info("Carregamento do modelo iniciado em segundo plano")
+
+    def _run(self):
+        start = time.monotonic()
+        model = self.factory()
+        if model is None:
+            self.state = self.FAILED
+            self._notify()
+            return
+        self.load_time = time.monotonic() - start
+
+        self.state = self.WARMING_UP
+        start = time.monotonic()
+        try:
+            warmup_model(model)
+        except Exception as e:
+            log_error(f"Falha na inferência de aquecimento: {e}")
+            self.state = self.FAILED
+            self._notify()
+            return
+        self.warmup_time = time.monotonic() - start
+
+        self.model = model
+        self.state = self.READY
+        log_info(f"Modelo pronto (carga {self.load_time:.1f} s, aquecimento {self.warmup_time:.1f} s)")
+        self._notify()
+
+    def _notify(self):
+        self.ready_event.set()
+        with self.lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                log_error(f"Erro no callback de prontidão do modelo: {e}")
+
+    def add_callback(self, callback: Callable[["ModelLoader"], None]):
+        """Chamado quando o carregamento termina (READY ou FAILED)"""
+        with self.lock:
+            self.callbacks.append(callback)
+            finished = self.ready_event.is_set()
+        if finished:
+            callback(self)
+
+    def is_ready(self) -> bool:
+        return self.state == self.READY
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        self.ready_event.wait(timeout)
+        return self.is_ready()
+
+    def get(self) -> Optional[TrashNetModel]:
+        return self.model
+
+    def replace(self, model: Any) -> Optional[Any]:
+        """Troca o modelo servido (atômico entre pedidos); retorna o anterior"""
+        with self.lock:
+            previous, self.model = self.model, model
+        return previous
+
+    def stop(self):
+        """Libera recursos do modelo (ex.: processos de inferência)"""
+        if self.model is not None and hasattr(self.model, "stop"):
+            self.model.stop()
+
+MODEL_LOADER = ModelLoader()
+
+def start_model_loading() -> ModelLoader:
+    MODEL_LOADER.start()
+    return MODEL_LOADER
+
+def get_model() -> Optional[TrashNetModel]:
+    """Modelo pronto para uso, ou None enquanto carrega/aquece"""
+    return MODEL_LOADER.get()
+
+# --- Cache de resultados (cenas repetidas) ---
+RESULT_CACHE: Optional[ResultCache] = ResultCache() if MLConfig.USE_RESULT_CACHE else None
+
+def submit_views(views: List[np.ndarray], submit: Callable[..., Future],
+                 device: Optional[str] = None) -> Future:
+    """
+    Envia as vistas para inferência via `submit(views, device, with_embeddings=True)`,
+    respondendo direto do cache quando a vista principal repete uma cena recente do
+    mesmo dispositivo. O Future resolve com (probabilidades (K, classes), embeddings
+    (K, D) ou None).
+    """
+    if RESULT_CACHE is None:
+        return submit(views, device, with_embeddings=True)
+
+    key = RESULT_CACHE.key(views[0])
+    cached = RESULT_CACHE.get(key, device)
+    if cached is not None and len(cached[0]) == len(views):
+        log_info("Cena repetida, resultado reaproveitado do cache")
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def store(done: Future):
+        if not done.cancelled() and done.exception() is None:
+            RESULT_CACHE.put(key, done.result(), device)
+
+    future = submit(views, device, with_embeddings=True)
+    future.add_done_callback(store)
+    return future
+
+def _predict_now(views: List[np.ndarray], device: Optional[str] = None, with_embeddings: bool = False) -> Future:
+    """Predição síncrona no modelo carregado, embrulhada num Future já resolvido"""
+    future = Future()
+    try:
+        start_model_loading().wait_ready(MLConfig.INFERENCE_TIMEOUT)
+        model = get_model()
+        if model is None:
+            raise RuntimeError("Modelo não carregado")
+        if not with_embeddings:
+            future.set_result(model.predict_batch(views))
+        elif hasattr(model, "predict_batch_with_embeddings"):
+            future.set_result(model.predict_batch_with_embeddings(views))
+        else:
+            future.set_result((model.predict_batch(views), None))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
 # --- Classificação ---
-def classify_waste() -> Optional[Dict[str, Any]]:
+def _capture_views(ensemble_size: int, source: str, camera_index: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Captura e pré-processa as K vistas da classificação (a primeira é a mais nítida),
+    recortadas no objeto. Levanta NoObjectDetected se o frame não difere do fundo.
+    """
+    if ensemble_size > 1 and source == "burst":
+        frames = capture_frames(camera_index, count=ensemble_size)
+        if not frames:
+            return []
+        best, _ = select_sharpest_frame(frames)
+        frames.insert(0, frames.pop(best))
+        frames = crop_frames_to_object(frames, camera_index)
+        # Pré-processa direto nas posições de um único batch uint8
+        batch = np.empty((len(frames),) + tuple(MLConfig.MODEL_INPUT_SHAPE), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            if preprocess_image(frame, out=batch[i]) is None:
+                return []
+        return list(batch)
+
+    frame = capture_frame(camera_index)
+    if frame is None:
+        return []
+    frame = crop_frames_to_object([frame], camera_index)[0]
+    processed_img = preprocess_image(frame)
+    if processed_img is None:
+        return []
+    if ensemble_size > 1:
+        return make_augmentations(processed_img, ensemble_size)
+    return [processed_img]
+
+def interpret_prediction(model: TrashNetModel, predicted_class: int, confidence: float) -> Optional[Dict[str, Any]]:
+    """Converte (classe, confiança) do modelo no resultado do sistema, aplicando o limiar"""
+    original_class_name = model.classes[predicted_class]
+    system_class_name = model.cls_mapping.get(original_class_name, original_class_name.upper())
+
+    log_info(f"Classe detectada: {original_class_name} → Sistema: {system_class_name} (Confiança: {confidence:.2%})")
+
+    if confidence < MLConfig.CONFIDENCE_THRESHOLD:
+        log_error(f"Baixa confiança ({confidence:.2%})")
+        return None
+
     try:
-        log_info("=== INICIANDO CLASSIFICAÇÃO AUTOMÁTICA ===")
-        
-        # 1. Captura imagem
-        processed_img = capture_image()
-        if processed_img is None:
-            log_error("Falha na captura da imagem")
-            return None
+        system_index = MLConfig.WASTE_TYPES.index(system_class_name)
+    except ValueError:
+        log_error(f"Classe {system_class_name} não encontrada no sistema")
+        return None
 
-        # 2. Salva imagem
-        saved_filename = save_image_to_test(processed_img, "waste_capture")
-        if saved_filename is None:
-            log_error("Falha ao salvar imagem")
-            return None
+    return {
+        "index": system_index,
+        "name": system_class_name,
+        "confidence": confidence
+    }
 
-        # 3. Modelo
-        model = MODEL
-        if model is None:
-            log_error("Modelo não carregado")
-            return None
+def capture_for_classification(ensemble_size: Optional[int] = None,
+                               camera_index: Optional[int] = None) -> List[np.ndarray]:
+    """Captura as vistas de uma classificação; lista vazia em caso de falha, NoObjectDetected em gatilho falso"""
+    ensemble_size = ensemble_size or MLConfig.ENSEMBLE_SIZE
 
-        # 4. Predição
-        probabilities = model.predict(processed_img)
-        predicted_class = int(np.argmax(probabilities))
-        confidence = float(probabilities[predicted_class])
+    # 1. Captura imagem (ou rajada/variações para o ensemble)
+    views = _capture_views(ensemble_size, MLConfig.ENSEMBLE_SOURCE, camera_index)
+    if not views:
+        log_error("Falha na captura da imagem")
+        return []
 
-        original_class_name = model.classes[predicted_class]
-        system_class_name = model.cls_mapping.get(original_class_name, original_class_name.upper())
+    return views
 
-        log_info(f"Classe detectada: {original_class_name} → Sistema: {system_class_name} (Confiança: {confidence:.2%})")
+def record_capture(image_array: np.ndarray, probabilities: Optional[np.ndarray] = None,
+                   device: Optional[str] = None, combine: Optional[str] = None,
+                   embedding: Optional[np.ndarray] = None):
+    """
+    Enfileira a vista principal para gravação em segundo plano, com a classe prevista e a
+    confiança (antes do limiar) para o índice do capture store, e o embedding do backbone
+    se houver. Sem probabilidades (falha na inferência) a captura é gravada sem rótulo.
+    """
+    if not CameraConfig.SAVE_IMAGES:
+        return
+    metadata = {"device": device}
+    if embedding is not None and MLConfig.STORE_EMBEDDINGS:
+        metadata["embedding"] = embedding
+    model = get_model()
+    if probabilities is not None and model is not None:
+        predicted_class, confidence = combine_predictions(probabilities, combine or MLConfig.ENSEMBLE_COMBINE)
+        metadata["label"] = model.classes[predicted_class]
+        metadata["confidence"] = confidence
+    get_image_writer().submit(image_array, "waste_capture", metadata)
 
-        if confidence < MLConfig.CONFIDENCE_THRESHOLD:
-            log_error(f"Baixa confiança ({confidence:.2%})")
-            return None
+def classify_probabilities(probabilities: np.ndarray, combine: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Combina as softmax (K, classes) das vistas e aplica o limiar de confiança"""
+    model = get_model()
+    if model is None:
+        log_error("Modelo não carregado")
+        return None
+
+    combine = combine or MLConfig.ENSEMBLE_COMBINE
+    predicted_class, confidence = combine_predictions(probabilities, combine)
+    if len(probabilities) > 1:
+        log_info(f"Ensemble de {len(probabilities)} vistas combinado por '{combine}'")
+    return interpret_prediction(model, predicted_class, confidence)
+
+def classify_waste(ensemble_size: Optional[int] = None, combine: Optional[str] = None,
+                   scheduler=None) -> Optional[Dict[str, Any]]:
+    try:
+        log_info("=== INICIANDO CLASSIFICAÇÃO AUTOMÁTICA ===")
 
         try:
-            system_index = MLConfig.WASTE_TYPES.index(system_class_name)
-        except ValueError:
-            log_error(f"Classe {system_class_name} não encontrada no sistema")
+            views = capture_for_classification(ensemble_size)
+        except NoObjectDetected as e:
+            log_info(f"Classificação dispensada: {e}")
+            return None
+        if not views:
             return None
 
-        return {
-            "index": system_index,
-            "name": system_class_name,
-            "confidence": confidence
-        }
+        # 3. Predição (um único batch com as K vistas, agrupado pelo scheduler se houver)
+        submit = scheduler.submit if scheduler is not None else _predict_now
+        probabilities, embeddings = submit_views(views, submit).result(timeout=MLConfig.INFERENCE_TIMEOUT)
+
+        # 4. Salva a captura em segundo plano (uma falha de gravação não afeta a classificação)
+        record_capture(views[0], probabilities, combine=combine,
+                       embedding=None if embeddings is None else embeddings[0])
+        return classify_probabilities(probabilities, combine)
 
     except Exception as e:
         log_error(f"ERRO na classificação ML: {e}")
@@ -0,0 +1,212 @@
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List
+import cv2
+import numpy as np
+from config import MLConfig
+from utils import get_logger
+from inference_backends import SavedModelBackend, TFLiteBackend, convert_to_tflite
+
+logger = get_logger("ModelCache")
+
+# Arquivo com os digests já calculados, indexados por (caminho, tamanho, mtime)
+_DIGESTS_FILE = "weights_digests.json"
+
+# Versão do formato do artefato (assinaturas, arquivos extras); entra na chave
+ARTIFACT_VERSION = 2  # 2: assinatura "embed" e head.npz
+
+def _load_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def weights_digest(weights_path: str, cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> str:
+    """SHA-256 do arquivo de pesos, reaproveitado enquanto tamanho e mtime não mudarem"""
+    stat = os.stat(weights_path)
+    memo_key = f"{os.path.abspath(weights_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo_path = os.path.join(cache_dir, _DIGESTS_FILE)
+    memo = _load_json(memo_path)
+    if memo_key in memo:
+        return memo[memo_key]
+
+    sha = hashlib.sha256()
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    memo[memo_key] = digest
+    # Estágios da cascata, workers e o candidato da troca a quente calculam ao mesmo tempo:
+    # cada um grava num temporário próprio e troca o arquivo de uma vez
+    tmp_path = f"{memo_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(memo, f, indent=2)
+        os.replace(tmp_path, memo_path)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar {memo_path}: {e}")
+    return digest
+
+def cache_key(weights_path: str, arch_config: Dict[str, Any], cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> str:
+    """Chave do artefato: hash dos pesos + configuração da arquitetura"""
+    sha = hashlib.sha256()
+    sha.update(weights_digest(weights_path, cache_dir).encode())
+    sha.update(json.dumps(arch_config, sort_keys=True).encode())
+    sha.update(f"artifact-v{ARTIFACT_VERSION}".encode())
+    return sha.hexdigest()
+
+def artifact_path(key: str, cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"trashnet-{key[:16]}")
+
+def export_artifact(keras_model, path: str, arch_config: Dict[str, Any], key: str, weights_path: str):
+    """
+    Exporta o modelo como SavedModel; grava em diretório temporário e renomeia no final.
+    Além da assinatura completa, exporta "embed" (backbone até a penúltima camada) e os
+    pesos da cabeça softmax em head.npz.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.models import Model
+
+    input_shape = [None] + list(arch_config["input_shape"])
+    input_dtype = arch_config.get("input_dtype", "float32")
+
+    embed_model = Model(inputs=keras_model.inputs, outputs=keras_model.layers[-2].output)
+    spec = tf.TensorSpec(input_shape, getattr(tf, input_dtype), name="images")
+
+    @tf.function(input_signature=[spec])
+    def serving_default(images):
+        return {"probabilities": keras_model(images, training=False)}
+
+    @tf.function(input_signature=[spec])
+    def embed(images):
+        return {"embeddings": embed_model(images, training=False)}
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    module = tf.Module()
+    module.model = keras_model
+    module.embed_model = embed_model
+    tf.saved_model.save(module, tmp_path, signatures={"serving_default": serving_default, "embed": embed})
+
+    kernel, bias = keras_model.layers[-1].get_weights()
+    np.savez(os.path.join(tmp_path, "head.npz"), kernel=kernel, bias=bias)
+
+    with open(os.path.join(tmp_path, "trashnet_meta.json"), "w") as f:
+        json.dump({"key": key, "arch": arch_config, "weights": os.path.abspath(weights_path),
+                   "created": time.time()}, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def prune_artifacts(key: str, weights_path: str, arch_config: Dict[str, Any],
+                    cache_dir: str = MLConfig.MODEL_CACHE_DIR):
+    """
+    Remove artefatos (SavedModel e TFLite) de chaves antigas do mesmo modelo: mesmo arquivo
+    de pesos e mesma arquitetura. Os de outros modelos (estágios da cascata, candidato de
+    um hot-swap) ficam.
+    """
+    weights = os.path.abspath(weights_path)
+    keep = os.path.basename(artifact_path(key, cache_dir))
+    for name in os.listdir(cache_dir):
+        full = os.path.join(cache_dir, name)
+        if name == keep or not name.startswith("trashnet-") or not os.path.isdir(full):
+            continue
+        meta = _load_json(os.path.join(full, "trashnet_meta.json"))
+        if meta.get("weights") != weights or meta.get("arch") != json.loads(json.dumps(arch_config)):
+            continue
+        shutil.rmtree(full, ignore_errors=True)
+        for converted in glob.glob(f"{full}-*.tflite"):
+            os.remove(converted)
+        logger.info(f"Artefato antigo removido: {full}")
+
+def ensure_artifact(weights_path: str, arch_config: Dict[str, Any],
+                    build_keras: Callable[[str], Any],
+                    cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> str:
+    """
+    Retorna o caminho do SavedModel para (pesos, arquitetura); se a chave mudou ou o
+    artefato não existe, reconstrói o modelo Keras e exporta.
+    """
+    key = cache_key(weights_path, arch_config, cache_dir)
+    path = artifact_path(key, cache_dir)
+
+    meta = _load_json(os.path.join(path, "trashnet_meta.json"))
+    if meta.get("key") != key:
+        logger.info(f"Artefato não encontrado para a chave {key[:16]}, exportando...")
+        start = time.monotonic()
+        keras_model = build_keras(weights_path)
+        export_artifact(keras_model, path, arch_config, key, weights_path)
+        prune_artifacts(key, weights_path, arch_config, cache_dir)
+        logger.info(f"Artefato exportado em {time.monotonic() - start:.1f} s: {path}")
+    return path
+
+def load_or_export(weights_path: str, arch_config: Dict[str, Any],
+                   build_keras: Callable[[str], Any],
+                   cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> SavedModelBackend:
+    """Carrega o artefato SavedModel em cache, exportando-o antes se necessário"""
+    path = ensure_artifact(weights_path, arch_config, build_keras, cache_dir)
+
+    start = time.monotonic()
+    backend = SavedModelBackend(path)
+    logger.info(f"Artefato carregado em {time.monotonic() - start:.1f} s: {path}")
+    return backend
+
+# --- TFLite ---
+def load_calibration_images(directory: str = MLConfig.TFLITE_CALIBRATION_DIR,
+                            limit: int = MLConfig.TFLITE_CALIBRATION_SIZE) -> List[np.ndarray]:
+    """
+    Imagens capturadas em produção, pré-processadas como na classificação: as mais recentes
+    do capture store ou, se ele estiver vazio, as da pasta `directory`.
+    """
+    from camera import preprocess_image
+    from capture_store import CaptureStoreReader
+
+    images = []
+    for batch, _ in CaptureStoreReader().iter_batches(newest=limit):
+        images.extend(batch)
+    if images:
+        return images
+
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.png")))
+    for path in paths[-limit:]:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        processed = preprocess_image(frame)
+        if processed is not None:
+            images.append(processed)
+    return images
+
+def tflite_path(weights_path: str, arch_config: Dict[str, Any], quantization: str,
+                build_keras: Callable[[str], Any],
+                cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> str:
+    """Converte (uma vez por chave e quantização) o SavedModel em cache para .tflite"""
+    saved_model = ensure_artifact(weights_path, arch_config, build_keras, cache_dir)
+    path = f"{saved_model}-{quantization}.tflite"
+    if not os.path.exists(path):
+        calibration = None
+        if quantization in ("int8", "int8_fallback"):
+            calibration = load_calibration_images()
+            if not calibration:
+                logger.error("Sem imagens de calibração para int8, usando quantização dinâmica")
+                return tflite_path(weights_path, arch_config, "dynamic", build_keras, cache_dir)
+        logger.info(f"Convertendo para TFLite ({quantization})...")
+        convert_to_tflite(saved_model, path, quantization, calibration)
+    return path
+
+def load_or_convert_tflite(weights_path: str, arch_config: Dict[str, Any],
+                           build_keras: Callable[[str], Any],
+                           quantization: str = MLConfig.TFLITE_QUANTIZATION,
+                           num_threads: int = MLConfig.TFLITE_NUM_THREADS,
+                           cache_dir: str = MLConfig.MODEL_CACHE_DIR) -> TFLiteBackend:
+    path = tflite_path(weights_path, arch_config, quantization, build_keras, cache_dir)
+    backend = TFLiteBackend(path, num_threads)
+    logger.info(f"Backend TFLite carregado: {path} ({num_threads} thread(s))")
+    return backend
@@ -0,0 +1,313 @@
+"""
+Troca de modelo sem parada.
+
+O candidato (pesos .h5, artefato SavedModel ou .tflite) carrega e aquece em segundo
+plano enquanto o modelo atual continua servindo. Opcionalmente roda em sombra sobre os
+mesmos batches do scheduler, registrando concordância e latência; depois assume entre
+dois batches e fica em observação, com rollback se a taxa de erro ou a latência piorar.
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from config import MLConfig
+from utils import RollingStats, get_logger
+from ml_model import MODEL_LOADER, RESULT_CACHE, ModelLoader, load_model, warmup_model
+
+logger = get_logger("ModelManager")
+
+class ModelHealth:
+    """Falhas e latência por imagem de um modelo em produção"""
+
+    def __init__(self):
+        self.images = 0
+        self.failures = 0
+        self.latency = RollingStats()
+
+    def record(self, count: int, elapsed: float, failed: bool):
+        self.images += count
+        if failed:
+            self.failures += count
+        else:
+            self.latency.add(elapsed / max(1, count))
+
+    @property
+    def error_rate(self) -> float:
+        return self.failures / self.images if self.images else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {"images": self.images, "error_rate": self.error_rate, "latency_per_image": self.latency.summary()}
+
+class ModelManager:
+    """
+    Implanta um modelo novo sem interromper as classificações:
+    LOADING → (SHADOW) → PROBATION → IDLE, com rollback automático na observação.
+    O modelo servido é o do ModelLoader; a troca é uma atribuição entre batches.
+    """
+
+    IDLE = "IDLE"
+    LOADING = "LOADING"
+    SHADOW = "SHADOW"
+    PROBATION = "PROBATION"
+
+    def __init__(self, loader: ModelLoader = MODEL_LOADER,
+                 factory: Callable[[str], Optional[Any]] = load_model,
+                 request_path: str = MLConfig.DEPLOY_REQUEST_PATH):
+        self.loader = loader
+        self.factory = factory
+        self.request_path = request_path
+        # Um pedido já existente ao iniciar é de uma execução anterior
+        self.request_mtime: Optional[float] = self._request_mtime()
+        self.state = self.IDLE
+        self.lock = threading.Lock()
+
+        self.candidate: Optional[Any] = None
+        self.candidate_path: Optional[str] = None
+        self.previous: Optional[Any] = None    # Mantido até o fim da observação (rollback)
+        self.baseline: Optional[ModelHealth] = None
+        self.health: Dict[int, ModelHealth] = {}
+        self.history: deque = deque(maxlen=20)
+
+        # Sombra: batches (imagens, probabilidades do modelo atual, latência por imagem)
+        self.shadow_queue: deque = deque(maxlen=MLConfig.SHADOW_QUEUE_SIZE)
+        self.shadow_condition = threading.Condition()
+        self.shadow_started = 0.0
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+        self.shadow_failures = 0
+        self.shadow_skipped = 0
+        self.shadow_active_latency = RollingStats()
+        self.shadow_candidate_latency = RollingStats()
+
+    # ----------------- Implantação -----------------
+    def deploy(self, weights_path: str) -> bool:
+        """Inicia a implantação em segundo plano; False se outra estiver em andamento"""
+        with self.lock:
+            if self.state != self.IDLE or not self.loader.is_ready():
+                logger.warning(f"Implantação de {weights_path} ignorada (estado {self.state})")
+                return False
+            self.state = self.LOADING
+            self.candidate_path = weights_path
+        threading.Thread(target=self._load_candidate, args=(weights_path,), daemon=True).start()
+        return True
+
+    def _request_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.request_path)
+        except OSError:
+            return None
+
+    def check_deploy_request(self):
+        """Implanta o caminho escrito em `request_path` sempre que o arquivo muda"""
+        mtime = self._request_mtime()
+        if mtime is None or mtime == self.request_mtime:
+            return
+        self.request_mtime = mtime
+        with open(self.request_path, encoding="utf-8") as f:
+            weights_path = f.read().strip()
+        if weights_path:
+            self.deploy(weights_path)
+
+    def _load_candidate(self, weights_path: str):
+        logger.info(f"Carregando modelo candidato {weights_path}")
+        start = time.monotonic()
+        model = self.factory(weights_path)
+        try:
+            if model is None:
+                raise RuntimeError("falha no carregamento")
+            warmup_model(model)
+        except Exception as e:
+            logger.error(f"Candidato {weights_path} descartado: {e}")
+            self._release(model)
+            self._finish("failed", weights_path, str(e))
+            return
+        logger.info(f"Candidato pronto em {time.monotonic() - start:.1f} s")
+
+        with self.lock:
+            self.candidate = model
+            if MLConfig.SHADOW_MIN_IMAGES <= 0:
+                self._promote_locked()
+                return
+            self._reset_shadow()
+            self.state = self.SHADOW
+        threading.Thread(target=self._shadow_worker, daemon=True).start()
+
+    def _finish(self, event: str, weights_path: Optional[str], detail: str = ""):
+        self.history.append({"time": time.time(), "event": event, "weights": weights_path, "detail": detail})
+        with self.lock:
+            self.state = self.IDLE
+            self.candidate = None
+
+    @staticmethod
+    def _release(model: Optional[Any]):
+        """Libera o modelo fora da thread do scheduler (processos de inferência podem demorar)"""
+        if model is not None and hasattr(model, "stop"):
+            threading.Thread(target=model.stop, daemon=True).start()
+
+    # ----------------- Observação dos batches (thread do scheduler) -----------------
+    def observe(self, model: Any, images: Sequence[np.ndarray], probabilities: Optional[np.ndarray],
+                elapsed: float):
+        """Registra um batch servido por `model` (probabilidades None = falha na inferência)"""
+        failed = probabilities is None
+        with self.lock:
+            health = self.health.setdefault(id(model), ModelHealth())
+            health.record(len(images), elapsed, failed)
+            state = self.state
+            active = model is self.loader.get()
+
+        if state == self.SHADOW and active and not failed:
+            with self.shadow_condition:
+                if len(self.shadow_queue) == self.shadow_queue.maxlen:
+                    self.shadow_skipped += 1
+                self.shadow_queue.append((images, probabilities, elapsed / max(1, len(images))))
+                self.shadow_condition.notify()
+        elif state == self.PROBATION and active:
+            self._check_probation(health)
+
+    # ----------------- Sombra -----------------
+    def _reset_shadow(self):
+        self.shadow_queue.clear()
+        self.shadow_started = time.monotonic()
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+        self.shadow_failures = 0
+        self.shadow_skipped = 0
+        self.shadow_active_latency = RollingStats()
+        self.shadow_candidate_latency = RollingStats()
+
+    def _shadow_worker(self):
+        candidate = self.candidate
+        while self.state == self.SHADOW:
+            with self.shadow_condition:
+                if not self.shadow_queue:
+                    self.shadow_condition.wait(timeout=1.0)
+                item = self.shadow_queue.popleft() if self.shadow_queue else None
+
+            if item is not None:
+                images, active_probabilities, active_latency = item
+                start = time.monotonic()
+                try:
+                    probabilities = candidate.predict_batch(images)
+                except Exception as e:
+                    logger.error(f"Falha do candidato em sombra: {e}")
+                    self.shadow_failures += len(images)
+                else:
+                    self.shadow_candidate_latency.add((time.monotonic() - start) / max(1, len(images)))
+                    self.shadow_agreed += int((np.argmax(probabilities, axis=1) ==
+                                               np.argmax(active_probabilities, axis=1)).sum())
+                self.shadow_active_latency.add(active_latency)
+                self.shadow_compared += len(images)
+
+            if self.shadow_compared >= MLConfig.SHADOW_MIN_IMAGES:
+                self._decide_shadow()
+                return
+            if time.monotonic() - self.shadow_started > MLConfig.SHADOW_TIMEOUT:
+                self._reject(f"sombra sem tráfego suficiente ({self.shadow_compared} imagens)")
+                return
+
+    def _decide_shadow(self):
+        agreement = self.shadow_agreed / self.shadow_compared
+        error_rate = self.shadow_failures / self.shadow_compared
+        active_latency = self.shadow_active_latency.summary()["mean"]
+        candidate_latency = self.shadow_candidate_latency.summary()["mean"]
+        logger.info(f"Sombra: concordância {agreement:.1%}, erros {error_rate:.1%}, latência/imagem "
+                    f"{candidate_latency * 1000:.1f} ms (atual {active_latency * 1000:.1f} ms)")
+
+        if agreement < MLConfig.SHADOW_MIN_AGREEMENT:
+            self._reject(f"concordância {agreement:.1%} abaixo de {MLConfig.SHADOW_MIN_AGREEMENT:.0%}")
+        elif error_rate > MLConfig.ROLLBACK_ERROR_MARGIN:
+            self._reject(f"taxa de erro {error_rate:.1%} em sombra")
+        elif active_latency and candidate_latency > active_latency * MLConfig.ROLLBACK_LATENCY_RATIO:
+            self._reject(f"latência {candidate_latency / active_latency:.1f}x a do modelo atual")
+        else:
+            with self.lock:
+                self._promote_locked()
+
+    def _reject(self, reason: str):
+        logger.warning(f"Candidato {self.candidate_path} rejeitado: {reason}")
+        self._release(self.candidate)
+        self._finish("rejected", self.candidate_path, reason)
+
+    # ----------------- Troca e rollback -----------------
+    def _promote_locked(self):
+        """Troca o modelo servido pelo candidato (chamado com self.lock)"""
+        current = self.loader.get()
+        self.baseline = self.health.get(id(current), ModelHealth())
+        self.previous = self.loader.replace(self.candidate)
+        self.health[id(self.candidate)] = ModelHealth()
+        self.candidate = None
+        self.state = self.PROBATION
+        if RESULT_CACHE is not None:
+            RESULT_CACHE.clear()  # Resultados do modelo anterior
+        self.history.append({"time": time.time(), "event": "promoted", "weights": self.candidate_path, "detail": ""})
+        logger.info(f"Modelo {self.candidate_path} em produção (em observação)")
+
+    def _check_probation(self, health: ModelHealth):
+        if health.images < MLConfig.PROBATION_MIN_IMAGES:
+            return
+        baseline = self.baseline or ModelHealth()
+        latency = health.latency.summary()["mean"]
+        baseline_latency = baseline.latency.summary()["mean"]
+
+        if health.error_rate > baseline.error_rate + MLConfig.ROLLBACK_ERROR_MARGIN:
+            self.rollback(f"taxa de erro {health.error_rate:.1%} (anterior {baseline.error_rate:.1%})")
+        elif baseline_latency and latency > baseline_latency * MLConfig.ROLLBACK_LATENCY_RATIO:
+            self.rollback(f"latência/imagem {latency * 1000:.1f} ms (anterior {baseline_latency * 1000:.1f} ms)")
+        elif health.images >= MLConfig.PROBATION_IMAGES:
+            with self.lock:
+                if self.state != self.PROBATION:
+                    return
+                previous, self.previous = self.previous, None
+                self.health.pop(id(previous), None)
+            self._release(previous)
+            logger.success(f"Modelo {self.candidate_path} aprovado após {health.images} imagens")
+            self._finish("committed", self.candidate_path)
+
+    def rollback(self, reason: str = "manual") -> bool:
+        """Volta ao modelo anterior enquanto o novo está em observação"""
+        with self.lock:
+            if self.state != self.PROBATION or self.previous is None:
+                return False
+            rejected = self.loader.replace(self.previous)
+            self.previous = None
+            self.health.pop(id(rejected), None)
+            if RESULT_CACHE is not None:
+                RESULT_CACHE.clear()
+        logger.warning(f"Rollback do modelo {self.candidate_path}: {reason}")
+        self._release(rejected)
+        self._finish("rolled_back", self.candidate_path, reason)
+        return True
+
+    def stop(self):
+        """Libera candidato e modelo anterior (o servido é liberado pelo ModelLoader)"""
+        with self.lock:
+            models: List[Any] = [self.candidate, self.previous]
+            self.candidate = self.previous = None
+            self.state = self.IDLE
+        for model in models:
+            if model is not None and hasattr(model, "stop"):
+                model.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            active = self.health.get(id(self.loader.get()))
+            stats = {
+                "state": self.state,
+                "candidate": self.candidate_path if self.state != self.IDLE else None,
+                "active": active.summary() if active else None,
+                "history": list(self.history),
+            }
+        if self.state == self.SHADOW:
+            stats["shadow"] = {
+                "compared": self.shadow_compared,
+                "agreement": self.shadow_agreed / self.shadow_compared if self.shadow_compared else 0.0,
+                "failures": self.shadow_failures,
+                "skipped_batches": self.shadow_skipped,
+                "active_latency": self.shadow_active_latency.summary(),
+                "candidate_latency": self.shadow_candidate_latency.summary(),
+            }
+        elif self.state == self.PROBATION and self.baseline is not None:
+            stats["baseline"] = self.baseline.summary()
+        return stats
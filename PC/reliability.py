@@ -0,0 +1,220 @@
+"""
+Entrega confirmada sobre as mensagens da sessão UDP.
+
+Uma mensagem confiável vai como "@R:<id>:<mensagem>" e é confirmada com "@A:<id>"
+(ambos dentro do pacote cifrado, então o ack também é autenticado). O emissor
+retransmite com RTO adaptativo (RFC 6298: SRTT + 4*RTTVAR, backoff exponencial e
+amostras só de mensagens não retransmitidas). A janela por par limita a distância entre
+o ID mais antigo sem ack e o próximo a enviar; assim o receptor, que confirma sempre,
+descarta duplicatas lembrando só os últimos IDs (pelo menos `window`) de cada par.
+Uma mensagem com prazo (`expires_at`) deixa de ser retransmitida quando ele vence: um
+comando atrasado é pior que um perdido.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from utils import RollingStats
+
+RELIABLE_PREFIX = "@R:"
+ACK_PREFIX = "@A:"
+
+class RttEstimator:
+    """SRTT/RTTVAR por par (RFC 6298)"""
+
+    def __init__(self, initial_rto: float, min_rto: float, max_rto: float):
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+class _InFlight:
+    __slots__ = ("id", "message", "peer", "first_sent", "deadline", "rto", "retries", "sample", "expires_at")
+
+    def __init__(self, message_id: int, message: str, peer: Hashable, now: float, rto: float, sample: bool,
+                 expires_at: Optional[float] = None):
+        self.id = message_id
+        self.message = message
+        self.peer = peer
+        self.first_sent = now
+        self.deadline = now + rto  # Próxima retransmissão
+        self.rto = rto
+        self.retries = 0
+        self.sample = sample  # Karn: só mede RTT se a 1ª transmissão já tinha sessão
+        self.expires_at = expires_at  # time.monotonic() após o qual a mensagem é abandonada
+
+class ReliableSender:
+    """
+    Estado do lado emissor, sem E/S própria: `send_wire(texto, par)` envia pela sessão.
+    Quem usa chama `on_ack` ao receber um ack e `retransmit_due` quando `next_deadline` vence.
+    """
+
+    def __init__(self, send_wire: Callable[[str, Hashable], None], window: int, max_retries: int,
+                 initial_rto: float, min_rto: float, max_rto: float,
+                 on_failure: Optional[Callable[[str, Hashable], None]] = None):
+        self.send_wire = send_wire
+        self.window = window
+        self.max_retries = max_retries
+        self.initial_rto, self.min_rto, self.max_rto = initial_rto, min_rto, max_rto
+        self.on_failure = on_failure
+        self.next_id: Dict[Hashable, int] = {}
+        self.in_flight: Dict[Hashable, "OrderedDict[int, _InFlight]"] = {}
+        self.backlog: Dict[Hashable, deque] = {}
+        self.rtt: Dict[Hashable, RttEstimator] = {}
+        self.lock = threading.Lock()
+
+        # Métricas
+        self.sent = 0
+        self.delivered = 0
+        self.retransmissions = 0
+        self.failed = 0
+        self.expired = 0
+        self.delivery_times = RollingStats()
+
+    def _estimator(self, peer: Hashable) -> RttEstimator:
+        if peer not in self.rtt:
+            self.rtt[peer] = RttEstimator(self.initial_rto, self.min_rto, self.max_rto)
+        return self.rtt[peer]
+
+    def send(self, message: str, peer: Hashable, has_session: bool = True, expires_at: Optional[float] = None):
+        """
+        Envia já se houver vaga na janela do par; senão a mensagem aguarda um ack.
+        Com `expires_at` (time.monotonic()), não é enviada nem retransmitida depois dele.
+        """
+        with self.lock:
+            self.sent += 1
+            self.in_flight.setdefault(peer, OrderedDict())
+            if not self._has_room_locked(peer):
+                self.backlog.setdefault(peer, deque()).append((message, expires_at))
+                return
+            wire = self._start_locked(message, peer, has_session, expires_at)
+        self.send_wire(wire, peer)
+
+    def _has_room_locked(self, peer: Hashable) -> bool:
+        flight = self.in_flight[peer]
+        if not flight:
+            return True
+        oldest = next(iter(flight))  # IDs entram em ordem crescente
+        return (self.next_id[peer] - oldest) & 0x7FFFFFFF < self.window
+
+    def _start_locked(self, message: str, peer: Hashable, has_session: bool,
+                      expires_at: Optional[float] = None) -> str:
+        if peer not in self.next_id:
+            # Início aleatório: após um reinício os IDs não colidem com os já vistos pelo par
+            self.next_id[peer] = int.from_bytes(os.urandom(4), "big") & 0x7FFFFFFF
+        message_id = self.next_id[peer]
+        self.next_id[peer] = (message_id + 1) & 0x7FFFFFFF
+        entry = _InFlight(message_id, message, peer, time.monotonic(), self._estimator(peer).rto, has_session,
+                          expires_at)
+        self.in_flight[peer][message_id] = entry
+        return f"{RELIABLE_PREFIX}{message_id}:{message}"
+
+    def on_ack(self, message_id: int, peer: Hashable, has_session: bool = True):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.in_flight.get(peer, {}).pop(message_id, None)
+            if entry is None:
+                return  # Ack duplicado ou de mensagem já abandonada
+            self.delivered += 1
+            self.delivery_times.add(now - entry.first_sent)
+            if entry.retries == 0 and entry.sample:
+                self._estimator(peer).sample(now - entry.first_sent)
+            wires = self._refill_locked(peer, has_session, now)
+        for wire in wires:
+            self.send_wire(wire, peer)
+
+    def _refill_locked(self, peer: Hashable, has_session: bool, now: float) -> List[str]:
+        backlog = self.backlog.get(peer)
+        wires = []
+        while backlog and self._has_room_locked(peer):
+            message, expires_at = backlog.popleft()
+            if expires_at is not None and now >= expires_at:
+                self.expired += 1
+                continue
+            wires.append(self._start_locked(message, peer, has_session, expires_at))
+        return wires
+
+    def next_deadline(self) -> Optional[float]:
+        with self.lock:
+            deadlines = [entry.deadline if entry.expires_at is None else min(entry.deadline, entry.expires_at)
+                         for flight in self.in_flight.values() for entry in flight.values()]
+        return min(deadlines) if deadlines else None
+
+    def retransmit_due(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        resend: List[Tuple[str, Hashable]] = []
+        failed: List[_InFlight] = []
+        with self.lock:
+            for peer, flight in self.in_flight.items():
+                gave_up = len(failed)
+                expired = self.expired
+                for entry in list(flight.values()):
+                    if entry.expires_at is not None and now >= entry.expires_at:
+                        # Passou do prazo: não adianta entregar (nem avisar falha de entrega)
+                        del flight[entry.id]
+                        self.expired += 1
+                        continue
+                    if entry.deadline > now:
+                        continue
+                    if entry.retries >= self.max_retries:
+                        del flight[entry.id]
+                        failed.append(entry)
+                        continue
+                    entry.retries += 1
+                    entry.rto = min(self.max_rto, entry.rto * 2)
+                    entry.deadline = now + entry.rto
+                    self.retransmissions += 1
+                    resend.append((f"{RELIABLE_PREFIX}{entry.id}:{entry.message}", peer))
+                if len(failed) > gave_up or self.expired > expired:
+                    resend.extend((wire, peer) for wire in self._refill_locked(peer, True, now))
+            self.failed += len(failed)
+
+        for wire, peer in resend:
+            self.send_wire(wire, peer)
+        for entry in failed:
+            if self.on_failure is not None:
+                self.on_failure(entry.message, entry.peer)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "sent": self.sent,
+                "delivered": self.delivered,
+                "retransmissions": self.retransmissions,
+                "failed": self.failed,
+                "expired": self.expired,
+                "in_flight": sum(len(flight) for flight in self.in_flight.values()),
+                "backlog": sum(len(backlog) for backlog in self.backlog.values()),
+                "delivery": self.delivery_times.summary(),
+                "rto": {str(peer): estimator.rto for peer, estimator in self.rtt.items()},
+            }
+
+class DuplicateFilter:
+    """IDs confiáveis já entregues, os `size` mais recentes por par"""
+
+    def __init__(self, size: int = 128):
+        self.size = size
+        self.seen: Dict[Hashable, "OrderedDict[int, None]"] = {}
+        self.lock = threading.Lock()
+        self.duplicates = 0
+
+    def is_new(self, message_id: int, peer: Hashable) -> bool:
+        with self.lock:
+            seen = self.seen.setdefault(peer, OrderedDict())
+            if message_id in seen:
+                self.duplicates += 1
+                return False
+            seen[message_id] = None
+            if len(seen) > self.size:
+                seen.popitem(last=False)
+            return True
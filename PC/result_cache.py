@@ -0,0 +1,106 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import cv2
+import numpy as np
+from config import MLConfig
+
+HASH_METHODS = ("dhash", "phash")
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash: sinal do gradiente horizontal numa cópia (hash_size+1 x hash_size) em cinza"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def phash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Perceptual hash: coeficientes de baixa frequência da DCT acima da mediana"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size].ravel()
+    bits = low[1:] > np.median(low[1:])  # ignora o termo DC (brilho médio)
+    return int.from_bytes(np.packbits(np.concatenate([[False], bits])).tobytes(), "big")
+
+class ResultCache:
+    """
+    Cache LRU com TTL do resultado de uma classificação, indexado pelo hash
+    perceptual da vista principal. Uma consulta acerta se algum hash do mesmo escopo
+    (dispositivo) estiver a no máximo `max_distance` bits de distância de Hamming.
+    """
+
+    def __init__(self, max_entries: int = MLConfig.RESULT_CACHE_SIZE,
+                 ttl: float = MLConfig.RESULT_CACHE_TTL,
+                 max_distance: int = MLConfig.RESULT_CACHE_MAX_DISTANCE,
+                 method: str = MLConfig.RESULT_CACHE_HASH):
+        if method not in HASH_METHODS:
+            raise ValueError(f"Hash desconhecido: {method} (use um de {HASH_METHODS})")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_fn = dhash if method == "dhash" else phash
+        # escopo -> OrderedDict(hash -> (guardado_em, resultado)), do menos ao mais recente
+        self.scopes: Dict[Hashable, "OrderedDict[int, Any]"] = {}
+        self.lock = threading.Lock()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def key(self, image_array: np.ndarray) -> int:
+        return self.hash_fn(image_array)
+
+    def get(self, key: int, scope: Hashable = None) -> Optional[Any]:
+        """Resultado mais próximo dentro da tolerância, ou None (não deve ser modificado)"""
+        now = time.monotonic()
+        with self.lock:
+            entries = self.scopes.get(scope)
+            best, best_distance = None, self.max_distance + 1
+            if entries:
+                for cached_key, (stored_at, _) in list(entries.items()):
+                    if now - stored_at > self.ttl:
+                        del entries[cached_key]
+                        self.expired += 1
+                        continue
+                    distance = (cached_key ^ key).bit_count()
+                    if distance < best_distance:
+                        best, best_distance = cached_key, distance
+
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entries.move_to_end(best)
+            return entries[best][1]
+
+    def put(self, key: int, result: Any, scope: Hashable = None):
+        with self.lock:
+            entries = self.scopes.setdefault(scope, OrderedDict())
+            entries[key] = (time.monotonic(), result)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, scope: Hashable = None):
+        """Remove o escopo informado ou, sem escopo, tudo (ex.: troca de modelo)"""
+        with self.lock:
+            if scope is None:
+                self.scopes.clear()
+            else:
+                self.scopes.pop(scope, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(entries) for entries in self.scopes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
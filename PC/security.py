@@ -1,67 +1,310 @@
-import time
-import json
+"""
+Sessões autenticadas entre PC e ESP32 sobre UDP.
+
+Handshake (autenticado com a chave de longo prazo K = SHA-256(AUTH_KEY)):
+    HELLO      | magic | versão | 1 | nonce_i 16 | época 8 | contador 4 | tag 16 |
+    HELLO_ACK  | magic | versão | 2 | nonce_i 16 | nonce_r 16 | tag 16 |
+Os dois lados derivam de K e dos nonces as chaves da sessão (cifra e HMAC, uma por
+sentido) e um identificador de 4 bytes. As mensagens seguem em
+    DATA       | magic | versão | 3 | sessão 4 | contador 4 | AES-CBC 16*n | tag 16 |
+com o IV derivado do contador (AES-ECB(chave, sessão || contador)), sem transmiti-lo.
+O frescor vem do contador monotônico e de uma janela deslizante anti-replay, não do
+relógio: um ESP32 sem NTP não perde mais pacotes. Quem reinicia perde as sessões e
+faz um handshake novo; um DATA de sessão desconhecida é respondido com um HELLO.
+
+Um HELLO traz a época (aleatória, por execução) e um contador crescente do iniciador:
+na mesma época, um HELLO que não seja mais novo que o último aceito é um replay. Como um
+replay de uma época antiga não se distingue de um reinício, a sessão aberta pelo
+respondedor só é usada no envio depois do primeiro DATA autenticado nela; o iniciador
+o manda logo após o HELLO_ACK (um DATA vazio de confirmação). Assim, um HELLO
+reenviado por terceiros não troca a chave em uso.
+"""
+import os
 import hmac
+import time
+import struct
 import hashlib
-import base64
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
+
+WIRE_MAGIC = 0xB7
+WIRE_VERSION = 3
+HELLO, HELLO_ACK, DATA = 1, 2, 3
+FRAME_HEADER = struct.Struct(">BBB")
+DATA_HEADER = struct.Struct(">BBB4sI")
+HELLO_FRESHNESS = struct.Struct(">8sI")  # época, contador
+NONCE_SIZE = 16
+TAG_SIZE = 16
+MAX_COUNTER = 0xFFFFFFFF
+REHELLO_INTERVAL = 1.0  # HELLOs em resposta a sessões desconhecidas, no máximo 1 por par a cada N s
+MAX_PEERS = 64          # Pares com estado guardado; além disso, sai o mais antigo
+
+def _hmac(key: bytes, data) -> bytes:
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+class Session:
+    """Chaves e contadores de uma sessão; `initiator` define o sentido de cada chave"""
+
+    def __init__(self, key: bytes, nonce_i: bytes, nonce_r: bytes, initiator: bool, replay_window: int):
+        master = _hmac(key, b"trash-session" + nonce_i + nonce_r)
+        i2r = (_hmac(master, b"i2r-enc"), _hmac(master, b"i2r-mac"))
+        r2i = (_hmac(master, b"r2i-enc"), _hmac(master, b"r2i-mac"))
+        (self.send_key, self.send_mac), (self.recv_key, self.recv_mac) = (i2r, r2i) if initiator else (r2i, i2r)
+        self.id = _hmac(master, b"id")[:4]
+        self.send_iv = AES.new(self.send_key, AES.MODE_ECB)
+        self.recv_iv = AES.new(self.recv_key, AES.MODE_ECB)
+        self.send_counter = 0
+        self.recv_highest = 0
+        self.recv_window = 0   # Bit i: contador recv_highest - i já recebido
+        self.replay_window = replay_window
+        self.created_at = time.monotonic()
+
+    def iv(self, cipher, counter: int) -> bytes:
+        return cipher.encrypt(self.id + struct.pack(">I", counter) + bytes(8))
+
+    def is_replay(self, counter: int) -> bool:
+        if counter > self.recv_highest:
+            return False
+        offset = self.recv_highest - counter
+        return offset >= self.replay_window or bool(self.recv_window >> offset & 1)
+
+    def mark_received(self, counter: int):
+        """Chamado só depois da tag conferida"""
+        if counter > self.recv_highest:
+            shift = counter - self.recv_highest
+            self.recv_window = (self.recv_window << shift | 1) & ((1 << self.replay_window) - 1)
+            self.recv_highest = counter
+        else:
+            self.recv_window |= 1 << (self.recv_highest - counter)
 
 class SecurityManager:
-    def __init__(self, auth_key: str, token_timeout: int):
+    """
+    Estado das sessões por par (IP). `seal` cifra para um par com sessão; `hello` inicia
+    um handshake; `open` processa qualquer pacote recebido e devolve
+    (mensagem, resposta para o par, (destino do handshake, par) se uma sessão foi aberta).
+    """
+
+    def __init__(self, auth_key: str, replay_window: int = 64, max_sessions_per_peer: int = 2,
+                 max_peers: int = MAX_PEERS):
         if isinstance(auth_key, str):
             auth_key = auth_key.encode()
         self.auth_key = hashlib.sha256(auth_key).digest()  # 32 bytes
-        self.token_timeout = token_timeout
-
-    # -------- AES Helpers --------
-    def _pad(self, s: bytes) -> bytes:
-        pad_len = 16 - (len(s) % 16)
-        return s + bytes([pad_len]) * pad_len
+        self.replay_window = replay_window
+        self.max_sessions_per_peer = max_sessions_per_peer
+        self.max_peers = max_peers
+        self.sessions: Dict[Hashable, List[Session]] = {}    # Confirmadas; a ativa primeiro
+        self.candidates: Dict[Hashable, List[Session]] = {}  # Abertas por HELLO, ainda sem DATA
+        self.handshakes: Dict[bytes, Tuple[Hashable, float]] = {}  # nonce_i -> (destino, início)
+        self.hello_seen: Dict[Hashable, Tuple[bytes, int, float]] = {}  # par -> (época, contador, quando)
+        self.rehello_at: Dict[Hashable, float] = {}
+        self.epoch = os.urandom(8)
+        self.hello_counter = 0
+        self.lock = threading.Lock()
 
-    def _unpad(self, s: bytes) -> bytes:
-        return s[:-s[-1]]
+        # Métricas
+        self.handshakes_completed = 0
+        self.rejected_hellos = 0
+        self.rejected_tags = 0
+        self.rejected_replays = 0
+        self.unknown_sessions = 0
 
-    # -------- Encrypt / Decrypt --------
-    def encrypt_message(self, msg: str) -> str:
-        timestamp = int(time.time())
-        payload = json.dumps({"message": msg, "timestamp": timestamp}).encode()
+    # -------- Handshake --------
+    def hello(self, target: Hashable) -> bytes:
+        """HELLO para `target` (IP ou broadcast); a sessão abre com o HELLO_ACK de quem responder"""
+        nonce = os.urandom(NONCE_SIZE)
+        now = time.monotonic()
+        with self.lock:
+            for pending, (_, started_at) in list(self.handshakes.items()):
+                if now - started_at > 30.0:
+                    del self.handshakes[pending]
+            self.handshakes[nonce] = (target, now)
+            self.hello_counter += 1
+            counter = self.hello_counter
+        frame = FRAME_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, HELLO) + nonce + HELLO_FRESHNESS.pack(self.epoch, counter)
+        return frame + _hmac(self.auth_key, frame)[:TAG_SIZE]
 
-        iv = get_random_bytes(16)
-        cipher = AES.new(self.auth_key, AES.MODE_CBC, iv)
-        encrypted = cipher.encrypt(self._pad(payload))
+    def _store_session(self, table: Dict[Hashable, List[Session]], peer: Hashable, session: Session):
+        if peer not in self.sessions and peer not in self.candidates:
+            self._evict_peers()
+        sessions = table.setdefault(peer, [])
+        sessions.insert(0, session)
+        del sessions[self.max_sessions_per_peer:]
 
-        # Gera HMAC do conteúdo criptografado
-        signature = hmac.new(self.auth_key, iv + encrypted, hashlib.sha256).hexdigest()
+    def _evict_peers(self):
+        """Abre espaço para um par novo: sai o de sessão mais antiga"""
+        peers = set(self.sessions) | set(self.candidates)
+        if len(peers) < self.max_peers:
+            return
+        oldest = min(peers, key=lambda peer: (self.sessions.get(peer) or self.candidates[peer])[0].created_at)
+        self.sessions.pop(oldest, None)
+        self.candidates.pop(oldest, None)
 
-        packet = {
-            "iv": base64.b64encode(iv).decode(),
-            "data": base64.b64encode(encrypted).decode(),
-            "signature": signature,
-        }
-        return json.dumps(packet)
+    def _trim(self, table: Dict[Hashable, Any], age_of):
+        """Descarta as entradas mais antigas de `table` além de max_peers"""
+        if len(table) > self.max_peers:
+            for peer in sorted(table, key=age_of)[:len(table) - self.max_peers]:
+                del table[peer]
 
-    def decrypt_message(self, enc_str: str):
-        try:
-            packet = json.loads(enc_str)
-            iv = base64.b64decode(packet["iv"])
-            encrypted = base64.b64decode(packet["data"])
-            signature = packet["signature"]
-
-            # Verifica HMAC
-            expected_signature = hmac.new(
-                self.auth_key, iv + encrypted, hashlib.sha256
-            ).hexdigest()
-            if not hmac.compare_digest(signature, expected_signature):
-                return None
+    def has_session(self, peer: Hashable) -> bool:
+        with self.lock:
+            return bool(self.sessions.get(peer))
 
-            cipher = AES.new(self.auth_key, AES.MODE_CBC, iv)
-            decrypted = self._unpad(cipher.decrypt(encrypted))
-            payload = json.loads(decrypted.decode())
+    def forget(self, peer: Hashable):
+        with self.lock:
+            self.sessions.pop(peer, None)
+            self.candidates.pop(peer, None)
 
-            # Verifica timeout
-            if abs(int(time.time()) - int(payload["timestamp"])) > self.token_timeout:
+    # -------- Envio --------
+    def seal(self, msg: str, peer: Hashable) -> Optional[bytes]:
+        """Pacote DATA na sessão ativa com `peer`, ou None se não houver sessão"""
+        with self.lock:
+            sessions = self.sessions.get(peer)
+            if not sessions or sessions[0].send_counter >= MAX_COUNTER:
                 return None
+            session = sessions[0]
+            session.send_counter += 1
+            counter = session.send_counter
+            iv = session.iv(session.send_iv, counter)
 
-            return payload["message"]
+        padded = self._pad(msg.encode())
+        body_end = DATA_HEADER.size + len(padded)
+        packet = bytearray(body_end + TAG_SIZE)
+        view = memoryview(packet)
+        DATA_HEADER.pack_into(packet, 0, WIRE_MAGIC, WIRE_VERSION, DATA, session.id, counter)
+        AES.new(session.send_key, AES.MODE_CBC, iv).encrypt(padded, output=view[DATA_HEADER.size:body_end])
+        view[body_end:] = _hmac(session.send_mac, view[:body_end])[:TAG_SIZE]
+        return bytes(packet)
+
+    # -------- Recepção --------
+    def open(self, data, peer: Hashable) -> Tuple[Optional[str], Optional[bytes], Optional[Tuple[Hashable, Hashable]]]:
+        view = memoryview(data)
+        if len(view) < FRAME_HEADER.size + TAG_SIZE:
+            return None, None, None
+        magic, version, kind = FRAME_HEADER.unpack_from(view, 0)
+        if magic != WIRE_MAGIC or version != WIRE_VERSION:
+            return None, None, None
+        try:
+            if kind == DATA:
+                return self._open_data(view, peer)
+            if kind == HELLO:
+                return None, self._answer_hello(view, peer), None
+            if kind == HELLO_ACK:
+                established = self._finish_handshake(view, peer)
+                # DATA vazio de confirmação: o respondedor passa a usar a sessão no envio
+                return None, established and self.seal("", peer), established
         except Exception:
+            pass
+        return None, None, None
+
+    def _check_tag(self, key: bytes, view: memoryview) -> bool:
+        body_end = len(view) - TAG_SIZE
+        if hmac.compare_digest(view[body_end:], _hmac(key, view[:body_end])[:TAG_SIZE]):
+            return True
+        self.rejected_tags += 1
+        return False
+
+    def _answer_hello(self, view: memoryview, peer: Hashable) -> Optional[bytes]:
+        size = FRAME_HEADER.size + NONCE_SIZE + HELLO_FRESHNESS.size + TAG_SIZE
+        if len(view) != size or not self._check_tag(self.auth_key, view):
+            return None
+        start = FRAME_HEADER.size
+        nonce_i = bytes(view[start:start + NONCE_SIZE])
+        epoch, counter = HELLO_FRESHNESS.unpack_from(view, start + NONCE_SIZE)
+        now = time.monotonic()
+        with self.lock:
+            seen = self.hello_seen.get(peer)
+            if seen is not None and seen[0] == epoch and counter <= seen[1]:
+                self.rejected_hellos += 1
+                return None  # HELLO repetido (retransmissão ou replay)
+            self.hello_seen[peer] = (epoch, counter, now)
+            self._trim(self.hello_seen, lambda p: self.hello_seen[p][2])
+        nonce_r = os.urandom(NONCE_SIZE)
+        with self.lock:
+            # Só recebe até o primeiro DATA autenticado (ver _open_data)
+            self._store_session(self.candidates, peer,
+                                Session(self.auth_key, nonce_i, nonce_r, False, self.replay_window))
+        frame = FRAME_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, HELLO_ACK) + nonce_i + nonce_r
+        return frame + _hmac(self.auth_key, frame)[:TAG_SIZE]
+
+    def _finish_handshake(self, view: memoryview, peer: Hashable) -> Optional[Tuple[Hashable, Hashable]]:
+        if len(view) != FRAME_HEADER.size + 2 * NONCE_SIZE + TAG_SIZE or not self._check_tag(self.auth_key, view):
             return None
+        start = FRAME_HEADER.size
+        nonce_i = bytes(view[start:start + NONCE_SIZE])
+        nonce_r = bytes(view[start + NONCE_SIZE:start + 2 * NONCE_SIZE])
+        with self.lock:
+            pending = self.handshakes.get(nonce_i)
+            if pending is None:
+                return None
+            # Um HELLO em broadcast pode ser respondido por vários pares: o pendente fica até expirar
+            self._store_session(self.sessions, peer,
+                                Session(self.auth_key, nonce_i, nonce_r, True, self.replay_window))
+            self.handshakes_completed += 1
+        return pending[0], peer
+
+    def _open_data(self, view: memoryview, peer: Hashable) -> Tuple[Optional[str], Optional[bytes], None]:
+        body_end = len(view) - TAG_SIZE
+        if body_end <= DATA_HEADER.size or (body_end - DATA_HEADER.size) % 16:
+            return None, None, None
+        _, _, _, session_id, counter = DATA_HEADER.unpack_from(view, 0)
+
+        with self.lock:
+            session = next((s for s in self.sessions.get(peer, []) + self.candidates.get(peer, [])
+                            if s.id == session_id), None)
+        if session is None:
+            # O par tem uma sessão que não conhecemos (reiniciamos): propõe uma nova
+            self.unknown_sessions += 1
+            now = time.monotonic()
+            with self.lock:
+                if now - self.rehello_at.get(peer, -REHELLO_INTERVAL) < REHELLO_INTERVAL:
+                    return None, None, None
+                self.rehello_at[peer] = now
+                self._trim(self.rehello_at, self.rehello_at.get)
+            return None, self.hello(peer), None
+        if not self._check_tag(session.recv_mac, view):
+            return None, None, None
+
+        with self.lock:
+            if session.is_replay(counter):
+                self.rejected_replays += 1
+                return None, None, None
+            session.mark_received(counter)
+            # Sessão confirmada nos dois sentidos: passa a ser a usada no envio
+            candidates = self.candidates.get(peer, [])
+            if session in candidates:
+                candidates.remove(session)
+                if not candidates:
+                    self.candidates.pop(peer, None)
+                self._store_session(self.sessions, peer, session)
+                self.handshakes_completed += 1
+            else:
+                sessions = self.sessions.get(peer, [])
+                if session in sessions and sessions[0] is not session:
+                    sessions.remove(session)
+                    sessions.insert(0, session)
+            iv = session.iv(session.recv_iv, counter)
+
+        cipher = AES.new(session.recv_key, AES.MODE_CBC, iv)
+        return self._unpad(cipher.decrypt(view[DATA_HEADER.size:body_end])).decode(), None, None
+
+    # -------- AES Helpers --------
+    def _pad(self, s: bytes) -> bytes:
+        pad_len = 16 - (len(s) % 16)
+        return s + bytes([pad_len]) * pad_len
+
+    def _unpad(self, s: bytes) -> bytes:
+        return s[:-s[-1]]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "peers": len(self.sessions),
+                "unconfirmed_peers": len(self.candidates),
+                "pending_handshakes": len(self.handshakes),
+                "handshakes": self.handshakes_completed,
+                "rejected_hellos": self.rejected_hellos,
+                "rejected_tags": self.rejected_tags,
+                "rejected_replays": self.rejected_replays,
+                "unknown_sessions": self.unknown_sessions,
+            }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do PC são importados pelo nome (como em `python main.py`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+import numpy as np
+from capture_store import CaptureStore, CaptureStoreReader
+
+SHAPE = (8, 8, 3)
+
+def image(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+def test_raw_round_trip(tmp_path):
+    store = CaptureStore(str(tmp_path))
+    for i in range(5):
+        store.append_image(image(i), "raw", device="esp-a", label="plastic", confidence=0.5 + i / 10,
+                           timestamp=1000.0 + i)
+    store.close()
+
+    reader = CaptureStoreReader(str(tmp_path))
+    batches = list(reader.iter_batches(batch_size=2, image_shape=SHAPE))
+    assert [len(records) for _, records in batches] == [2, 2, 1]
+    images = np.concatenate([images for images, _ in batches])
+    assert np.array_equal(images, np.stack([image(i) for i in range(5)]))
+    records = np.concatenate([records for _, records in batches])
+    assert list(records["timestamp"]) == [1000.0 + i for i in range(5)]
+    assert set(records["device"]) == {b"esp-a"}
+
+def test_encoded_round_trip(tmp_path):
+    store = CaptureStore(str(tmp_path))
+    store.append_image(image(200), "png", device="esp-a", label="glass")
+    store.close()
+    (images, records), = CaptureStoreReader(str(tmp_path)).iter_batches(batch_size=4, image_shape=SHAPE)
+    assert np.array_equal(images[0], image(200))
+    assert records["label"][0] == b"glass"
+
+def test_select_filters(tmp_path):
+    store = CaptureStore(str(tmp_path))
+    for i, (device, label) in enumerate([("esp-a", "plastic"), ("esp-b", "glass"), ("esp-a", "glass")]):
+        store.append_image(image(i), "raw", device=device, label=label, confidence=0.3 * (i + 1),
+                           timestamp=1000.0 + i)
+    store.close()
+    reader = CaptureStoreReader(str(tmp_path))
+    assert reader.count() == 3
+    assert reader.count(classes=["glass"]) == 2
+    assert reader.count(devices=["esp-a"], classes=["glass"]) == 1
+    assert reader.count(start=1001.0, end=1002.0) == 1
+    assert reader.count(min_confidence=0.5) == 2
+    (_, newest), = reader.select(newest=1)
+    assert newest["timestamp"][0] == 1002.0
+
+def test_shards_rotate_and_reopen(tmp_path):
+    record_size = int(np.prod(SHAPE))
+    store = CaptureStore(str(tmp_path), shard_max_bytes=record_size * 2)
+    for i in range(5):
+        store.append_image(image(i), "raw")
+    store.close()
+    assert CaptureStoreReader(str(tmp_path)).shards() == [1, 2, 3]
+
+    # Reabrir continua no último shard, sem sobrescrever
+    store = CaptureStore(str(tmp_path), shard_max_bytes=record_size * 2)
+    store.append_image(image(5), "raw")
+    store.close()
+    assert CaptureStoreReader(str(tmp_path)).count() == 6
+
+def test_embeddings_round_trip(tmp_path):
+    store = CaptureStore(str(tmp_path))
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    for i in range(3):
+        store.append_image(image(i), "raw", label="paper", embedding=vectors[i] if i != 1 else None)
+    store.close()
+    (records, embeddings), = CaptureStoreReader(str(tmp_path)).iter_embeddings()
+    assert len(records) == 2
+    assert np.array_equal(embeddings, vectors[[0, 2]])
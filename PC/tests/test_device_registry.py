@@ -0,0 +1,77 @@
+import time
+from config import PipelineConfig
+from device_registry import DeviceRegistry
+
+ADDR = ("192.168.0.10", 8888)
+
+def registry_with_device():
+    registry = DeviceRegistry(camera_map={})
+    device, _ = registry.touch(ADDR, "esp-a")
+    return registry, device
+
+def test_first_trigger_starts():
+    registry, device = registry_with_device()
+    assert registry.submit_trigger(device, time.monotonic()) == "start"
+    assert device.in_flight and device.deadline is not None
+
+def test_trigger_before_capture_is_coalesced():
+    registry, device = registry_with_device()
+    registry.submit_trigger(device, time.monotonic())
+    assert registry.submit_trigger(device, time.monotonic()) == "coalesced"
+    assert device.coalesced == 1 and not device.pending
+
+def test_trigger_after_capture_is_queued_and_started_on_finish():
+    registry, device = registry_with_device()
+    now = time.monotonic()
+    registry.submit_trigger(device, now)
+    registry.mark_captured(device)
+    assert registry.submit_trigger(device, now) == "queued"
+    assert registry.finish(device, success=True)
+    assert device.in_flight and not device.pending
+    assert device.classifications == 1
+
+def test_close_pending_triggers_are_coalesced():
+    registry, device = registry_with_device()
+    now = time.monotonic()
+    registry.submit_trigger(device, now)
+    registry.mark_captured(device)
+    registry.submit_trigger(device, now)
+    assert registry.submit_trigger(device, now + PipelineConfig.COALESCE_WINDOW / 2) == "coalesced"
+    assert len(device.pending) == 1
+
+def test_stale_trigger_is_dropped():
+    registry, device = registry_with_device()
+    received_at = time.monotonic() - PipelineConfig.TRIGGER_DEADLINE - 1
+    assert registry.submit_trigger(device, received_at) == "stale"
+    assert device.dropped_stale == 1 and not device.in_flight
+
+def test_full_queue_overflows():
+    registry, device = registry_with_device()
+    now = time.monotonic()
+    registry.submit_trigger(device, now)
+    registry.mark_captured(device)
+    spacing = PipelineConfig.COALESCE_WINDOW + 0.1
+    for i in range(PipelineConfig.DEVICE_QUEUE_SIZE):
+        assert registry.submit_trigger(device, now - spacing * (PipelineConfig.DEVICE_QUEUE_SIZE - i)) == "queued"
+    assert registry.submit_trigger(device, now) == "overflow"
+    assert device.dropped_overflow == 1
+
+def test_expired_pending_trigger_is_skipped_on_finish():
+    registry, device = registry_with_device()
+    now = time.monotonic()
+    registry.submit_trigger(device, now)
+    registry.mark_captured(device)
+    registry.submit_trigger(device, now)
+    device.pending[0] = (now, now - 1)  # Prazo já vencido
+    assert not registry.finish(device, success=True)
+    assert device.dropped_stale == 1 and not device.in_flight
+
+def test_ip_change_releases_old_address():
+    registry, device = registry_with_device()
+    registry.touch(("192.168.0.20", 8888), "esp-a")
+    assert registry.by_ip == {"192.168.0.20": "esp-a"}
+
+    # Outro dispositivo no IP antigo, ainda sem anunciar o ID, não herda o estado do primeiro
+    other, is_new = registry.touch(ADDR)
+    assert is_new and other is not device
+    assert registry.touch(("192.168.0.20", 8888))[0] is device
@@ -0,0 +1,47 @@
+import json
+import time
+from discovery import PeerCache
+
+def test_peer_cache_round_trip(tmp_path):
+    path = str(tmp_path / "data" / "peers.json")
+    cache = PeerCache(path)
+    assert cache.update("esp-a", "192.168.0.10")
+    assert cache.update("esp-b", "192.168.0.11")
+    assert PeerCache(path).addresses() == {"esp-a": "192.168.0.10", "esp-b": "192.168.0.11"}
+
+def test_peer_cache_only_writes_on_change(tmp_path):
+    cache = PeerCache(str(tmp_path / "peers.json"))
+    assert cache.update("esp-a", "192.168.0.10")
+    assert not cache.update("esp-a", "192.168.0.10")
+    assert cache.update("esp-a", "192.168.0.20")  # DHCP trocou o IP
+    assert cache.writes == 2
+    assert PeerCache(cache.path).addresses() == {"esp-a": "192.168.0.20"}
+
+def test_peer_cache_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "peers.json"
+    path.write_text("{não é json")
+    assert PeerCache(str(path)).addresses() == {}
+    path.write_text(json.dumps({"esp-a": {"seen": 1.0}, "esp-b": {"ip": "10.0.0.2", "seen": 1.0}}))
+    assert PeerCache(str(path)).addresses() == {"esp-b": "10.0.0.2"}
+
+def test_announcer_unicasts_to_known_peers_once_paired(tmp_path, monkeypatch):
+    from config import UDPConfig
+    from discovery import Announcer
+    monkeypatch.setattr(UDPConfig, "DISCOVERY_FAST_INTERVAL", 0.01)
+    monkeypatch.setattr(UDPConfig, "ANNOUNCE_INTERVAL", 0.01)
+    monkeypatch.setattr(UDPConfig, "DISCOVERY_CACHE_TIMEOUT", 0.01)
+    peers = PeerCache(str(tmp_path / "peers.json"))
+    sent = []
+    announcer = Announcer(lambda message, ip: sent.append(ip), peers, broadcast="255.255.255.255")
+    announcer.start()
+    try:
+        while "255.255.255.255" not in sent:
+            time.sleep(0.01)
+        peers.update("esp-a", "192.168.0.10")
+        announcer.mark_paired()
+        time.sleep(0.05)
+        paired_at = len(sent)
+        time.sleep(0.1)
+    finally:
+        announcer.stop()
+    assert set(sent[paired_at:]) == {"192.168.0.10"}
@@ -0,0 +1,105 @@
+import pytest
+from reliability import RELIABLE_PREFIX, DuplicateFilter, ReliableSender, RttEstimator
+
+def make_sender(window=4, max_retries=3, initial_rto=0.2):
+    wire, failures = [], []
+    sender = ReliableSender(lambda text, peer: wire.append((text, peer)), window=window,
+                            max_retries=max_retries, initial_rto=initial_rto, min_rto=0.03, max_rto=1.0,
+                            on_failure=lambda message, peer: failures.append((message, peer)))
+    return sender, wire, failures
+
+def message_id(text):
+    assert text.startswith(RELIABLE_PREFIX)
+    return int(text[len(RELIABLE_PREFIX):].split(":", 1)[0])
+
+def in_flight(sender, peer="esp"):
+    return list(sender.in_flight[peer].values())
+
+def test_rtt_estimator_follows_rfc6298():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.03, max_rto=1.0)
+    rtt.sample(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.05)
+    assert rtt.rto == pytest.approx(0.3)
+    rtt.sample(0.2)
+    assert rtt.rttvar == pytest.approx(0.0625)
+    assert rtt.srtt == pytest.approx(0.1125)
+    assert rtt.rto == pytest.approx(0.3625)
+
+def test_rto_is_clamped():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.03, max_rto=1.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.03
+    rtt.sample(5.0)
+    assert rtt.rto == 1.0
+
+def test_ack_samples_rtt_and_delivers():
+    sender, wire, _ = make_sender()
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp")
+    entry = in_flight(sender)[0]
+    entry.first_sent -= 0.05  # Ack chega 50 ms depois do envio
+    sender.on_ack(message_id(wire[0][0]), "esp")
+    assert sender.delivered == 1
+    assert sender.rtt["esp"].srtt == pytest.approx(0.05, abs=0.01)
+    assert not sender.in_flight["esp"]
+
+def test_retransmission_backs_off():
+    sender, wire, _ = make_sender(initial_rto=0.2)
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp")
+    entry = in_flight(sender)[0]
+    sender.retransmit_due(entry.deadline)
+    assert len(wire) == 2 and wire[1] == wire[0]
+    assert entry.rto == pytest.approx(0.4)
+    sender.retransmit_due(entry.deadline)
+    assert entry.rto == pytest.approx(0.8)
+    assert sender.retransmissions == 2
+
+def test_karn_ignores_retransmitted_messages():
+    sender, wire, _ = make_sender()
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp")
+    sender.retransmit_due(in_flight(sender)[0].deadline)
+    sender.on_ack(message_id(wire[0][0]), "esp")
+    assert sender.delivered == 1
+    assert sender.rtt["esp"].srtt is None
+
+def test_karn_ignores_messages_sent_before_the_session():
+    sender, wire, _ = make_sender()
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp", has_session=False)
+    sender.on_ack(message_id(wire[0][0]), "esp")
+    assert sender.rtt["esp"].srtt is None
+
+def test_gives_up_after_max_retries():
+    sender, wire, failures = make_sender(max_retries=2)
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp")
+    entry = in_flight(sender)[0]
+    for _ in range(3):
+        sender.retransmit_due(entry.deadline)
+    assert failures == [("WASTE_TYPE:1:PLASTICO", "esp")]
+    assert sender.failed == 1
+    assert len(wire) == 3
+
+def test_window_holds_backlog_until_ack():
+    sender, wire, _ = make_sender(window=2)
+    for i in range(3):
+        sender.send(f"M{i}", "esp")
+    assert len(wire) == 2
+    sender.on_ack(message_id(wire[0][0]), "esp")
+    assert len(wire) == 3 and wire[2][0].endswith(":M2")
+
+def test_expired_message_is_dropped_without_failure():
+    sender, wire, failures = make_sender(window=1)
+    sender.send("WASTE_TYPE:1:PLASTICO", "esp", expires_at=0.0)
+    sender.send("PC_STATUS:READY", "esp")
+    sender.retransmit_due(in_flight(sender)[0].deadline)
+    assert sender.expired == 1
+    assert failures == []
+    assert [text.split(":", 2)[2] for text, _ in wire] == ["WASTE_TYPE:1:PLASTICO", "PC_STATUS:READY"]
+
+def test_duplicate_filter_per_peer():
+    duplicates = DuplicateFilter(size=2)
+    assert duplicates.is_new(1, "a")
+    assert not duplicates.is_new(1, "a")
+    assert duplicates.is_new(1, "b")
+    assert duplicates.is_new(2, "a") and duplicates.is_new(3, "a")
+    assert duplicates.is_new(1, "a")  # Saiu da memória (só os 2 mais recentes)
+    assert duplicates.duplicates == 1
@@ -0,0 +1,96 @@
+import pytest
+from security import SecurityManager
+
+KEY = "chave-de-teste"
+
+def handshake(initiator, responder):
+    _, ack, _ = responder.open(initiator.hello("responder"), "initiator")
+    _, confirm, established = initiator.open(ack, "responder")
+    assert established == ("responder", "responder")
+    msg, _, _ = responder.open(confirm, "initiator")
+    assert msg == ""
+
+@pytest.fixture
+def pair():
+    initiator, responder = SecurityManager(KEY), SecurityManager(KEY)
+    handshake(initiator, responder)
+    return initiator, responder
+
+def test_handshake_opens_session_both_ways(pair):
+    initiator, responder = pair
+    assert initiator.has_session("responder")
+    assert responder.has_session("initiator")
+    assert responder.open(initiator.seal("PING:esp", "responder"), "initiator")[0] == "PING:esp"
+    assert initiator.open(responder.seal("PC_ONLINE", "initiator"), "responder")[0] == "PC_ONLINE"
+
+def test_responder_only_sends_after_confirmation():
+    initiator, responder = SecurityManager(KEY), SecurityManager(KEY)
+    _, ack, _ = responder.open(initiator.hello("responder"), "initiator")
+    assert not responder.has_session("initiator")
+    assert responder.seal("PC_ONLINE", "initiator") is None
+
+    initiator.open(ack, "responder")
+    assert responder.open(initiator.seal("PING", "responder"), "initiator")[0] == "PING"
+    assert responder.has_session("initiator")
+
+def test_seal_without_session_returns_none():
+    assert SecurityManager(KEY).seal("PING", "ninguém") is None
+
+def test_wrong_key_is_rejected():
+    initiator, stranger = SecurityManager(KEY), SecurityManager("outra-chave")
+    assert stranger.open(initiator.hello("stranger"), "initiator") == (None, None, None)
+    assert stranger.rejected_tags == 1
+
+def test_tampered_packet_is_rejected(pair):
+    initiator, responder = pair
+    packet = bytearray(initiator.seal("WASTE_TYPE:1:PLASTICO", "responder"))
+    packet[-20] ^= 1
+    assert responder.open(bytes(packet), "initiator") == (None, None, None)
+
+def test_replayed_data_is_rejected(pair):
+    initiator, responder = pair
+    packet = initiator.seal("MOVIMENTO_DETECTADO", "responder")
+    assert responder.open(packet, "initiator")[0] == "MOVIMENTO_DETECTADO"
+    assert responder.open(packet, "initiator")[0] is None
+    assert responder.rejected_replays == 1
+
+def test_out_of_order_inside_window_is_accepted(pair):
+    initiator, responder = pair
+    packets = [initiator.seal(f"M{i}", "responder") for i in range(5)]
+    for i in (4, 0, 2, 1, 3):
+        assert responder.open(packets[i], "initiator")[0] == f"M{i}"
+
+def test_data_older_than_window_is_rejected():
+    initiator, responder = SecurityManager(KEY, replay_window=8), SecurityManager(KEY, replay_window=8)
+    handshake(initiator, responder)
+    old = initiator.seal("velho", "responder")
+    for i in range(10):
+        responder.open(initiator.seal(f"M{i}", "responder"), "initiator")
+    assert responder.open(old, "initiator")[0] is None
+
+def test_replayed_hello_does_not_replace_active_session(pair):
+    initiator, responder = pair
+    old_hello = initiator.hello("responder")
+    for _ in range(40):
+        handshake(initiator, responder)
+    assert responder.open(old_hello, "initiator")[1] is None
+    assert responder.rejected_hellos == 1
+
+    # Um HELLO de outra época (ex.: gravado antes de um reinício) só abre uma sessão candidata
+    other_hello = SecurityManager(KEY).hello("responder")
+    assert responder.open(other_hello, "initiator")[1] is not None
+    assert initiator.open(responder.seal("PC_ONLINE", "initiator"), "responder")[0] == "PC_ONLINE"
+
+def test_unknown_session_triggers_rate_limited_hello(pair):
+    initiator, _ = pair
+    restarted = SecurityManager(KEY)
+    _, reply, _ = restarted.open(initiator.seal("PING", "responder"), "initiator")
+    assert reply is not None
+    assert restarted.open(initiator.seal("PING", "responder"), "initiator") == (None, None, None)
+
+def test_peer_state_is_capped():
+    responder = SecurityManager(KEY, max_peers=3)
+    for peer in range(10):
+        responder.open(SecurityManager(KEY).hello("responder"), peer)
+    assert len(responder.candidates) == 3
+    assert len(responder.hello_seen) == 3
@@ -0,0 +1,77 @@
+"""
+Paridade TFLite vs Keras: concordância top-1 e diferença de latência numa pasta de imagens.
+
+Uso: python tflite_parity.py --images test/ [--weights caminho.h5]
+                             [--modes float16 dynamic int8 int8_fallback] [--threads 4]
+
+"int8" só aceita ops int8 e falha se alguma não quantizar; "int8_fallback" mantém essas ops
+em float, então não é um modelo inteiramente int8. Uma conversão que falha aparece na tabela.
+"""
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+from config import MLConfig
+from camera import preprocess_image
+from ml_model import TrashNetModel
+from model_cache import tflite_path
+from inference_backends import TFLiteBackend
+
+def _load_images(directory):
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.jpeg")) +
+                   glob.glob(os.path.join(directory, "*.png")))
+    images = []
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            processed = preprocess_image(frame)
+            if processed is not None:
+                images.append(processed)
+    return images
+
+def _run(predict_batch, images):
+    """Predição imagem a imagem (como em produção); retorna (probabilidades, latências)"""
+    outputs, latencies = [], []
+    for image_array in images:
+        batch = image_array[np.newaxis]
+        start = time.perf_counter()
+        outputs.append(predict_batch(batch)[0])
+        latencies.append(time.perf_counter() - start)
+    return np.stack(outputs), np.array(latencies)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara o backend TFLite com o caminho Keras")
+    parser.add_argument("--images", default=MLConfig.TFLITE_CALIBRATION_DIR)
+    parser.add_argument("--weights", default=MLConfig.MODEL_WEIGHTS_PATH)
+    parser.add_argument("--modes", nargs="+", default=["float16", "dynamic", "int8", "int8_fallback"])
+    parser.add_argument("--threads", type=int, default=MLConfig.TFLITE_NUM_THREADS)
+    args = parser.parse_args()
+
+    images = _load_images(args.images)
+    if not images:
+        raise SystemExit(f"Nenhuma imagem encontrada em {args.images}")
+
+    reference = TrashNetModel(args.weights, backend="keras")
+    reference.predict_batch(images[:1])  # aquecimento
+    ref_probs, ref_latency = _run(reference.backend.predict_batch, images)
+    ref_top1 = ref_probs.argmax(axis=1)
+    print(f"{len(images)} imagens | keras: p50 {np.median(ref_latency) * 1000:.1f} ms")
+
+    print(f"{'modo':>13}  {'top-1 igual':>11}  {'|Δp| médio':>10}  {'p50 (ms)':>9}  {'vs keras':>8}  {'MB':>6}")
+    for mode in args.modes:
+        try:
+            path = tflite_path(args.weights, reference.arch_config, mode, reference._build_with_weights)
+        except Exception as e:
+            print(f"{mode:>13}  conversão falhou: {e}")
+            continue
+        backend = TFLiteBackend(path, args.threads)
+        backend.predict_batch(images[0][np.newaxis])  # aquecimento
+        probs, latency = _run(backend.predict_batch, images)
+
+        agreement = float(np.mean(probs.argmax(axis=1) == ref_top1))
+        mean_diff = float(np.mean(np.abs(probs - ref_probs)))
+        p50 = float(np.median(latency))
+        print(f"{mode:>13}  {agreement:>11.2%}  {mean_diff:>10.4f}  {p50 * 1000:>9.1f}  "
+              f"{p50 / np.median(ref_latency):>7.2f}x  {os.path.getsize(path) / 1e6:>6.1f}")
@@ -1,90 +1,369 @@
 import socket
+import asyncio
 import threading
 import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 from utils import get_logger
 from security import SecurityManager
+from reliability import ACK_PREFIX, RELIABLE_PREFIX, DuplicateFilter, ReliableSender
 from config import UDPConfig
 
 logger = get_logger("UDP")
 
-class UDPCommunicator:
-    def __init__(self):
-        self.port = UDPConfig.UDP_PORT
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.sock.bind(("0.0.0.0", self.port))
-        self.sock.settimeout(1.0)
+BROADCAST = "255.255.255.255"
+TRANSPORTS = ("asyncio", "thread")
 
+def _open_socket(port: int, host: str = "0.0.0.0") -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDPConfig.SOCKET_RCVBUF)
+    sock.bind((host, port))
+    return sock
+
+class _SessionTransport:
+    """
+    Envio em sessão, fila de mensagens aguardando o handshake, abertura de pacotes e
+    entrega confiável (ack, retransmissão com RTO adaptativo e descarte de duplicatas).
+    """
+
+    def _init_sessions(self, port: int, ignore_local: bool, peer_port: Optional[int] = None):
+        self.port = port
+        self.peer_port = port if peer_port is None else peer_port  # Porta de destino dos pares
+        self.ignore_local = ignore_local
         self.running = True
-        self.msg_queue = queue.Queue()
+        self.dropped_messages = 0
+
+        # Segurança: sessões por par; mensagens aguardam o handshake por destino
+        self.security = SecurityManager(UDPConfig.AUTH_KEY, UDPConfig.REPLAY_WINDOW)
+        self.pending = {}          # destino -> deque[(mensagem, enfileirada_em)]
+        self.hello_sent_at = {}    # destino -> último HELLO enviado
+        self.flushed_at = {}       # (broadcast, par) -> enfileiramento da última mensagem já entregue
+        self.send_lock = threading.Lock()
 
-        # Segurança
-        self.security = SecurityManager(UDPConfig.AUTH_KEY, UDPConfig.TOKEN_TIMEOUT)
+        # Entrega confiável: retransmissões numa thread que dorme até o próximo prazo
+        self.reliable = ReliableSender(
+            self._send_wire, UDPConfig.RELIABLE_WINDOW, UDPConfig.RELIABLE_MAX_RETRIES,
+            UDPConfig.RELIABLE_INITIAL_RTO, UDPConfig.RELIABLE_MIN_RTO, UDPConfig.RELIABLE_MAX_RTO,
+            on_failure=self._on_delivery_failure)
+        self.duplicates = DuplicateFilter(UDPConfig.RELIABLE_DEDUP_SIZE)
+        self.on_delivery_failure: Optional[Callable[[str, str], None]] = None
+        self.retransmit_wakeup = threading.Event()
+        self.retransmit_thread = threading.Thread(target=self._retransmitter, name="udp-retransmit", daemon=True)
 
         # Descobre IPs locais
         self.local_ips = self._get_all_local_ips()
 
+    def _sendto(self, packet: bytes, addr):
+        raise NotImplementedError
+
+    def _handle_datagram(self, data: bytes, addr) -> Optional[str]:
+        """Mensagem de aplicação do datagrama, ou None (handshake, próprio PC ou inválido)"""
+        ip = addr[0]
+        # Ignora mensagens do próprio PC
+        if self.ignore_local and ip in self.local_ips:
+            return None
+
+        # Decodifica e valida (handshakes são respondidos aqui mesmo)
+        msg, reply, established = self.security.open(data, ip)
+        if reply:
+            self._sendto(reply, addr)
+        if established:
+            self._flush_pending(*established)
+        if msg is None and not reply and not established:
+            logger.warning(f"Mensagem inválida ou não autenticada de {ip}")
+        if msg and msg[0] == "@":
+            return self._receive_control(msg, addr)
+        return msg
+
+    def _receive_control(self, msg: str, addr) -> Optional[str]:
+        """Trata ack e mensagem confiável; devolve o conteúdo só na primeira entrega"""
+        ip = addr[0]
+        try:
+            if msg.startswith(ACK_PREFIX):
+                self.reliable.on_ack(int(msg[len(ACK_PREFIX):]), ip)
+                self.retransmit_wakeup.set()
+                return None
+            if msg.startswith(RELIABLE_PREFIX):
+                message_id, _, body = msg[len(RELIABLE_PREFIX):].partition(":")
+                message_id = int(message_id)
+                # Confirma sempre: o ack anterior pode ter se perdido
+                packet = self.security.seal(f"{ACK_PREFIX}{message_id}", ip)
+                if packet is not None:
+                    self._sendto(packet, addr)
+                return body if self.duplicates.is_new(message_id, ip) else None
+        except ValueError:
+            logger.warning(f"Mensagem de controle malformada de {ip}: {msg}")
+            return None
+        return msg
+
+    # ----------------- Envio -----------------
+    def send_message(self, message, ip=BROADCAST, reliable=False, deadline=None):
+        """
+        Envia na sessão com `ip`; sem sessão (ou em broadcast), enfileira e faz o handshake.
+        Com `reliable`, a mensagem é retransmitida até o ack do par (só unicast) ou até
+        `deadline` (time.monotonic()), quando houver.
+        """
+        if reliable and ip != BROADCAST:
+            self.reliable.send(message, ip, self.security.has_session(ip), deadline)
+            self.retransmit_wakeup.set()
+        else:
+            self._send_wire(message, ip)
+
+    def _send_wire(self, message, ip):
+        try:
+            packet = self.security.seal(message, ip)
+            if packet is not None:
+                self._sendto(packet, (ip, self.peer_port))
+                logger.debug(f"[UDP] Enviado para {ip}:{self.peer_port} -> {message}")
+                return
+
+            now = time.monotonic()
+            with self.send_lock:
+                self.pending.setdefault(ip, deque(maxlen=UDPConfig.PENDING_MESSAGES)).append((message, now))
+                if now - self.hello_sent_at.get(ip, -UDPConfig.HANDSHAKE_RETRY) < UDPConfig.HANDSHAKE_RETRY:
+                    return
+                self.hello_sent_at[ip] = now
+            self._sendto(self.security.hello(ip), (ip, self.peer_port))
+            logger.debug(f"[UDP] Handshake com {ip}, mensagem aguardando: {message}")
+        except Exception as e:
+            logger.error(f"Erro ao enviar UDP para {ip}: {e}")
+
+    def _flush_pending(self, target, peer):
+        """Envia ao par as mensagens que aguardavam o handshake iniciado para `target`"""
+        now = time.monotonic()
+        ttl = UDPConfig.HANDSHAKE_RETRY * 5
+        with self.send_lock:
+            queued = self.pending.get(target, ())
+            # Um par que responde a um HELLO em broadcast de novo não recebe o que já recebeu
+            last = self.flushed_at.get((target, peer), float("-inf"))
+            messages = [(message, queued_at) for message, queued_at in queued
+                        if now - queued_at <= ttl and queued_at > last]
+            if target == peer:
+                self.pending.pop(target, None)
+                self.hello_sent_at.pop(target, None)
+            else:
+                # Um broadcast pode ser respondido por vários pares: a fila fica até expirar
+                if messages:
+                    self.flushed_at[(target, peer)] = messages[-1][1]
+                for key in [key for key, queued_at in self.flushed_at.items() if now - queued_at > ttl]:
+                    del self.flushed_at[key]
+        logger.info(f"Sessão segura com {peer} estabelecida")
+        for message, _ in messages:
+            self._send_wire(message, peer)
+
+    # ----------------- Retransmissão -----------------
+    def _retransmitter(self):
+        while self.running:
+            deadline = self.reliable.next_deadline()
+            timeout = 1.0 if deadline is None else min(1.0, max(0.0, deadline - time.monotonic()))
+            if self.retransmit_wakeup.wait(timeout):
+                self.retransmit_wakeup.clear()
+            if self.running:
+                self.reliable.retransmit_due()
+
+    def _on_delivery_failure(self, message: str, ip: str):
+        logger.warning(f"Sem ack de {ip} após {UDPConfig.RELIABLE_MAX_RETRIES} retransmissões: {message}")
+        if self.on_delivery_failure is not None:
+            self.on_delivery_failure(message, ip)
+
+    def get_stats(self):
+        stats = self.reliable.get_stats()
+        stats["duplicates"] = self.duplicates.duplicates
+        stats["dropped"] = self.dropped_messages
+        return stats
+
+    # ----------------- Utilitários -----------------
+    def _get_all_local_ips(self):
+        ips = ["127.0.0.1"]
+        try:
+            hostname = socket.gethostname()
+            ips.append(socket.gethostbyname(hostname))
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(("8.8.8.8", 80))
+            ips.append(s.getsockname()[0])
+            s.close()
+        except Exception:
+            pass
+        return ips
+
+class UDPCommunicator(_SessionTransport):
+    """Listener numa thread com socket bloqueante; mensagens vão para `msg_queue`"""
+
+    def __init__(self, port: int = UDPConfig.UDP_PORT, ignore_local: bool = True,
+                 peer_port: Optional[int] = None, host: str = "0.0.0.0"):
+        self._init_sessions(port, ignore_local, peer_port)
+        self.sock = _open_socket(port, host)
+        self.sock.settimeout(UDPConfig.UDP_SOCKET_TIMEOUT)
+        self.msg_queue = queue.Queue(maxsize=UDPConfig.MSG_QUEUE_SIZE)
+
         # Thread listener
         self.listener_thread = threading.Thread(target=self._listener, daemon=True)
 
     def start(self):
         self.listener_thread.start()
+        self.retransmit_thread.start()
         logger.info(f"UDP Communicator iniciado na porta {self.port}")
 
     def stop(self):
         self.running = False
+        self.retransmit_wakeup.set()
         try:
             self.sock.close()
         except Exception:
             pass
         logger.info("UDPCommunicator parado")
 
+    def _sendto(self, packet: bytes, addr):
+        self.sock.sendto(packet, addr)
+
     # ----------------- Listener -----------------
     def _listener(self):
         logger.info(f"UDP Listener ativo na porta {self.port}")
         while self.running:
             try:
-                data, addr = self.sock.recvfrom(1024)
-                ip = addr[0]
-                raw_msg = data.decode().strip()
-
-                # Ignora mensagens do próprio PC
-                if ip in self.local_ips:
-                    continue
-
-                # Decodifica e valida
-                msg = self.security.decrypt_message(raw_msg)
+                data, addr = self.sock.recvfrom(UDPConfig.UDP_BUFFER_SIZE)
+                received_at = time.monotonic()
+                msg = self._handle_datagram(data, addr)
                 if not msg:
-                    logger.warning(f"Mensagem inválida ou não autenticada de {ip}")
                     continue
 
-                self.msg_queue.put((msg, addr))
+                try:
+                    self.msg_queue.put_nowait((msg, addr, received_at))
+                except queue.Full:
+                    self.dropped_messages += 1
+                    logger.warning(f"Fila de mensagens cheia, descartando mensagem de {addr[0]}")
 
             except socket.timeout:
                 continue
             except Exception as e:
-                logger.error(f"Erro no listener: {e}")
+                if self.running:
+                    logger.error(f"Erro no listener: {e}")
 
-    # ----------------- Envio -----------------
-    def send_message(self, message, ip="255.255.255.255"):
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner: "AsyncUDPCommunicator"):
+        self.owner = owner
+
+    def datagram_received(self, data: bytes, addr):
+        self.owner._on_datagram(data, addr, time.monotonic())
+
+    def error_received(self, exc: Exception):
+        logger.warning(f"Erro no socket UDP: {exc}")
+
+class AsyncUDPCommunicator(_SessionTransport):
+    """
+    Transporte asyncio (DatagramProtocol) num event loop próprio. Cada mensagem vira uma
+    task do `handler(msg, addr, received_at)` se ele for uma corrotina; uma função comum
+    (que não deve bloquear) é agendada com call_soon, sem o custo de criar a task. Sem
+    handler, a mensagem vai para a fila lida por `receive()`. A decifragem pode ir para
+    um executor.
+    `send_message` pode ser chamado de qualquer thread; `send` é a versão assíncrona.
+    """
+
+    def __init__(self, port: int = UDPConfig.UDP_PORT, ignore_local: bool = True,
+                 decrypt_in_executor: bool = UDPConfig.DECRYPT_IN_EXECUTOR, peer_port: Optional[int] = None,
+                 host: str = "0.0.0.0"):
+        self._init_sessions(port, ignore_local, peer_port)
+        self.host = host
+        self.handler: Optional[Callable[..., Any]] = None
+        self.executor = (ThreadPoolExecutor(max_workers=UDPConfig.DECRYPT_WORKERS, thread_name_prefix="udp-decrypt")
+                         if decrypt_in_executor else None)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="udp-loop", daemon=True)
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.msg_queue: Optional[asyncio.Queue] = None
+        self.tasks = set()
+
+    def set_handler(self, handler: Callable[..., Any]):
+        self.handler = handler
+
+    def start(self, timeout: float = 5.0):
+        self.loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_endpoint(), self.loop).result(timeout)
+        self.retransmit_thread.start()
+        logger.info(f"UDP Communicator (asyncio) iniciado na porta {self.port}")
+
+    async def _open_endpoint(self):
+        self.msg_queue = asyncio.Queue(maxsize=UDPConfig.MSG_QUEUE_SIZE)
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), sock=_open_socket(self.port, self.host))
+
+    def stop(self):
+        self.running = False
+        self.retransmit_wakeup.set()
+        if self.loop.is_running():
+            if self.transport is not None:
+                self.loop.call_soon_threadsafe(self.transport.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join(timeout=2.0)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        logger.info("UDPCommunicator parado")
+
+    def _sendto(self, packet: bytes, addr):
+        if self.transport is None:
+            raise RuntimeError("transporte UDP não iniciado")
+        if threading.current_thread() is self.loop_thread:
+            self.transport.sendto(packet, addr)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.sendto, packet, addr)
+
+    # ----------------- Recepção -----------------
+    def _on_datagram(self, data: bytes, addr, received_at: float):
+        if self.executor is None:
+            self._deliver(self._handle_datagram(data, addr), addr, received_at)
+        else:
+            self._spawn(self._decrypt_and_deliver(data, addr, received_at))
+
+    async def _decrypt_and_deliver(self, data: bytes, addr, received_at: float):
+        msg = await self.loop.run_in_executor(self.executor, self._handle_datagram, data, addr)
+        self._deliver(msg, addr, received_at)
+
+    def _deliver(self, msg: Optional[str], addr, received_at: float):
+        if not msg:
+            return
+        if self.handler is not None:
+            if asyncio.iscoroutinefunction(self.handler):
+                self._spawn(self._run_handler(msg, addr, received_at))
+            else:
+                self.loop.call_soon(self._call_handler, msg, addr, received_at)
+            return
+        try:
+            self.msg_queue.put_nowait((msg, addr, received_at))
+        except asyncio.QueueFull:
+            self.dropped_messages += 1
+            logger.warning(f"Fila de mensagens cheia, descartando mensagem de {addr[0]}")
+
+    def _spawn(self, coroutine):
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)  # Referência forte até terminar
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run_handler(self, msg: str, addr, received_at: float):
         try:
-            encrypted_msg = self.security.encrypt_message(message)
-            self.sock.sendto(encrypted_msg.encode(), (ip, self.port))
-            logger.debug(f"[UDP] Enviado para {ip}:{self.port} -> {message}")
+            await self.handler(msg, addr, received_at)
         except Exception as e:
-            logger.error(f"Erro ao enviar UDP para {ip}: {e}")
+            logger.error(f"Erro no handler de mensagem de {addr[0]}: {e}")
 
-    # ----------------- Utilitários -----------------
-    def _get_all_local_ips(self):
-        ips = ["127.0.0.1"]
+    def _call_handler(self, msg: str, addr, received_at: float):
         try:
-            hostname = socket.gethostname()
-            ips.append(socket.gethostbyname(hostname))
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ips.append(s.getsockname()[0])
-            s.close()
-        except Exception:
-            pass
-        return ips
+            self.handler(msg, addr, received_at)
+        except Exception as e:
+            logger.error(f"Erro no handler de mensagem de {addr[0]}: {e}")
+
+    # ----------------- API assíncrona -----------------
+    async def receive(self):
+        """Próxima (mensagem, endereço, recebida_em) quando não há handler"""
+        return await self.msg_queue.get()
+
+    async def send(self, message: str, ip: str = BROADCAST, reliable: bool = False,
+                   deadline: Optional[float] = None):
+        self.send_message(message, ip, reliable, deadline)
+
+def create_communicator(transport: str = UDPConfig.TRANSPORT):
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Transporte UDP desconhecido: {transport} (use um de {TRANSPORTS})")
+    return AsyncUDPCommunicator() if transport == "asyncio" else UDPCommunicator()
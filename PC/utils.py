@@ -1,4 +1,6 @@
 from datetime import datetime
+from collections import deque
+import threading
 import sys
 import os
 
@@ -85,4 +87,47 @@ def log_debug(message, name="System"):
     get_logger(name).debug(message)
 
 def log_camera(message, name="System"):
-    get_logger(name).camera(message)
\ No newline at end of file
+    get_logger(name).camera(message)
+
+# --- Estatísticas ---
+class RollingStats:
+    """Janela deslizante de amostras numéricas (latências, tempos de espera)"""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.samples.append(float(value))
+            self.count += 1
+
+    def percentile(self, p):
+        """Percentil (0-100) das amostras da janela"""
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        """Resumo da janela: contagem total, média, p50, p95, p99 e máximo"""
+        with self.lock:
+            ordered = sorted(self.samples)
+            count = self.count
+        if not ordered:
+            return {"count": count, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def pick(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+        return {
+            "count": count,
+            "mean": sum(ordered) / len(ordered),
+            "p50": pick(50),
+            "p95": pick(95),
+            "p99": pick(99),
+            "max": ordered[-1],
+        }